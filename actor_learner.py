@@ -0,0 +1,335 @@
+import logging
+import queue
+import random
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+import torch.optim as optim
+import constants
+from torch.distributions import Categorical
+from game_data import *
+from battle_env import *
+from learning_agent import *
+from scenarios import *
+from metrics import *
+
+"""
+Ring of fixed size trajectory chunks living in shared memory.
+Actors fill a free slot and hand its index to the learner, so only small integers ever go through the queues.
+A chunk may span several episodes, dones marks the last step of each episode.
+"""
+class TrajectoryRing:
+    def __init__(self, ctx, num_slots, chunk_length, input_size):
+        self.num_slots = num_slots
+        self.chunk_length = chunk_length
+        self.observations = torch.zeros(num_slots, chunk_length, input_size).share_memory_()
+        self.actions = torch.zeros(num_slots, chunk_length, dtype=torch.int64).share_memory_()
+        self.behaviour_log_probs = torch.zeros(num_slots, chunk_length).share_memory_()
+        self.rewards = torch.zeros(num_slots, chunk_length).share_memory_()
+        self.dones = torch.zeros(num_slots, chunk_length, dtype=torch.bool).share_memory_()
+        # Observation following the last step of the chunk, used to bootstrap its value
+        self.bootstrap_observations = torch.zeros(num_slots, input_size).share_memory_()
+        # Version of the shared weights the actor last synced before filling the chunk
+        self.policy_versions = torch.zeros(num_slots, dtype=torch.int64).share_memory_()
+        self.free_queue = ctx.SimpleQueue()
+        # Full chunks are waited on with a timeout so the learner notices actors which died
+        self.full_queue = ctx.Queue()
+        for i in range(num_slots):
+            self.free_queue.put(i)
+
+"""
+Policy weights in shared memory which the learner refreshes in place.
+The version is odd while weights are being written so readers can retry torn copies without locking.
+"""
+class SharedPolicy:
+    def __init__(self, ctx, model):
+        self.model = model
+        self.model.share_memory()
+        self.version = ctx.Value('q', 0, lock=False)
+
+    def publish(self, source_model):
+        self.version.value += 1
+        with torch.no_grad():
+            for shared_param, param in zip(self.model.parameters(), source_model.parameters()):
+                shared_param.copy_(param)
+        self.version.value += 1
+
+    # Copy the shared weights into the model. Returns the version copied
+    def sync(self, target_model):
+        while True:
+            version = self.version.value
+            if version % 2 == 1:
+                # The learner is writing, give it the CPU rather than spinning
+                time.sleep(constants.SHARED_POLICY_RETRY_SECONDS)
+                continue
+            with torch.no_grad():
+                for param, shared_param in zip(target_model.parameters(), self.model.parameters()):
+                    param.copy_(shared_param)
+            if self.version.value == version:
+                return version
+
+"""
+Learning Agent running inside an actor process.
+Instead of training, it writes its steps into chunks of the shared trajectory ring.
+"""
+class ActorAgent(LearningAgent):
+    def __init__(self, logger, game_data, battle_env, team, shared_policy, ring):
+        Player.__init__(self, logger, game_data, battle_env, team)
+        self.learner = None
+        self.trajectory = None
+        self.model = Policy(battle_env.observation_space, battle_env.action_space)
+        # Actions are sampled purely from the policy so the behaviour probabilities are exact
+        self.epsilon = 0
+        self.rho = 0
+        self.should_print_probabilities = False
+        self.shared_policy = shared_policy
+        self.ring = ring
+        self.policy_version = self.shared_policy.sync(self.model)
+        self.slot = -1
+        self.position = 0
+        self.is_reward_pending = False
+        self.is_stopped = False
+
+    def acquire_chunk(self):
+        slot = self.ring.free_queue.get()
+        if slot < 0:
+            # The learner is shutting down
+            self.is_stopped = True
+            return
+        self.slot = slot
+        self.position = 0
+        # Pick up the learner's latest weights once per chunk
+        self.policy_version = self.shared_policy.sync(self.model)
+
+    def submit_chunk(self):
+        self.ring.policy_versions[self.slot] = self.policy_version
+        self.ring.full_queue.put(self.slot)
+        self.slot = -1
+        self.position = 0
+
+    def has_pending_reward(self):
+        return self.is_reward_pending
+
+    def record_step(self, observation, action_index, probs):
+        if self.slot >= 0 and self.position >= self.ring.chunk_length:
+            self.ring.bootstrap_observations[self.slot] = observation
+            self.submit_chunk()
+        if self.slot < 0 and not self.is_stopped:
+            self.acquire_chunk()
+        if self.is_stopped:
+            return
+        self.ring.observations[self.slot, self.position] = observation
+        self.ring.actions[self.slot, self.position] = action_index
+        self.ring.behaviour_log_probs[self.slot, self.position] = torch.log(probs[action_index].clamp(min=1e-8))
+        self.is_reward_pending = True
+
+    def record_reward(self, reward, is_done):
+        self.is_reward_pending = False
+        if self.is_stopped:
+            return
+        self.ring.rewards[self.slot, self.position] = reward
+        self.ring.dones[self.slot, self.position] = is_done
+        self.position += 1
+        # Nothing to bootstrap from if the chunk ends with the episode
+        if is_done and self.position >= self.ring.chunk_length:
+            self.submit_chunk()
+
+    def on_finish_episode(self):
+        # Before finishing. Evaluate how much reward we earned from our last action.
+        if self.has_pending_reward():
+            reward = self.calculate_reward()
+            self.total_reward += reward
+            self.record_reward(reward, True)
+
+# Entry point of an actor process. Plays battles continuously until the learner stops
+# Metrics of the actor are sent to the learner as (actor index, snapshot) every few episodes
+def run_actor(actor_index, scenario, data_filename, seed, shared_policy, ring, stop_event, episode_counter, metrics_queue):
+    torch.set_num_threads(1)
+    rng = random.Random(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    logger = logging.getLogger('actor{0}'.format(actor_index))
+    logger.setLevel(logging.WARNING)
+    game_data = GameData(data_filename)
+    battle = SCENARIOS[scenario](logger, game_data, rng)
+    battle_env = BattleEnv(logger, battle, game_data)
+
+    players = {}
+    players[Team.BLUE] = ActorAgent(logger, game_data, battle_env, Team.BLUE, shared_policy, ring)
+    players[Team.RED] = NonPlayer(logger, game_data, battle_env, Team.RED, rng)
+
+    num_episodes = 0
+    while not stop_event.is_set() and not players[Team.BLUE].is_stopped:
+        turns, winning_team = run_episode(battle_env, players)
+        record_episode(metrics_registry, turns, sum([players[team].total_steps for team in players]),
+                       battle_env.battle.invalid_actions, players[Team.BLUE].total_reward)
+        battle_env.reset()
+        for team in players:
+            players[team].reset_episode()
+        with episode_counter.get_lock():
+            episode_counter.value += 1
+        num_episodes += 1
+        if num_episodes % constants.METRICS_WORKER_EPISODES == 0:
+            metrics_queue.put((actor_index, metrics_registry.get_snapshot()))
+    metrics_queue.put((actor_index, metrics_registry.get_snapshot()))
+
+# V-trace targets and policy gradient advantages (Espeholt et al. 2018, IMPALA).
+# All inputs are shaped (batch, time) except bootstrap_values which is (batch,)
+# Corrects for actors sampling from weights which lag behind the learner.
+def compute_vtrace(behaviour_log_probs, target_log_probs, discounts, rewards, values, bootstrap_values,
+                   rho_bar=constants.VTRACE_RHO_BAR, c_bar=constants.VTRACE_C_BAR):
+    rhos = torch.exp(target_log_probs - behaviour_log_probs)
+    clipped_rhos = torch.clamp(rhos, max=rho_bar)
+    cs = torch.clamp(rhos, max=c_bar)
+
+    values_t_plus_1 = torch.cat([values[:, 1:], bootstrap_values.unsqueeze(1)], dim=1)
+    deltas = clipped_rhos * (rewards + discounts * values_t_plus_1 - values)
+
+    acc = torch.zeros_like(bootstrap_values)
+    vs_minus_v = [None] * values.shape[1]
+    for t in range(values.shape[1] - 1, -1, -1):
+        acc = deltas[:, t] + discounts[:, t] * cs[:, t] * acc
+        vs_minus_v[t] = acc
+    vs = torch.stack(vs_minus_v, dim=1) + values
+
+    vs_t_plus_1 = torch.cat([vs[:, 1:], bootstrap_values.unsqueeze(1)], dim=1)
+    pg_advantages = clipped_rhos * (rewards + discounts * vs_t_plus_1 - values)
+    return vs, pg_advantages
+
+"""
+Continuously running actor-learner training for the Learning Agent.
+Actor processes step their own BattleEnv with a shared copy of the Policy weights and stream
+trajectory chunks through the shared ring. The learner trains on batches of chunks as soon as
+they arrive and refreshes the shared weights in place, so no one waits for episodes to finish.
+"""
+class ActorLearner:
+    def __init__(self, scenario, data_filename, num_actors, seed,
+                 gamma=constants.DEFAULT_GAMMA,
+                 learning_rate=constants.DEFAULT_LEARNING_RATE,
+                 chunk_length=constants.ACTOR_CHUNK_LENGTH,
+                 batch_size=constants.ACTOR_BATCH_SIZE):
+        self.ctx = mp.get_context('spawn')
+        self.scenario = scenario
+        self.data_filename = data_filename
+        self.num_actors = num_actors
+        self.seed = seed
+        self.gamma = gamma
+        self.batch_size = batch_size
+
+        # Build the environment once to know the observation and action spaces
+        logger = logging.getLogger('learner')
+        game_data = GameData(data_filename)
+        battle_env = BattleEnv(logger, SCENARIOS[scenario](logger, game_data, random.Random(seed)), game_data)
+        self.model = Policy(battle_env.observation_space, battle_env.action_space)
+        self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
+        self.shared_policy = SharedPolicy(self.ctx, Policy(battle_env.observation_space, battle_env.action_space))
+        self.shared_policy.publish(self.model)
+
+        # Enough slots for every actor to fill one chunk while a batch is being trained on
+        num_slots = 2 * num_actors + batch_size
+        self.ring = TrajectoryRing(self.ctx, num_slots, chunk_length, self.model.input_size)
+        self.stop_event = self.ctx.Event()
+        self.episode_counter = self.ctx.Value('q', 0)
+        self.metrics_queue = self.ctx.SimpleQueue()
+        self.actors = []
+        self.num_updates = 0
+        self.policy_lag = 0.0
+
+    def start(self):
+        for i in range(self.num_actors):
+            actor = self.ctx.Process(
+                target=run_actor,
+                args=(i, self.scenario, self.data_filename, self.seed + i + 1,
+                      self.shared_policy, self.ring, self.stop_event, self.episode_counter, self.metrics_queue),
+                daemon=True)
+            actor.start()
+            self.actors.append(actor)
+
+    def stop(self):
+        self.stop_event.set()
+        # Wake up actors waiting for a free chunk
+        for i in range(self.num_actors):
+            self.ring.free_queue.put(-1)
+        for actor in self.actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
+        self.actors = []
+        self.collect_worker_metrics()
+
+    # Add the latest metrics the actors sent to the registry of this process
+    def collect_worker_metrics(self):
+        while not self.metrics_queue.empty():
+            actor_index, snapshot = self.metrics_queue.get()
+            metrics_registry.set_worker_snapshot(actor_index, snapshot)
+
+    def get_num_episodes(self):
+        return self.episode_counter.value
+
+    # Raises RuntimeError if an actor stopped, since the slot it held is lost and the ring may never fill a batch again
+    def check_actors(self):
+        for actor_index, actor in enumerate(self.actors):
+            if not actor.is_alive():
+                raise RuntimeError('Actor {0} stopped with exit code {1}'.format(actor_index, actor.exitcode))
+
+    # Take the next batch of full chunks out of the ring and release their slots
+    def next_batch(self):
+        slots = []
+        while len(slots) < self.batch_size:
+            try:
+                slots.append(self.ring.full_queue.get(timeout=constants.ACTOR_QUEUE_TIMEOUT))
+            except queue.Empty:
+                self.check_actors()
+        index = torch.tensor(slots)
+        batch = {}
+        batch['observations'] = self.ring.observations[index]
+        batch['actions'] = self.ring.actions[index]
+        batch['behaviour_log_probs'] = self.ring.behaviour_log_probs[index]
+        batch['rewards'] = self.ring.rewards[index]
+        batch['dones'] = self.ring.dones[index]
+        batch['bootstrap_observations'] = self.ring.bootstrap_observations[index]
+        batch['policy_versions'] = self.ring.policy_versions[index]
+        for slot in slots:
+            self.ring.free_queue.put(slot)
+        return batch
+
+    def update(self, batch):
+        start = time.perf_counter()
+        num_chunks, chunk_length, input_size = batch['observations'].shape
+        probs, values = self.model.forward_tensor(batch['observations'].view(-1, input_size))
+        values = values.view(num_chunks, chunk_length)
+        distribution = Categorical(probs)
+        target_log_probs = distribution.log_prob(batch['actions'].view(-1)).view(num_chunks, chunk_length)
+        with torch.no_grad():
+            _, bootstrap_values = self.model.forward_tensor(batch['bootstrap_observations'])
+            bootstrap_values = bootstrap_values.squeeze(-1)
+
+        rewards = batch['rewards'] * constants.ACTOR_LEARNER_REWARD_SCALE
+        discounts = self.gamma * (~batch['dones']).float()
+        vs, pg_advantages = compute_vtrace(
+            batch['behaviour_log_probs'], target_log_probs.detach(), discounts, rewards,
+            values.detach(), bootstrap_values)
+
+        # actor (policy) loss
+        policy_loss = -(target_log_probs * pg_advantages).mean()
+        # critic (value) loss using L1 smooth loss
+        value_loss = F.smooth_l1_loss(values, vs)
+
+        self.optimizer.zero_grad()
+        loss = policy_loss + value_loss
+        loss.backward()
+        self.optimizer.step()
+
+        self.shared_policy.publish(self.model)
+        self.num_updates += 1
+        # Versions go up by 2 for every publish
+        self.policy_lag = (self.shared_policy.version.value - batch['policy_versions'].float().mean().item()) / 2
+        record_update(metrics_registry, time.perf_counter() - start, distribution.entropy().mean().item())
+        return loss.item()
+
+    def train(self, num_updates):
+        for i in range(num_updates):
+            self.update(self.next_batch())
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import math
+import socket
+import sys
+import concurrent.futures
+import multiprocessing
+from collections import OrderedDict
+import constants
+from game_data import *
+from data_watcher import *
+from scenarios import *
+from simulation import *
+from result_cache import *
+
+# Identity of the players of every balance query in the result cache, NonPlayers on both sides
+SERVICE_POLICY = 'scripted'
+
+# Each worker process keeps one Game Data handle and a Simulator per matchup between tasks
+worker_game_data_handle = None
+worker_data_watcher = None
+worker_simulators = {}
+
+def init_service_worker(data_filename, watch):
+    global worker_game_data_handle
+    global worker_data_watcher
+    worker_game_data_handle = GameDataHandle(GameData(data_filename))
+    if watch:
+        worker_data_watcher = DataWatcher(worker_game_data_handle)
+        worker_data_watcher.start()
+
+# Simulate episodes start_i to end_i (exclusive) of a matchup and return their aggregate
+def run_matchup_chunk(matchup_key, matchup, start_i, end_i, seed):
+    # Catch up with the data file right away rather than on the next poll, so chunks rarely run a stale ruleset
+    if worker_data_watcher is not None:
+        worker_data_watcher.check()
+    simulator = worker_simulators.get(matchup_key)
+    if simulator is None:
+        if len(worker_simulators) >= constants.SERVICE_CACHE_SIZE:
+            worker_simulators.clear()
+        simulator = Simulator(matchup, worker_game_data_handle.get().filename, game_data_handle=worker_game_data_handle)
+        worker_simulators[matchup_key] = simulator
+
+    wins = {}
+    total_turns = 0
+    turn_squares = 0
+    classes_hashes = set()
+    for i in range(start_i, end_i):
+        result = simulator.run_episode(i, seed + i)
+        wins[result['winner']] = wins.get(result['winner'], 0) + 1
+        total_turns += result['turns']
+        turn_squares += result['turns'] * result['turns']
+        classes_hashes.add(simulator.classes_hash)
+    chunk = {}
+    chunk['episodes'] = end_i - start_i
+    chunk['wins'] = wins
+    chunk['total_turns'] = total_turns
+    chunk['turn_squares'] = turn_squares
+    chunk['classes_hashes'] = sorted(classes_hashes)
+    return chunk
+
+# Rate of wins of the team over the episodes with the half width of its confidence interval (normal approximation)
+def get_win_rate(wins, team_name, num_episodes, z=constants.WIN_RATE_CONFIDENCE_Z):
+    if num_episodes <= 0:
+        return 0.0, 1.0
+    win_rate = wins.get(team_name, 0) / num_episodes
+    margin = z * math.sqrt(win_rate * (1.0 - win_rate) / num_episodes)
+    return win_rate, margin
+
+# Integer value of a request field, or the default if the field is missing. Raises ValueError for other types
+def get_int_field(request, name, default):
+    value = request.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('{0} must be an integer'.format(name.capitalize()))
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('{0} must be an integer'.format(name.capitalize()))
+
+"""
+Simulation of a matchup which every identical request subscribes to.
+Results of chunks are merged as they arrive and each merge is published to the subscribers.
+"""
+class BalanceQuery:
+    def __init__(self, key, matchup, episodes, seed, classes_hash, ruleset_hash):
+        self.key = key
+        self.matchup = matchup
+        self.matchup_key = key[1]
+        self.episodes = episodes
+        self.seed = seed
+        self.classes_hash = classes_hash
+        self.ruleset_hash = ruleset_hash
+        self.num_episodes = 0
+        self.wins = {}
+        self.total_turns = 0
+        self.turn_squares = 0
+        # False if any chunk was simulated with a ruleset which changed the matchup, i.e. after a reload
+        self.is_consistent = True
+        self.subscribers = []
+        self.last_message = None
+        self.task = None
+
+    def merge(self, chunk):
+        self.num_episodes += chunk['episodes']
+        for winner in chunk['wins']:
+            self.wins[winner] = self.wins.get(winner, 0) + chunk['wins'][winner]
+        self.total_turns += chunk['total_turns']
+        self.turn_squares += chunk.get('turn_squares', 0)
+        # Aggregates from the result cache have no hashes, they were keyed by the classes hash
+        if chunk.get('classes_hashes', [self.classes_hash]) != [self.classes_hash]:
+            self.is_consistent = False
+
+    def get_aggregate(self):
+        aggregate = {}
+        aggregate['episodes'] = self.num_episodes
+        aggregate['wins'] = dict(self.wins)
+        aggregate['total_turns'] = self.total_turns
+        aggregate['turn_squares'] = self.turn_squares
+        return aggregate
+
+    def get_summary(self, message_type):
+        win_rate, margin = get_win_rate(self.wins, Team.BLUE.name, self.num_episodes)
+        summary = {}
+        summary['type'] = message_type
+        summary['matchup'] = self.matchup
+        summary['seed'] = self.seed
+        summary['ruleset'] = self.ruleset_hash
+        summary['episodes'] = self.num_episodes
+        summary['requested_episodes'] = self.episodes
+        summary['wins'] = dict(self.wins)
+        summary['blue_win_rate'] = win_rate
+        summary['blue_win_rate_margin'] = margin
+        summary['mean_turns'] = self.total_turns / self.num_episodes if self.num_episodes > 0 else 0
+        return summary
+
+    # Subscribers get the latest message right away so late requests start from the current estimate
+    def subscribe(self):
+        queue = asyncio.Queue()
+        if self.last_message is not None:
+            queue.put_nowait(self.last_message)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    def publish(self, message):
+        self.last_message = message
+        for queue in self.subscribers:
+            queue.put_nowait(message)
+
+"""
+Local service answering balance questions, i.e. the win rate of a matchup, over line-delimited JSON on TCP.
+A request is {"id": 1, "matchup": {"blue": [...], "red": [...]}, "episodes": 1000, "seed": 0}, see normalize_matchup.
+The service streams {"type": "partial", ...} estimates as chunks of episodes finish in the worker pool, then one
+{"type": "result", ...} or {"type": "error", "message": ...}. Every response repeats the id of its request.
+Identical requests in flight share one simulation and completed results are cached by the hash of every row
+the matchup's Classes depend on, so editing unrelated rows of a watched data file keeps them.
+With a result cache, results also survive restarts. A request is answered from the result cache when it holds
+at least as many episodes of the seed, with every cached episode and a note if there are more than requested.
+Otherwise only the missing episodes are simulated and merged into it. The result cache is read and written in threads
+so disk access never holds up other clients.
+"""
+class BalanceService:
+    def __init__(self, data_filename, num_workers=1, watch=False, host=constants.SERVICE_HOST, port=constants.SERVICE_PORT,
+                 chunk_episodes=constants.SERVICE_CHUNK_EPISODES, cache_size=constants.SERVICE_CACHE_SIZE, result_cache=None):
+        self.data_filename = data_filename
+        self.num_workers = num_workers
+        self.watch = watch
+        self.host = host
+        self.port = port
+        self.chunk_episodes = chunk_episodes
+        self.cache_size = cache_size
+        self.game_data_handle = GameDataHandle(GameData(data_filename))
+        self.data_watcher = DataWatcher(self.game_data_handle) if watch else None
+        self.pool = None
+        self.server = None
+        self.in_flight = {}
+        self.cache = OrderedDict()
+        self.result_cache = result_cache
+        # Tasks serving the connected clients
+        self.client_tasks = set()
+
+    async def start(self):
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.num_workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_service_worker, initargs=(self.data_filename, self.watch))
+        if self.data_watcher is not None:
+            self.data_watcher.start()
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        # Port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for task in list(self.client_tasks):
+            task.cancel()
+        if len(self.client_tasks) > 0:
+            await asyncio.gather(*self.client_tasks, return_exceptions=True)
+        if self.data_watcher is not None:
+            self.data_watcher.stop()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        if self.result_cache is not None:
+            self.result_cache.close()
+
+    async def serve_forever(self):
+        await self.start()
+        print('Balance service listening on {0}:{1}'.format(self.host, self.port), file=sys.stderr, flush=True)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle_client(self, reader, writer):
+        client_task = asyncio.current_task()
+        self.client_tasks.add(client_task)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    await self.send(writer, write_lock, {'type': 'error', 'message': 'Invalid JSON'})
+                    continue
+                task = asyncio.create_task(self.handle_request(request, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if len(tasks) > 0:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.CancelledError):
+            # The client went away or the service is stopping
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            self.client_tasks.discard(client_task)
+
+    async def send(self, writer, write_lock, message):
+        async with write_lock:
+            writer.write((json.dumps(message) + '\n').encode('utf-8'))
+            await writer.drain()
+
+    async def handle_request(self, request, writer, write_lock):
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            async for message in self.query(request):
+                response = {'id': request_id}
+                response.update(message)
+                await self.send(writer, write_lock, response)
+        except (TypeError, ValueError) as ex:
+            await self.send(writer, write_lock, {'id': request_id, 'type': 'error', 'message': str(ex)})
+
+    # Yields the messages answering a request. Raises ValueError for invalid requests
+    async def query(self, request):
+        if not isinstance(request, dict):
+            raise ValueError('Request must be an object')
+        game_data = self.game_data_handle.get()
+        matchup = normalize_matchup(request.get('matchup'), game_data)
+        episodes = get_int_field(request, 'episodes', constants.SERVICE_DEFAULT_EPISODES)
+        if episodes <= 0 or episodes > constants.SERVICE_MAX_EPISODES:
+            raise ValueError('Episodes must be between 1 and {0}'.format(constants.SERVICE_MAX_EPISODES))
+        seed = get_int_field(request, 'seed', 0)
+        classes_hash = game_data.get_classes_hash(get_matchup_class_ids(matchup))
+        key = (classes_hash, json.dumps(matchup, sort_keys=True), episodes, seed)
+
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            cached_result = dict(result)
+            cached_result['cached'] = True
+            yield cached_result
+            return
+
+        query = self.in_flight.get(key)
+        if query is None:
+            query = BalanceQuery(key, matchup, episodes, seed, classes_hash, game_data.ruleset_hash)
+            if self.result_cache is not None:
+                # Reading the disk doesn't hold up other clients
+                aggregate = await asyncio.to_thread(self.result_cache.get, get_result_cache_key(classes_hash, matchup, SERVICE_POLICY, seed))
+                if aggregate is not None:
+                    query.merge(aggregate)
+                if query.num_episodes >= episodes:
+                    result = query.get_summary('result')
+                    result['cached'] = True
+                    if query.num_episodes > episodes:
+                        result['note'] = 'Estimate uses all {0} cached episodes, more than the {1} requested'.format(query.num_episodes, episodes)
+                    yield result
+                    return
+            # An identical request may have started simulating while the result cache was read
+            if key in self.in_flight:
+                query = self.in_flight[key]
+            else:
+                self.in_flight[key] = query
+                query.task = asyncio.create_task(self.run_query(query))
+        queue = query.subscribe()
+        try:
+            while True:
+                message = await queue.get()
+                yield message
+                if message['type'] != 'partial':
+                    return
+        finally:
+            query.unsubscribe(queue)
+
+    async def run_query(self, query):
+        loop = asyncio.get_running_loop()
+        futures = []
+        # Episodes merged from the result cache are not simulated again
+        cached_episodes = query.num_episodes
+        for start_i in range(cached_episodes, query.episodes, self.chunk_episodes):
+            end_i = min(start_i + self.chunk_episodes, query.episodes)
+            futures.append(loop.run_in_executor(self.pool, run_matchup_chunk, query.matchup_key, query.matchup, start_i, end_i, query.seed))
+        try:
+            for future in asyncio.as_completed(futures):
+                query.merge(await future)
+                if query.num_episodes < query.episodes:
+                    query.publish(query.get_summary('partial'))
+            result = query.get_summary('result')
+            if query.is_consistent:
+                self.cache[query.key] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            else:
+                result['warning'] = 'Ruleset changed while simulating, result not cached'
+        except Exception as ex:
+            for future in futures:
+                future.cancel()
+            result = {'type': 'error', 'message': 'Simulation failed: {0}'.format(ex)}
+        del self.in_flight[query.key]
+        query.publish(result)
+
+        # Subscribers already have the result, the result cache is written off the event loop
+        if self.result_cache is not None and result['type'] == 'result' and query.is_consistent:
+            try:
+                await asyncio.to_thread(self.result_cache.put, get_result_cache_key(query.classes_hash, query.matchup, SERVICE_POLICY, query.seed),
+                                        query.get_aggregate(), {'matchup': query.matchup, 'seed': query.seed, 'ruleset': query.ruleset_hash})
+            except OSError as ex:
+                print('Unable to write the result cache: {0}'.format(ex), file=sys.stderr)
+
+def run_balance_service(data_filename, num_workers=1, watch=False, host=constants.SERVICE_HOST, port=constants.SERVICE_PORT,
+                        cache_directory=None, cache_budget=constants.RESULT_CACHE_BUDGET):
+    result_cache = ResultCache(cache_directory, cache_budget) if cache_directory is not None else None
+    service = BalanceService(data_filename, num_workers, watch, host, port, result_cache=result_cache)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+# Send one request to a balance service and yield every message answering it until the final one
+def request_balance(request, host=constants.SERVICE_HOST, port=constants.SERVICE_PORT):
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        with connection.makefile('r', encoding='utf-8') as lines:
+            for line in lines:
+                message = json.loads(line)
+                yield message
+                if message.get('type') != 'partial':
+                    return
@@ -1,8 +1,9 @@
 import warnings
+import bisect
 import copy
+import logging
 import constants
 from enum import Enum
-from operator import attrgetter
 from targetable import *
 from battle_action import *
 
@@ -13,6 +14,27 @@ class BattleState(Enum):
     END_PHASE = 3
     BATTLE_FINISHED = 4
 
+"""
+How a battle finished. Besides a side being defeated or the limits being reached, battles which can no longer
+progress are cut short with their own outcome so no steps are spent playing them out
+"""
+class BattleOutcome(Enum):
+    NOT_FINISHED = 0
+    # One side has no units left
+    DEFEAT = 1
+    TURN_LIMIT = 2
+    INVALID_ACTION_LIMIT = 3
+    # No living unit has a face which can lower health, so no unit can ever be defeated
+    NO_DAMAGE = 4
+    # For STALEMATE_ROUNDS rounds in a row, no unit's health changed and no unit rolled a face which can lower health
+    STALEMATE = 5
+    # INVALID_ACTION_STREAK_LIMIT invalid actions in a row
+    INVALID_ACTION_STREAK = 6
+
+# Units act in order of lowest initiative, then lowest precise initiative. Ties go to the unit added to the battle first
+def get_initiative_key(unit):
+    return (unit.total_init, unit.prec_init, unit.uid)
+
 # Copy how the battle is constructed for us to reset to that state
 class BattleSignature:
     def __init__(self, units):
@@ -24,20 +46,47 @@ class Battle:
         self.battlefield = Battlefield(logger, units, 'battlefield')
         self.rng = random
         self.signature = BattleSignature(units)
+        # Rolls the dice instead of rng if set, see dice_streams.py
+        self.dice_streams = None
+        # Records what happens in the battle if set, see telemetry.py
+        self.telemetry = None
         self.reset()
 
     def reset(self):
         self.battlefield = Battlefield(self.logger, copy.deepcopy(self.signature.units), 'battlefield')
+        self.battlefield.telemetry = self.telemetry
         self.round = 0
         # Number of turns which have passed
         self.turn = 0
-        # Contains the list of units primarily ordered by their initiative
+        # Contains the list of units primarily ordered by their initiative.
+        # Units cleared during a round leave None in their place until the round ends, see clear_unit
         self.turn_order = []
+        # Initiative key of each unit in the turn order, kept sorted to find units by bisection
+        self.turn_order_keys = []
+        # Number of None left in the turn order by cleared units
+        self.num_cleared_turns = 0
+        # Initiative key each unit was ordered with, by uid
+        self.initiative_keys = {}
         # Current turn in the turn order
         self.turn_index = 0
+        # Number of None in the turn order before the turn index
+        self.num_cleared_before_turn = 0
         self.state = BattleState.BATTLE_NOT_STARTED
         # At a certain point, end the battle if this exceeds a threshold
         self.invalid_actions = 0
+        # Invalid actions since the last valid one
+        self.invalid_streak = 0
+        # Whole rounds in a row in which no unit's health changed and no unit rolled a face which can lower health
+        self.stale_rounds = 0
+        # Set once a unit rolls a face which can lower health during the current round
+        self.reduce_health_rolled = False
+        # False once no living unit can lower health, checked when the battle starts and whenever a unit is cleared
+        self.can_reduce_health = True
+        # Living units with a face which can lower health
+        self.num_reduce_health_units = 0
+        # Set if the unit whose turn started was defeated by its statuses, its turn is skipped
+        self.is_turn_skipped = False
+        self.outcome = BattleOutcome.NOT_FINISHED
 
     # Return true if battle is over
     def step(self, action):
@@ -63,8 +112,10 @@ class Battle:
                     self.logger.warning('Primary Ability can not apply to target: {0}'.format(action.actor.label))
                 else:
                     action.act()
+                    self.invalid_streak = 0
             else:
                 self.invalid_actions += 1
+                self.invalid_streak += 1
             self.check_and_clear_invalid_units()
         elif self.state == BattleState.END_PHASE:
             self.end_turn()
@@ -79,6 +130,8 @@ class Battle:
         elif self.state == BattleState.START_PHASE:
             if self.check_if_battle_over():
                 self.state = BattleState.BATTLE_FINISHED
+            elif self.is_turn_skipped or self.get_current_turn() is None:
+                self.skip_turn()
             else:
                 self.state = BattleState.MAIN_PHASE
         elif self.state == BattleState.MAIN_PHASE:
@@ -86,6 +139,9 @@ class Battle:
                 self.state = BattleState.BATTLE_FINISHED
             elif action != None and action.action_type == BattleActionType.END:
                 self.state = BattleState.END_PHASE
+            # The unit was cleared during its own turn, which ends with it
+            elif self.get_current_turn() is None:
+                self.state = BattleState.END_PHASE
         elif self.state == BattleState.END_PHASE:
             if self.check_if_battle_over():
                 self.state = BattleState.BATTLE_FINISHED
@@ -99,12 +155,81 @@ class Battle:
         self.round = 0
         self.turn = 0
         self.turn_index = 0
+        self.build_turn_order()
+        self.update_can_reduce_health()
+        if self.telemetry is not None:
+            self.telemetry.record_battle(self.battlefield)
+
+    # Count the living units with a face which can lower health, see check_can_reduce_health
+    def update_can_reduce_health(self):
+        self.num_reduce_health_units = sum([1 for unit in self.battlefield.units if unit.can_reduce_health()])
+        self.check_can_reduce_health()
+
+    # Poison ticking on a unit can still lower health after no face can. Only units with statuses are looked at
+    def check_can_reduce_health(self):
+        self.can_reduce_health = self.num_reduce_health_units > 0 or \
+            any([StatusType.POISON in unit.statuses for unit in self.battlefield.status_units.values()])
+
+    def build_turn_order(self):
+        self.turn_order = sorted(self.battlefield.units, key=get_initiative_key)
+        self.initiative_keys = {unit.uid: get_initiative_key(unit) for unit in self.turn_order}
+        self.turn_order_keys = [self.initiative_keys[unit.uid] for unit in self.turn_order]
+        self.num_cleared_turns = 0
+        self.num_cleared_before_turn = 0
+
+    # Index of the unit in the turn order, or -1 if it isn't in it
+    def find_turn_order_index(self, unit):
+        key = self.initiative_keys.get(unit.uid)
+        if key is None:
+            return -1
+        index = bisect.bisect_left(self.turn_order_keys, key)
+        if index >= len(self.turn_order) or self.turn_order[index] is not unit:
+            return -1
+        return index
+
+    # Move the turn index past the current turn to the next unit left in the turn order, or to its length if there is none
+    def advance_turn_index(self):
+        if self.turn_index < len(self.turn_order) and self.turn_order[self.turn_index] is None:
+            self.num_cleared_before_turn += 1
+        self.turn_index += 1
+        while self.turn_index < len(self.turn_order) and self.turn_order[self.turn_index] is None:
+            self.num_cleared_before_turn += 1
+            self.turn_index += 1
+
+    # Statuses gained or lost during a round only change initiative from the next round on,
+    # so every living unit acts exactly once per round.
+    # The turn order is rebuilt only if some initiative changed, or compacted if units were cleared,
+    # which is linear once per round rather than on every change
+    def update_initiatives(self):
+        is_changed = False
+        for unit in self.battlefield.units:
+            total_init = unit.get_initiative()
+            if total_init != unit.total_init:
+                unit.total_init = total_init
+                is_changed = True
+        if is_changed:
+            self.build_turn_order()
+        else:
+            self.compact_turn_order()
+
+    # Drop the None left by cleared units from the turn order. Only done between rounds, when the turn index is 0
+    def compact_turn_order(self):
+        if self.num_cleared_turns == 0:
+            return
+        self.turn_order_keys = [self.turn_order_keys[i] for i in range(len(self.turn_order)) if self.turn_order[i] is not None]
+        self.turn_order = [unit for unit in self.turn_order if unit is not None]
+        self.num_cleared_turns = 0
+        self.num_cleared_before_turn = 0
+
+    # Position of the current turn among the units left in the turn order, as if cleared units were removed
+    def get_compact_turn_index(self):
+        return self.turn_index - self.num_cleared_before_turn
 
     def start_round(self):
+        # The turn order is kept sorted as units leave the battle, so it carries over between rounds.
+        # Units cleared after the last round ended, i.e. by the statuses of its last turn, still leave None
+        self.compact_turn_order()
         self.logger.info(get_log_header('Round {0} Begins'.format(self.round)))
-        units_ordered = self.battlefield.units.copy()
-        sorted(units_ordered, key=attrgetter('total_init', 'prec_init'))
-        self.turn_order = units_ordered
 
     def start_turn(self):
         if self.turn_index == 0:
@@ -112,26 +237,61 @@ class Battle:
 
         self.logger.info(get_log_header('Turn {0} Begins'.format(self.turn)))
         current_turn_unit = self.get_current_turn()
-        current_turn_unit.roll_all_available_die(self.rng)
+        self.is_turn_skipped = False
+        if current_turn_unit.uid in self.battlefield.status_units:
+            self.battlefield.tick_statuses(current_turn_unit, StatusTick.START)
+            if current_turn_unit.is_dead():
+                self.is_turn_skipped = True
+                return
+        if self.dice_streams is not None:
+            self.dice_streams.roll_unit_die(current_turn_unit)
+        else:
+            current_turn_unit.roll_all_available_die(self.rng)
+        if not self.reduce_health_rolled:
+            self.reduce_health_rolled = current_turn_unit.has_rolled_reduce_health()
 
     def end_turn(self):
         self.logger.info(get_log_header('Turn {0} Ends'.format(self.turn)))
+        current_turn_unit = self.get_current_turn()
+        if current_turn_unit is not None and current_turn_unit.uid in self.battlefield.status_units:
+            self.battlefield.tick_statuses(current_turn_unit, StatusTick.END)
         self.turn += 1
-        self.turn_index += 1
+        self.advance_turn_index()
+        if self.turn_index >= len(self.turn_order):
+            self.end_round()
+
+    # The unit defeated at the start of its turn was already cleared, leaving None at the turn index
+    def skip_turn(self):
+        self.logger.info(get_log_header('Turn {0} Skipped'.format(self.turn)))
+        self.is_turn_skipped = False
+        self.turn += 1
+        self.advance_turn_index()
         if self.turn_index >= len(self.turn_order):
             self.end_round()
 
     def end_round(self):
         self.logger.info(get_log_header('Round {0} Ends'.format(self.round)))
         self.turn_index = 0
+        self.num_cleared_before_turn = 0
         self.round += 1
+        self.update_initiatives()
+        # A round where some unit could have lowered health isn't stale, even if none did
+        if self.battlefield.health_changed or self.reduce_health_rolled:
+            self.stale_rounds = 0
+        else:
+            self.stale_rounds += 1
+        self.battlefield.health_changed = False
+        self.reduce_health_rolled = False
 
     # Delete units from tracked lists if they are dead
     def check_and_clear_invalid_units(self):
-        units_cpy = self.battlefield.units.copy()
-        for unit in units_cpy:
+        num_cleared = 0
+        for unit in self.battlefield.pop_defeated_units():
             if unit.current_health <= 0:
                 self.clear_unit(unit)
+                num_cleared += 1
+        if num_cleared > 0 and self.can_reduce_health:
+            self.check_can_reduce_health()
 
     def clear_unit(self, unit):
         # Clear from battlefield list
@@ -139,13 +299,21 @@ class Battle:
 
         # Add to dead list
         self.battlefield.add_to_dead_list(unit)
+        if unit.can_reduce_health():
+            self.num_reduce_health_units -= 1
+        if self.telemetry is not None:
+            self.telemetry.record_death(unit, self.turn, len(self.battlefield.dead_list) == 1)
 
-        # Clear from turn order list
-        unit_index = self.turn_order.index(unit)
-        self.turn_order.pop(unit_index)
-        # Update turn index if units past current turn
-        if self.turn_index > unit_index:
-            self.turn_index -= 1
+        # Clear from turn order list. Its place is found by bisection and left as None, so the turn index
+        # stays valid and clearing takes logarithmic time. The round end compacts the turn order
+        unit_index = self.find_turn_order_index(unit)
+        if unit_index < 0:
+            return
+        self.turn_order[unit_index] = None
+        del self.initiative_keys[unit.uid]
+        self.num_cleared_turns += 1
+        if unit_index < self.turn_index:
+            self.num_cleared_before_turn += 1
 
     def get_target_by_index(self, target_type, target_index):
         if target_type == TargetType.UNIT:
@@ -167,16 +335,29 @@ class Battle:
                 return self.battlefield.red_side.back
         return None
 
+    # Return true if battle is over, setting how it finished
     def check_if_battle_over(self):
-        # Arbitrary turn limit to avoid infinite loop
-        if self.is_past_turn_limit():
-            return True
-        if self.invalid_actions > constants.INVALID_ACTION_LIMIT:
-            return True
+        self.outcome = self.get_outcome()
+        return self.outcome != BattleOutcome.NOT_FINISHED
+
+    def get_outcome(self):
         # If at least one enemy and ally are alive, the battle is still going
         blue_count = len(self.battlefield.blue_side.units)
         red_count = len(self.battlefield.red_side.units)
-        return blue_count == 0 or red_count == 0
+        if blue_count == 0 or red_count == 0:
+            return BattleOutcome.DEFEAT
+        # Arbitrary turn limit to avoid infinite loop
+        if self.is_past_turn_limit():
+            return BattleOutcome.TURN_LIMIT
+        if self.invalid_actions > constants.INVALID_ACTION_LIMIT:
+            return BattleOutcome.INVALID_ACTION_LIMIT
+        if not self.can_reduce_health:
+            return BattleOutcome.NO_DAMAGE
+        if self.stale_rounds >= constants.STALEMATE_ROUNDS:
+            return BattleOutcome.STALEMATE
+        if self.invalid_streak >= constants.INVALID_ACTION_STREAK_LIMIT:
+            return BattleOutcome.INVALID_ACTION_STREAK
+        return BattleOutcome.NOT_FINISHED
 
     def is_past_turn_limit(self):
         return self.turn >= constants.TURN_LIMIT
@@ -190,12 +371,42 @@ class Battle:
             return Team.RED
         return Team.NONE
 
+    # Ids of every Class levelled by the units of the battle
+    def get_class_ids(self):
+        class_ids = set()
+        for unit in self.signature.units:
+            class_ids.update(unit.character.class_levels.keys())
+        return sorted(class_ids)
+
+    # Most units either team starts the battle with
+    def get_max_units_per_side(self):
+        num_blue = 0
+        num_red = 0
+        for unit in self.signature.units:
+            if unit.team == Team.BLUE:
+                num_blue += 1
+            elif unit.team == Team.RED:
+                num_red += 1
+        return max(num_blue, num_red)
+
+    # Most die any unit starts the battle with
+    def get_max_die_per_unit(self):
+        return max([len(unit.die) for unit in self.signature.units], default=0)
+
+    # Highest health any unit starts the battle with
+    def get_max_health(self):
+        return max([unit.character.max_health for unit in self.signature.units], default=0)
+
     def get_current_turn(self):
         if self.turn_index < 0 or self.turn_index >= len(self.turn_order):
             return None
         return self.turn_order[self.turn_index]
 
     def print_details(self):
+        # Skip building the details when nobody reads them, i.e. headless simulations and training
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+
         # Print the battle layout
         self.battlefield.print_map()
 
@@ -213,6 +424,8 @@ class Battle:
         unit_labels = []
         for i in range(len(self.turn_order)):
             unit = self.turn_order[i]
+            if unit is None:
+                continue
             # Show current turn
             if i == self.turn_index:
                 unit_labels.append('*{0}*'.format(unit.label))
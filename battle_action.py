@@ -109,11 +109,18 @@ class BattleActionPrimary:
         face_data = self.game_data.get_row(SheetId.Faces, face_to_use.face_id)
         ability_data = self.game_data.get_row(SheetId.Abilities, face_data.ability_id)
 
+        telemetry = self.battlefield.telemetry
+        if telemetry is not None:
+            telemetry.record_ability(self.actor, face_data.ability_id)
+
         # Iterate through the effects and apply
         if self.target is not None:
             x = face_to_use.x
             self.target.apply_effects(self.battlefield, self.actor, ability_data.effects, x)
 
+        if telemetry is not None:
+            telemetry.end_ability()
+
         # Use the die
         self.primary_die.reset()
 
@@ -141,6 +148,8 @@ class BattleActionMove:
     def act(self):
         effect = EffectMove(0, 0)
         effect.apply(self.logger, self.battlefield, self.actor, self.actor, 0)
+        if self.battlefield.telemetry is not None:
+            self.battlefield.telemetry.record_move(self.actor)
 
         # Use the die
         self.die.reset()
@@ -165,3 +174,44 @@ class BattleActionEnd:
 
     def act(self):
         return
+
+# Split a flat action index of the Learning Agent's action space into its components.
+# Indices enumerate every target_index for each die_index, and every die_index for each action_type
+def decode_action_index(action_index, num_die, num_targets):
+    action = {}
+    action['action_type'] = action_index // (num_die * num_targets)
+    action['die_index'] = (action_index % (num_die * num_targets)) // num_targets
+    action['target_index'] = (action_index % (num_die * num_targets)) % num_targets
+    return action
+
+# Creates a Battle Action from a dictionary defined in the Learning Agent's Action Space
+# Returns None if the action can't be made for the unit's current dice
+def create_battle_action(logger, game_data, battle, unit, action):
+    action_type = action['action_type']
+    die_index = action['die_index']
+    target_index = action['target_index']
+
+    ret = None
+    if action_type == BattleActionType.PRIMARY:
+        die = unit.get_die(die_index)
+        face_to_use = die.get_rolled_face() if die is not None else None
+        if face_to_use != None:
+            face_data = game_data.get_row(SheetId.Faces, face_to_use.face_id)
+            ability_data = game_data.get_row(SheetId.Abilities, face_data.ability_id)
+
+            target_type = ability_data.target_type
+            target = battle.get_target_by_index(target_type, target_index)
+            ret = BattleActionPrimary(logger, game_data, battle.battlefield, unit, die, target)
+    elif action_type == BattleActionType.MOVE:
+        die = unit.get_die(die_index)
+        face_to_use = die.get_rolled_face() if die is not None else None
+        if face_to_use != None:
+            ret = BattleActionMove(logger, game_data, battle.battlefield, unit, die)
+    elif action_type == BattleActionType.END:
+        ret = BattleActionEnd(logger, game_data, battle.battlefield, unit)
+
+    return ret
+
+# Returns true if the Battle Action would be accepted by the Battle
+def is_battle_action_valid(battle_action):
+    return battle_action is not None and battle_action.can_ability_use_resources() and battle_action.can_ability_be_used() and battle_action.can_ability_apply_to_target()
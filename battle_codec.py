@@ -0,0 +1,179 @@
+import struct
+from battle import *
+
+# Identifies an encoded battle and the version of its layout
+BATTLE_MAGIC = b'RDBS'
+BATTLE_CODEC_VERSION = 5
+# Header: magic, version, battle state, flags, round, turn, turn index, invalid actions, invalid streak, stale rounds,
+# outcome, number of units
+BATTLE_HEADER = struct.Struct('<4sHBBiiiiiHBH')
+# Unit: uid, location, flags, number of die, current health, total initiative, precedence initiative
+UNIT_RECORD = struct.Struct('<HBBBhdd')
+# Number of status records
+STATUS_COUNT = struct.Struct('<H')
+# Status: uid of its unit, status type, amount, turns, uid of the unit which applied it or -1
+STATUS_RECORD = struct.Struct('<HBhhh')
+# Header flag set once the turn order is built at the start of the battle
+BATTLE_FLAG_TURN_ORDER = 1
+# Header flag set if a unit's health changed during the current round
+BATTLE_FLAG_HEALTH_CHANGED = 2
+# Header flag set if a unit rolled a face which can lower health during the current round
+BATTLE_FLAG_REDUCE_HEALTH_ROLLED = 4
+# Unit flag set for units in the dead list
+UNIT_FLAG_DEAD = 1
+
+# Encode the mutable state of the battle: the header, then a record for each unit in the battlefield followed by
+# each unit in the dead list, then the roll of each die of those units in the same order as one signed byte each,
+# then the number of active statuses and a record for each.
+# Everything else, i.e. characters, faces and abilities, comes from the battle signature and Game Data
+def encode_battle(battle):
+    battlefield = battle.battlefield
+    units = battlefield.units + battlefield.dead_list
+    num_die = sum([len(unit.die) for unit in units])
+    statuses = [status for unit in battlefield.status_units.values() for status in unit.statuses.values()]
+    buf = bytearray(BATTLE_HEADER.size + len(units) * UNIT_RECORD.size + num_die + STATUS_COUNT.size + len(statuses) * STATUS_RECORD.size)
+
+    flags = BATTLE_FLAG_TURN_ORDER if len(battle.turn_order) > 0 else 0
+    if battlefield.health_changed:
+        flags |= BATTLE_FLAG_HEALTH_CHANGED
+    if battle.reduce_health_rolled:
+        flags |= BATTLE_FLAG_REDUCE_HEALTH_ROLLED
+    BATTLE_HEADER.pack_into(buf, 0, BATTLE_MAGIC, BATTLE_CODEC_VERSION, battle.state.value, flags,
+                            battle.round, battle.turn, battle.get_compact_turn_index(), battle.invalid_actions, battle.invalid_streak,
+                            battle.stale_rounds, battle.outcome.value, len(units))
+    offset = BATTLE_HEADER.size
+    roll_offset = offset + len(units) * UNIT_RECORD.size
+    num_alive = len(battlefield.units)
+    for i in range(len(units)):
+        unit = units[i]
+        unit_flags = UNIT_FLAG_DEAD if i >= num_alive else 0
+        UNIT_RECORD.pack_into(buf, offset, unit.uid, unit.location, unit_flags, len(unit.die),
+                              unit.current_health, unit.total_init, unit.prec_init)
+        offset += UNIT_RECORD.size
+        for die in unit.die:
+            struct.pack_into('<b', buf, roll_offset, die.roll)
+            roll_offset += 1
+    STATUS_COUNT.pack_into(buf, roll_offset, len(statuses))
+    offset = roll_offset + STATUS_COUNT.size
+    for unit in battlefield.status_units.values():
+        for status in unit.statuses.values():
+            STATUS_RECORD.pack_into(buf, offset, unit.uid, status.status_type.value, status.amount, status.turns, status.source_uid)
+            offset += STATUS_RECORD.size
+    return bytes(buf)
+
+def read_battle_header(buf):
+    if len(buf) < BATTLE_HEADER.size:
+        raise ValueError('Encoded battle is too short: {0} bytes'.format(len(buf)))
+    header = BATTLE_HEADER.unpack_from(buf, 0)
+    if header[0] != BATTLE_MAGIC:
+        raise ValueError('Not an encoded battle')
+    if header[1] != BATTLE_CODEC_VERSION:
+        raise ValueError('Unsupported battle codec version:{0}'.format(header[1]))
+    return header
+
+# Restore the state of the battle from encode_battle. The battle must have been created with the same units
+# as the encoded one, i.e. the same scenario, since only the mutable state is encoded
+def decode_battle_into(battle, buf):
+    (magic, version, state, flags, battle_round, turn, turn_index, invalid_actions, invalid_streak, stale_rounds, outcome,
+     num_units) = read_battle_header(buf)
+    units_by_uid = battle.battlefield.units_by_uid
+    if num_units != len(units_by_uid):
+        raise ValueError('Encoded battle has {0} units, battle has {1}'.format(num_units, len(units_by_uid)))
+
+    battlefield = Battlefield(battle.logger, [], 'battlefield')
+    battlefield.telemetry = battle.telemetry
+    offset = BATTLE_HEADER.size
+    roll_offset = offset + num_units * UNIT_RECORD.size
+    for i in range(num_units):
+        uid, location, unit_flags, num_die, current_health, total_init, prec_init = UNIT_RECORD.unpack_from(buf, offset)
+        offset += UNIT_RECORD.size
+        unit = units_by_uid.get(uid)
+        if unit is None or num_die != len(unit.die):
+            raise ValueError('Encoded unit {0} doesn\'t match the battle'.format(uid))
+        unit.location = Location(location)
+        unit.current_health = current_health
+        unit.total_init = total_init
+        unit.prec_init = prec_init
+        rolls = struct.unpack_from('<{0}b'.format(num_die), buf, roll_offset)
+        roll_offset += num_die
+        for die, roll in zip(unit.die, rolls):
+            die.roll = roll
+        unit.statuses = {}
+        if unit_flags & UNIT_FLAG_DEAD:
+            battlefield.add_to_dead_list(unit)
+        else:
+            battlefield.add_unit(unit)
+
+    num_statuses, = STATUS_COUNT.unpack_from(buf, roll_offset)
+    offset = roll_offset + STATUS_COUNT.size
+    for i in range(num_statuses):
+        uid, status_type, amount, turns, source_uid = STATUS_RECORD.unpack_from(buf, offset)
+        offset += STATUS_RECORD.size
+        unit = units_by_uid[uid]
+        unit.statuses[StatusType(status_type)] = Status(StatusType(status_type), amount, turns, source_uid)
+        battlefield.status_units[uid] = unit
+    battlefield.health_changed = (flags & BATTLE_FLAG_HEALTH_CHANGED) != 0
+    battle.battlefield = battlefield
+    battle.state = BattleState(state)
+    battle.round = battle_round
+    battle.turn = turn
+    battle.invalid_actions = invalid_actions
+    battle.invalid_streak = invalid_streak
+    battle.stale_rounds = stale_rounds
+    battle.reduce_health_rolled = (flags & BATTLE_FLAG_REDUCE_HEALTH_ROLLED) != 0
+    battle.outcome = BattleOutcome(outcome)
+    battle.update_can_reduce_health()
+    if flags & BATTLE_FLAG_TURN_ORDER:
+        battle.build_turn_order()
+    else:
+        battle.turn_order = []
+        battle.turn_order_keys = []
+        battle.initiative_keys = {}
+        battle.num_cleared_turns = 0
+        battle.num_cleared_before_turn = 0
+    battle.turn_index = turn_index
+    return battle
+
+# Zero-copy NumPy views of an encoded battle.
+# Returns the header as a dict, a structured array with a record per unit, an array of every die roll
+# and a structured array with a record per status
+def decode_battle_arrays(buf):
+    import numpy as np
+
+    (magic, version, state, flags, battle_round, turn, turn_index, invalid_actions, invalid_streak, stale_rounds, outcome,
+     num_units) = read_battle_header(buf)
+    header = {
+        'state': state,
+        'flags': flags,
+        'round': battle_round,
+        'turn': turn,
+        'turn_index': turn_index,
+        'invalid_actions': invalid_actions,
+        'invalid_streak': invalid_streak,
+        'stale_rounds': stale_rounds,
+        'outcome': outcome,
+        'num_units': num_units,
+    }
+    unit_dtype = np.dtype([
+        ('uid', '<u2'),
+        ('location', 'u1'),
+        ('flags', 'u1'),
+        ('num_die', 'u1'),
+        ('current_health', '<i2'),
+        ('total_init', '<f8'),
+        ('prec_init', '<f8'),
+    ])
+    units = np.frombuffer(buf, dtype=unit_dtype, count=num_units, offset=BATTLE_HEADER.size)
+    num_die = int(units['num_die'].sum())
+    roll_offset = BATTLE_HEADER.size + num_units * UNIT_RECORD.size
+    rolls = np.frombuffer(buf, dtype=np.int8, count=num_die, offset=roll_offset)
+    num_statuses, = STATUS_COUNT.unpack_from(buf, roll_offset + num_die)
+    status_dtype = np.dtype([
+        ('uid', '<u2'),
+        ('status_type', 'u1'),
+        ('amount', '<i2'),
+        ('turns', '<i2'),
+        ('source_uid', '<i2'),
+    ])
+    statuses = np.frombuffer(buf, dtype=status_dtype, count=num_statuses, offset=roll_offset + num_die + STATUS_COUNT.size)
+    return header, units, rolls, statuses
@@ -1,4 +1,5 @@
-from battle import *
+from battle_runner import *
+from observation_encoder import *
 from gym.spaces import *
 import warnings
 import gym
@@ -6,11 +7,20 @@ import numpy as np
 
 """
 Wrapper around the Battle class with Open AI Gym
+The spaces are generated from the size of the battle and the Game Data, so larger battles and rosters
+only change the sizes of the spaces. Sizes can be given explicitly to share one layout between battles.
 """
-class BattleEnv(gym.Env):
-    def __init__(self, logger, battle):
-        self.logger = logger
-        self.battle = battle
+class BattleEnv(BattleRunner, gym.Env):
+    def __init__(self, logger, battle, game_data, max_units_per_side=None, max_die_per_unit=None, max_health=None):
+        BattleRunner.__init__(self, logger, battle, max_units_per_side, max_die_per_unit)
+        if max_health is None:
+            max_health = battle.get_max_health()
+        num_units = self.max_units_per_side
+        num_die = self.max_die_per_unit
+        num_classes = game_data.get_max_index(SheetId.Classes) + 1
+        num_faces = game_data.get_max_index(SheetId.Faces) + 1
+        # Units are targeted by their index among every unit in the battlefield
+        num_targets = max(2 * num_units, constants.NUM_SIDE_TARGETS, constants.NUM_AREA_TARGETS)
 
         # Define all output features for the Actor which can create all possible Battle Actions
         # action_type - BattleActionType
@@ -18,110 +28,35 @@ class BattleEnv(gym.Env):
         # target_index - index to the Targetable. This is based on TargetType
         self.action_space = Dict(
             {
-                "action_type": Discrete(3),
-                "die_index": Discrete(2),
-                "target_index": Discrete(6),
+                "action_type": Discrete(len(BattleActionType)),
+                "die_index": Discrete(num_die),
+                "target_index": Discrete(num_targets),
             }
         )
 
         # Define all input features which is the observable Battle state.
         # turn - Number of turns which have elapsed
-        # die1_face - The facing of the first die, 0 means it's inactive - this is an index of Facing in Game Data
-        # die2_face - The facing of the second die, 0 means it's inactive - this is an index of Facing in Game Data
-        # blue_hp1 - Health of the first blue unit, 0 means non-existant or dead
-        # blue_class1 - Primary class of the first blue unit, 0 means non-existant - This is an index of Class in Game Data
-        # blue_hp2 - Health of the second blue unit, 0 means non-existant or dead
-        # blue_class2 - Primary class of the second blue unit, 0 means non-existant - This is an index of Class in Game Data
-        # red_hp1 - Health of the first red unit, 0 means non-existant or dead
-        # red_class1 - Primary class of the first red unit, 0 means non-existant - This is an index of Class in Game Data
-        # red_hp2 - Health of the second red unit, 0 means non-existant or dead
-        # red_class2 - Primary class of the second red unit, 0 means non-existant - This is an index of Class in Game Data
-        # TODO: Create an object for { blue_hp1, blue_class1 } to add any extra information we care about the Unit
+        # die_faces - The facing of each die of the unit in turn, 0 means it's inactive - this is an index of Facing in Game Data
+        # blue_hp - Health of each blue unit, 0 means non-existant or dead
+        # blue_class - Primary class of each blue unit, 0 means non-existant - This is an index of Class in Game Data
+        # red_hp - Health of each red unit, 0 means non-existant or dead
+        # red_class - Primary class of each red unit, 0 means non-existant - This is an index of Class in Game Data
         # TODO: Add Turn Order information
         self.observation_space = Dict(
             {
-                "turn": Box(low=0.0, high=100.0),
-                "die1_face": Discrete(4),
-                "die2_face": Discrete(4),
-                "blue_hp1": Box(low=0.0, high=20.0),
-                "blue_class1": Discrete(3),
-                "blue_hp2": Box(low=0.0, high=20.0),
-                "blue_class2": Discrete(3),
-                "red_hp1": Box(low=0.0, high=20.0),
-                "red_class1": Discrete(3),
-                "red_hp2": Box(low=0.0, high=20.0),
-                "red_class2": Discrete(3),
+                "turn": Box(low=0.0, high=float(constants.TURN_LIMIT)),
+                "die_faces": MultiDiscrete([num_faces] * num_die),
+                "blue_hp": Box(low=0.0, high=float(max_health), shape=(num_units,)),
+                "blue_class": MultiDiscrete([num_classes] * num_units),
+                "red_hp": Box(low=0.0, high=float(max_health), shape=(num_units,)),
+                "red_class": MultiDiscrete([num_classes] * num_units),
             }
         )
 
-    def change_battle(self, battle):
-        self.battle = battle
-
-    def step(self, action):
-        info = None
-        unit_turn = self.battle.get_current_turn()
-        if action != None and unit_turn != action.actor:
-            self.logger.warning('Attempting to perform step using action which is wrong turn - expected:{0} seeing:{1}'.format(unit_turn.label, action.actor.label))
-            return self.get_observed_state(), 0, False, False, info
-
-        reward = 0
-        is_done = False
-        is_terminated = False
-        if self.battle.state != BattleState.BATTLE_FINISHED:
-            is_done = self.battle.step(action)
-            is_terminated = self.battle.is_past_turn_limit()
-        
-        next_state = self.get_observed_state()
-        return next_state, 0, is_done, is_terminated, info
-
-    def get_observed_state(self):
-        unit = self.battle.get_current_turn()
-
-        die = unit.die if unit is not None else []
-        num_die = len(die)
-        die1_face = None
-        die2_face = None
-        if num_die >= 1:
-            die1_face = die[0].get_rolled_face()
-        if num_die >= 2:
-            die2_face = die[1].get_rolled_face()
-
-        blue1 = None
-        blue2 = None
-        red1 = None
-        red2 = None
-
-        blue_units = self.battle.battlefield.get_all_units(Team.BLUE)
-        red_units = self.battle.battlefield.get_all_units(Team.RED)
-        if (len(blue_units) > 0):
-            blue1 = blue_units[0]
-        if (len(blue_units) > 1):
-            blue2 = blue_units[1]
-        if (len(red_units) > 0):
-            red1 = red_units[0]
-        if (len(red_units) > 1):
-            red2 = red_units[1]
-        
-        observation = {}
-        observation['turn'] = self.battle.turn
-        observation['die1_face'] = die1_face.index if die1_face is not None else 0
-        observation['die2_face'] = die2_face.index if die2_face is not None else 0
-        observation['blue_hp1'] = blue1.current_health if blue1 is not None else 0
-        observation['blue_class1'] = blue1.get_primary_class_index() if blue1 is not None else 0
-        observation['blue_hp2'] = blue2.current_health if blue2 is not None else 0
-        observation['blue_class2'] = blue2.get_primary_class_index() if blue2 is not None else 0
-        observation['red_hp1'] = red1.current_health if red1 is not None else 0
-        observation['red_class1'] = red1.get_primary_class_index() if red1 is not None else 0
-        observation['red_hp2'] = red2.current_health if red2 is not None else 0
-        observation['red_class2'] = red2.get_primary_class_index() if red2 is not None else 0
-        return observation
-
-    def reset(self):
-        self.battle.reset()
-        return None
-  
-    def render(self, mode='human'):
-        pass
-
-    def close(self):
-        pass
+# Sizes of the spaces of a BattleEnv which can observe any of the battles, i.e. to switch between them with change_battle
+def get_battle_env_sizes(battles):
+    sizes = {}
+    sizes['max_units_per_side'] = max([battle.get_max_units_per_side() for battle in battles])
+    sizes['max_die_per_unit'] = max([battle.get_max_die_per_unit() for battle in battles])
+    sizes['max_health'] = max([battle.get_max_health() for battle in battles])
+    return sizes
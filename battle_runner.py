@@ -0,0 +1,158 @@
+import warnings
+import constants
+from battle import *
+
+# Names of the values observed by players, in the order returned by BattleRunner.get_observed_values
+OBSERVATION_KEYS = [
+    'turn',
+    'die_faces',
+    'blue_hp',
+    'blue_class',
+    'red_hp',
+    'red_class',
+]
+
+"""
+Steps a Battle with the actions of Players and reports what they can observe.
+It doesn't depend on gym, so console games and rules-only simulations can run it without loading any ML modules.
+"""
+class BattleRunner:
+    def __init__(self, logger, battle, max_units_per_side=None, max_die_per_unit=None):
+        self.logger = logger
+        self.battle = battle
+        # Per unit and per die observations are padded to these sizes so battles of different sizes
+        # share the same layout. They default to the size of the battle
+        self.max_units_per_side = max_units_per_side if max_units_per_side is not None else battle.get_max_units_per_side()
+        self.max_die_per_unit = max_die_per_unit if max_die_per_unit is not None else battle.get_max_die_per_unit()
+
+    def change_battle(self, battle):
+        if battle.get_max_units_per_side() > self.max_units_per_side or battle.get_max_die_per_unit() > self.max_die_per_unit:
+            self.logger.warning('Battle is larger than observed - units per side:{0} die per unit:{1}'.format(self.max_units_per_side, self.max_die_per_unit))
+        self.battle = battle
+
+    def step(self, action):
+        info = None
+        unit_turn = self.battle.get_current_turn()
+        if action != None and unit_turn != action.actor:
+            self.logger.warning('Attempting to perform step using action which is wrong turn - expected:{0} seeing:{1}'.format(unit_turn.label, action.actor.label))
+            return self.get_observed_state(), 0, False, False, info
+
+        reward = 0
+        is_done = False
+        is_terminated = False
+        if self.battle.state != BattleState.BATTLE_FINISHED:
+            is_done = self.battle.step(action)
+            is_terminated = self.battle.is_past_turn_limit()
+        
+        next_state = self.get_observed_state()
+        return next_state, 0, is_done, is_terminated, info
+
+    def get_observed_state(self):
+        return dict(zip(OBSERVATION_KEYS, self.get_observed_values()))
+
+    # Same as get_observed_state with the values ordered as OBSERVATION_KEYS instead of in a dict.
+    # die_faces holds the face index of each die of the unit in turn, and the hp and class lists hold
+    # the health and primary class index of each unit of a side. Face and class index 0 means none
+    def get_observed_values(self):
+        die_faces = [0] * self.max_die_per_unit
+        unit = self.battle.get_current_turn()
+        if unit is not None:
+            for i, die in enumerate(unit.die[:self.max_die_per_unit]):
+                face = die.get_rolled_face()
+                die_faces[i] = face.index if face is not None else 0
+
+        blue_hp, blue_class = self.get_observed_units(Team.BLUE)
+        red_hp, red_class = self.get_observed_units(Team.RED)
+        return (self.battle.turn, die_faces, blue_hp, blue_class, red_hp, red_class)
+
+    # Health and primary class index of each unit of the team, padded with 0 for missing units
+    def get_observed_units(self, team):
+        hp = [0] * self.max_units_per_side
+        class_index = [0] * self.max_units_per_side
+        units = self.battle.battlefield.get_all_units(team)
+        for i, unit in enumerate(units[:self.max_units_per_side]):
+            hp[i] = unit.current_health
+            class_index[i] = unit.get_primary_class_index()
+        return hp, class_index
+
+    def reset(self):
+        self.battle.reset()
+        return None
+  
+    def render(self, mode='human'):
+        pass
+
+    def close(self):
+        pass
+
+# Run the battle in the environment until it finishes with each team acting through its player
+def run_episode(battle_env, players):
+    battle = battle_env.battle
+    is_done = False
+    while not is_done:
+        action = None
+        if battle.state == BattleState.MAIN_PHASE:
+            turn = battle.get_current_turn()
+            player = players[turn.team]
+            action = player.select_action()
+        next_state, reward, is_done, is_terminated, info = battle_env.step(action)
+
+    for team in players:
+        player = players[team]
+        player.finish_episode()
+    turns = battle_env.battle.turn
+    winning_team = battle_env.battle.get_winning_team()
+    return turns, winning_team
+
+# Reward of the team for the last step of the battle
+def calculate_reward(battle, team):
+    # Slightly penalize every step to mitigate the bot from stalling
+    reward = constants.REWARD_AMOUNT_STEP_PENALTY
+
+    if battle.state == BattleState.BATTLE_FINISHED:
+        # If the battle is over, tally the results.
+        reward = 0
+
+        player_units = []
+        enemy_units = []
+        if team == Team.BLUE:
+            player_units = battle.battlefield.get_all_units(Team.BLUE)
+            enemy_units = battle.battlefield.get_all_units(Team.RED)
+        elif team == Team.RED:
+            player_units = battle.battlefield.get_all_units(Team.RED)
+            enemy_units = battle.battlefield.get_all_units(Team.BLUE)
+        else:
+            battle.logger.warning('Unknown team calculating reward: {0}'.format(team))
+
+        # Determine reward based on how the player's units survived
+        player_unit_score = 0
+        num_player_units = len(player_units)
+        for unit in player_units:
+            if not unit.is_dead():
+                percent_health = unit.get_percent_health()
+                player_unit_score += constants.REWARD_SCORE_PLAYER_UNIT_SURVIVING + constants.REWARD_SCORE_PLAYER_UNIT_HEALTH * percent_health
+        reward += player_unit_score / num_player_units if num_player_units > 0 else 0
+
+        # Determine reward based on how the enemy's units survived
+        enemy_unit_score = 0
+        num_enemy_units = len(enemy_units)
+        for unit in enemy_units:
+            if not unit.is_dead():
+                percent_health = unit.get_percent_health()
+                enemy_unit_score += constants.REWARD_SCORE_ENEMY_UNIT_SURVIVING + constants.REWARD_SCORE_ENEMY_UNIT_HEALTH * percent_health
+        reward += enemy_unit_score / num_enemy_units if num_enemy_units > 0 else 0
+
+        # Boost reward based on which team won. No team winning is a loss to the Agent
+        winning_team = battle.get_winning_team()
+        if winning_team == team:
+            reward += constants.REWARD_AMOUNT_WIN
+        else:
+            reward += constants.REWARD_AMOUNT_LOSS
+    return reward
+
+# Total reward a Learning Agent playing the team would have earned in the finished battle over its steps,
+# i.e. the step penalty for every step but the last and the tally of the battle for the last one
+def calculate_episode_reward(battle, team, steps):
+    if steps <= 0:
+        return 0
+    return constants.REWARD_AMOUNT_STEP_PENALTY * (steps - 1) + calculate_reward(battle, team)
@@ -0,0 +1,152 @@
+import numpy as np
+import gym
+from gym.spaces import Box, Discrete
+from gym.vector import VectorEnv
+from battle_env import *
+from player import *
+from scenarios import *
+
+"""
+Runs many battles side by side as a single gym VectorEnv.
+The agent plays one team of every battle while the other team is played inline by a NonPlayer, so each
+step takes one flat action index per battle and returns once every battle waits on the agent again.
+Observations, rewards, flags and legal action masks are written into preallocated arrays which are
+overwritten by the next step. Finished battles are reset in place and their last observation is
+reported in info['final_observation'].
+"""
+class BattleVectorEnv(VectorEnv):
+    def __init__(self, logger, game_data, battles, rng, team=Team.BLUE):
+        self.logger = logger
+        self.game_data = game_data
+        self.rng = rng
+        self.team = team
+        opponent_team = Team.RED if team == Team.BLUE else Team.BLUE
+        # Every battle is observed with the same layout, sized for the largest of them
+        sizes = get_battle_env_sizes(battles)
+        self.envs = [BattleEnv(logger, battle, game_data, **sizes) for battle in battles]
+        self.opponents = [NonPlayer(logger, game_data, env, opponent_team, rng) for env in self.envs]
+
+        single_env = self.envs[0]
+        self.encoder = ObservationEncoder(single_env.observation_space, OBSERVATION_KEYS)
+        self.num_die = single_env.action_space['die_index'].n
+        self.num_targets = single_env.action_space['target_index'].n
+        self.num_actions = single_env.action_space['action_type'].n * self.num_die * self.num_targets
+        VectorEnv.__init__(self, len(battles),
+                           Box(low=0.0, high=1.0, shape=(self.encoder.size,), dtype=np.float32),
+                           Discrete(self.num_actions))
+
+        self.observations = np.zeros((self.num_envs, self.encoder.size), dtype=np.float32)
+        self.rewards = np.zeros(self.num_envs, dtype=np.float64)
+        self.terminated = np.zeros(self.num_envs, dtype=bool)
+        self.truncated = np.zeros(self.num_envs, dtype=bool)
+        self.action_masks = np.zeros((self.num_envs, self.num_actions), dtype=bool)
+        self.actions = None
+
+    # Step the battle until it's the agent's turn to act or the battle is over.
+    # Battles are stepped directly since the per-step observation of BattleEnv.step isn't needed
+    def advance(self, env_index):
+        battle = self.envs[env_index].battle
+        while battle.state != BattleState.BATTLE_FINISHED:
+            action = None
+            if battle.state == BattleState.MAIN_PHASE:
+                unit = battle.get_current_turn()
+                if unit.team == self.team:
+                    return
+                action = self.opponents[env_index].select_action()
+            battle.step(action)
+
+    def reset_env(self, env_index):
+        self.envs[env_index].reset()
+        self.opponents[env_index].reset_episode()
+        self.advance(env_index)
+
+    def update_arrays(self, env_index):
+        env = self.envs[env_index]
+        self.encoder.encode(env.get_observed_values(), self.observations[env_index])
+        self.compute_action_mask(env_index, self.action_masks[env_index])
+
+    def compute_action_mask(self, env_index, out):
+        out[:] = False
+        battle = self.envs[env_index].battle
+        unit = battle.get_current_turn()
+        if battle.state != BattleState.MAIN_PHASE or unit is None or unit.team != self.team:
+            return out
+        # Only primary actions depend on the target, and ending the turn doesn't depend on the die either
+        # so those are checked once and copied to every index they share
+        for action_type in [BattleActionType.PRIMARY, BattleActionType.MOVE, BattleActionType.END]:
+            for die_index in range(self.num_die):
+                start = (action_type * self.num_die + die_index) * self.num_targets
+                if action_type == BattleActionType.PRIMARY:
+                    for target_index in range(self.num_targets):
+                        action = decode_action_index(start + target_index, self.num_die, self.num_targets)
+                        battle_action = create_battle_action(self.logger, self.game_data, battle, unit, action)
+                        out[start + target_index] = is_battle_action_valid(battle_action)
+                elif action_type == BattleActionType.MOVE or die_index == 0:
+                    action = decode_action_index(start, self.num_die, self.num_targets)
+                    battle_action = create_battle_action(self.logger, self.game_data, battle, unit, action)
+                    out[start:start + self.num_targets] = is_battle_action_valid(battle_action)
+                else:
+                    out[start:start + self.num_targets] = out[action_type * self.num_die * self.num_targets]
+        return out
+
+    def reset_async(self, seed=None, options=None):
+        if seed is not None:
+            self.rng.seed(seed if isinstance(seed, int) else seed[0])
+
+    def reset_wait(self, seed=None, options=None):
+        for i in range(self.num_envs):
+            self.reset_env(i)
+            self.update_arrays(i)
+        return self.observations, {'action_mask': self.action_masks}
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        final_observations = None
+        for i in range(self.num_envs):
+            env = self.envs[i]
+            battle = env.battle
+            unit = battle.get_current_turn()
+            action = decode_action_index(int(self.actions[i]), self.num_die, self.num_targets)
+            battle_action = create_battle_action(self.logger, self.game_data, battle, unit, action)
+            # Invalid actions are rejected by the battle the same way as for a single environment
+            if not is_battle_action_valid(battle_action):
+                battle_action = None
+            battle.step(battle_action)
+            self.advance(i)
+
+            self.rewards[i] = calculate_reward(battle, self.team)
+            is_finished = battle.state == BattleState.BATTLE_FINISHED
+            self.truncated[i] = is_finished and battle.is_past_turn_limit()
+            self.terminated[i] = is_finished and not self.truncated[i]
+            if is_finished:
+                if final_observations is None:
+                    final_observations = np.empty(self.num_envs, dtype=object)
+                    has_final_observations = np.zeros(self.num_envs, dtype=bool)
+                has_final_observations[i] = True
+                final_observations[i] = self.encoder.encode(env.get_observed_values(), np.zeros(self.encoder.size, dtype=np.float32))
+                self.reset_env(i)
+            self.update_arrays(i)
+
+        infos = {'action_mask': self.action_masks}
+        if final_observations is not None:
+            infos['final_observation'] = final_observations
+            infos['_final_observation'] = has_final_observations
+        return self.observations, self.rewards, self.terminated, self.truncated, infos
+
+    def call(self, name, *args, **kwargs):
+        results = []
+        for env in self.envs:
+            attr = getattr(env, name)
+            results.append(attr(*args, **kwargs) if callable(attr) else attr)
+        return results
+
+    def close_extras(self, **kwargs):
+        for env in self.envs:
+            env.close()
+
+# Vector environment of num_envs copies of a scenario
+def create_battle_vector_env(logger, game_data, scenario, num_envs, rng, team=Team.BLUE):
+    battles = [SCENARIOS[scenario](logger, game_data, rng) for i in range(num_envs)]
+    return BattleVectorEnv(logger, game_data, battles, rng, team)
@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+import constants
+
+# Modules needed for rules-only simulations and the console game. They must not load any ML dependency
+SIMULATION_MODULES = ['battle', 'targetable', 'die', 'effect', 'game_data', 'battle_runner', 'battle_codec', 'player', 'scenarios', 'metrics', 'main']
+# Modules which take seconds to import and should only be loaded when an agent or env is requested
+HEAVY_MODULES = ['torch', 'gym']
+
+# Import the modules in a fresh interpreter and report how long it took and which heavy modules came with them
+def benchmark_startup(modules=SIMULATION_MODULES):
+    script = '\n'.join([
+        'import json, sys, time',
+        'start = time.perf_counter()',
+        'import ' + ', '.join(modules),
+        'elapsed = time.perf_counter() - start',
+        'heavy = [name for name in {0} if name in sys.modules]'.format(repr(HEAVY_MODULES)),
+        'print(json.dumps({"seconds": elapsed, "heavy_modules": heavy}))',
+    ])
+    # Run from the directory of the modules so they import wherever the benchmark is started from
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+# Returns true if the simulation core starts without ML modules and within the time budget
+def check_startup():
+    result = benchmark_startup()
+    print('Startup: {0:.3f}s heavy modules: {1}'.format(result['seconds'], result['heavy_modules']))
+    if len(result['heavy_modules']) > 0:
+        print('Simulation modules import {0}'.format(', '.join(result['heavy_modules'])))
+        return False
+    if result['seconds'] > constants.STARTUP_TIME_BUDGET:
+        print('Startup exceeded budget of {0}s'.format(constants.STARTUP_TIME_BUDGET))
+        return False
+    return True
+
+if __name__ == '__main__':
+    sys.exit(0 if check_startup() else 1)
@@ -13,8 +13,7 @@ class Character:
         self.primary_class_id = ""
         for class_uid in class_uids:
             self.__add_level(class_uid)
-        self.__compute_max_health()
-        self.__compute_base_init()
+        self.__compute_stats()
             
     def __add_level(self, class_uid):
         if class_uid in self.class_levels:
@@ -26,26 +25,27 @@ class Character:
 
     def gain_level(self, class_uid):
         self.__add_level(class_uid)
-        self.__compute_max_health()
-        self.__compute_base_init()
+        self.__compute_stats()
 
-    def __compute_max_health(self):
-        total_health = 0
-        for class_id in self.class_levels:
-            class_level = self.class_levels[class_id]
-            class_data = self.game_data.get_row(SheetId.Classes, class_id)
-            total_health += class_data.health * class_level
-        self.max_health = total_health
+    def __compute_stats(self):
+        self.max_health, self.base_init = get_character_stats(self.game_data, self.class_levels)
 
-    def __compute_base_init(self):
-        if len(self.class_levels) <= 0:
-            self.base_init = 0
-            return
-        total_init = 0
-        total_levels = 0
-        for class_id in self.class_levels:
-            class_level = self.class_levels[class_id]
-            class_data = self.game_data.get_row(SheetId.Classes, class_id)
-            total_init += class_data.init * class_level
-            total_levels += class_level
-        self.base_init = total_init / total_levels
+# Max health and base init of a Character with the class levels.
+# Cached in the Game Data since every Character with the same levels has the same stats
+def get_character_stats(game_data, class_levels):
+    key = ('character', tuple(sorted(class_levels.items())))
+    stats = game_data.templates.get(key)
+    if stats is not None:
+        return stats
+
+    total_health = 0
+    total_init = 0
+    total_levels = 0
+    for class_id, class_level in key[1]:
+        class_data = game_data.get_row(SheetId.Classes, class_id)
+        total_health += class_data.health * class_level
+        total_init += class_data.init * class_level
+        total_levels += class_level
+    stats = (total_health, total_init / total_levels if total_levels > 0 else 0)
+    game_data.templates[key] = stats
+    return stats
@@ -0,0 +1,116 @@
+import copy
+import os
+import random
+import threading
+import warnings
+import numpy as np
+import torch
+
+# Copy everything needed to continue training a Learning Agent.
+# Tensors are cloned so the training loop can keep mutating the live model while the copy is written.
+def capture_training_state(agent, episode):
+    learner = agent.learner
+    state = {}
+    state['episode'] = episode
+    state['model'] = {key: value.detach().clone() for key, value in learner.model.state_dict().items()}
+    state['optimizer'] = copy.deepcopy(learner.optimizer.state_dict())
+    state['num_updates'] = learner.num_updates
+    state['epsilon'] = agent.epsilon
+    state['rho'] = agent.rho
+    state['random_state'] = random.getstate()
+    state['numpy_random_state'] = np.random.get_state()
+    state['torch_random_state'] = torch.get_rng_state()
+    return state
+
+# Load a captured state back into a Learning Agent. Returns the episode the training should continue from
+def restore_training_state(agent, state):
+    learner = agent.learner
+    learner.model.load_state_dict(state['model'])
+    learner.optimizer.load_state_dict(state['optimizer'])
+    learner.num_updates = state['num_updates']
+    agent.epsilon = state['epsilon']
+    agent.rho = state['rho']
+    random.setstate(state['random_state'])
+    np.random.set_state(state['numpy_random_state'])
+    torch.set_rng_state(state['torch_random_state'])
+    return state['episode'] + 1
+
+"""
+Periodically saves training state to disk without stalling the training loop.
+Snapshots are handed to a background thread which serializes them and atomically replaces the checkpoint file.
+If the thread is still busy, only the most recent pending snapshot is kept.
+The previous checkpoint is kept next to the latest one as a fallback when resuming.
+"""
+class Checkpointer:
+    def __init__(self, filename):
+        self.filename = filename
+        self.previous_filename = filename + '.prev'
+        self.temp_filename = filename + '.tmp'
+        self.condition = threading.Condition()
+        self.pending = None
+        self.is_writing = False
+        self.is_closed = False
+        self.num_written = 0
+        self.thread = threading.Thread(target=self.run, name='checkpointer', daemon=True)
+        self.thread.start()
+
+    # Queue a snapshot of the agent to be written. Returns immediately
+    def save(self, agent, episode):
+        state = capture_training_state(agent, episode)
+        with self.condition:
+            if self.is_closed:
+                warnings.warn('Checkpointer is closed - dropping checkpoint for episode {0}'.format(episode))
+                return
+            self.pending = state
+            self.condition.notify_all()
+
+    # Block until every queued snapshot has been written
+    def flush(self):
+        with self.condition:
+            while self.pending is not None or self.is_writing:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.is_closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.is_closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                state = self.pending
+                self.pending = None
+                self.is_writing = True
+            try:
+                self.write(state)
+            except Exception as ex:
+                warnings.warn('Unable to write checkpoint {0}: {1}'.format(self.filename, ex))
+            with self.condition:
+                self.is_writing = False
+                self.condition.notify_all()
+
+    def write(self, state):
+        with open(self.temp_filename, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(self.filename):
+            os.replace(self.filename, self.previous_filename)
+        os.replace(self.temp_filename, self.filename)
+        self.num_written += 1
+
+    # Load the last good checkpoint, falling back to the previous one if the latest is unreadable
+    def load(self):
+        for filename in [self.filename, self.previous_filename]:
+            if not os.path.exists(filename):
+                continue
+            try:
+                return torch.load(filename, weights_only=False)
+            except Exception as ex:
+                warnings.warn('Unable to read checkpoint {0}: {1}'.format(filename, ex))
+        return None
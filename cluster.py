@@ -0,0 +1,479 @@
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+import constants
+from game_data import *
+from balance_service import init_service_worker, run_matchup_chunk, get_win_rate
+from paired_simulation import get_variance
+
+# Version of the job state files written by write_job_state
+CLUSTER_STATE_VERSION = 1
+
+# Runs of consecutive true flags as [start, stop) pairs, i.e. the finished chunks of a job in a few numbers
+def get_flag_runs(flags):
+    runs = []
+    start_i = None
+    for i, flag in enumerate(flags):
+        if flag and start_i is None:
+            start_i = i
+        elif not flag and start_i is not None:
+            runs.append([start_i, i])
+            start_i = None
+    if start_i is not None:
+        runs.append([start_i, len(flags)])
+    return runs
+
+"""
+Simulation job split into chunks of one matchup and a range of its episodes.
+A chunk is leased to one worker at a time. It goes back to the pending chunks when its worker disconnects,
+and once its lease expires it may be leased to another worker, up to max_copies workers at the same time,
+so a slow or hung worker can't hold up the job. Only workers which disconnect or fail while holding a chunk count
+as failed attempts, so a chunk which is slow but healthy never aborts the job.
+Every chunk is merged exactly once, from whichever worker finishes it first, and the aggregates are integer
+counts, so the merged results don't depend on which workers played which chunks or in which order.
+"""
+class ClusterJob:
+    def __init__(self, matchups, episodes, seed, chunk_episodes=constants.CLUSTER_CHUNK_EPISODES,
+                 lease_seconds=constants.CLUSTER_LEASE_SECONDS, max_attempts=constants.CLUSTER_MAX_ATTEMPTS,
+                 max_copies=constants.CLUSTER_MAX_COPIES):
+        # matchups is a list of (index, matchup) where a matchup is a scenario name or a normalized matchup
+        self.matchups = matchups
+        self.episodes = episodes
+        self.seed = seed
+        self.chunk_episodes = chunk_episodes
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_copies = max_copies
+        self.chunks = []
+        for position in range(len(matchups)):
+            for start_i in range(0, episodes, chunk_episodes):
+                self.chunks.append((position, start_i, min(start_i + chunk_episodes, episodes)))
+        self.pending = deque(range(len(self.chunks)))
+        # Leases of the unfinished chunks, chunk id to a dict of worker id to lease expiry
+        self.leases = {}
+        # Workers which went away or failed while holding each chunk
+        self.failures = [0] * len(self.chunks)
+        self.is_done = [False] * len(self.chunks)
+        self.num_done = 0
+        self.num_duplicates = 0
+        self.num_reassigned = 0
+        self.results = [{'episodes': 0, 'wins': {}, 'total_turns': 0, 'turn_squares': 0} for _ in matchups]
+        self.remaining_chunks = [0] * len(matchups)
+        for position, start_i, end_i in self.chunks:
+            self.remaining_chunks[position] += 1
+
+    def is_finished(self):
+        return self.num_done >= len(self.chunks)
+
+    # Identifies the chunks of the job, so a state file is only restored into the job it was written for
+    def get_job_hash(self, ruleset_hash):
+        return hash_raw([ruleset_hash, self.matchups, self.episodes, self.seed, self.chunk_episodes])
+
+    # Finished chunks and the aggregates merged from them. Every aggregate is an integer, so a restored job
+    # finishes with exactly the results it would have had without the interruption
+    def get_state(self, ruleset_hash):
+        state = {}
+        state['version'] = CLUSTER_STATE_VERSION
+        state['job'] = self.get_job_hash(ruleset_hash)
+        state['done'] = get_flag_runs(self.is_done)
+        state['results'] = [{'episodes': result['episodes'], 'wins': dict(result['wins']), 'total_turns': result['total_turns'],
+                             'turn_squares': result['turn_squares']} for result in self.results]
+        return state
+
+    # Skip the chunks finished in the state. Returns the positions of the matchups which are already complete
+    def restore_state(self, state, ruleset_hash):
+        if state.get('version') != CLUSTER_STATE_VERSION:
+            raise ValueError('Unsupported job state version: {0}'.format(state.get('version')))
+        if state.get('job') != self.get_job_hash(ruleset_hash):
+            raise ValueError('Job state was written for a different job or ruleset')
+        for start_i, end_i in state['done']:
+            for chunk_id in range(start_i, end_i):
+                self.is_done[chunk_id] = True
+        self.num_done = sum(self.is_done)
+        self.pending = deque([chunk_id for chunk_id in range(len(self.chunks)) if not self.is_done[chunk_id]])
+        self.remaining_chunks = [0] * len(self.matchups)
+        for chunk_id, (position, start_i, end_i) in enumerate(self.chunks):
+            if not self.is_done[chunk_id]:
+                self.remaining_chunks[position] += 1
+        self.results = state['results']
+        return [position for position in range(len(self.matchups)) if self.remaining_chunks[position] == 0]
+
+    # Lease a chunk to the worker, or return None if every unfinished chunk is leased and none can be copied,
+    # i.e. its leases haven't expired or it already runs on max_copies workers
+    def assign(self, worker_id, now):
+        chunk_id = None
+        if len(self.pending) > 0:
+            chunk_id = self.pending.popleft()
+        else:
+            oldest_expiry = None
+            for leased_chunk_id, chunk_leases in self.leases.items():
+                if worker_id in chunk_leases or len(chunk_leases) >= self.max_copies:
+                    continue
+                expiry = max(chunk_leases.values())
+                if expiry <= now and (oldest_expiry is None or expiry < oldest_expiry):
+                    chunk_id = leased_chunk_id
+                    oldest_expiry = expiry
+            if chunk_id is None:
+                return None
+            self.num_reassigned += 1
+        self.leases.setdefault(chunk_id, {})[worker_id] = now + self.lease_seconds
+        return chunk_id
+
+    # Seconds until the next lease which can be copied expires, or None if there is none
+    def get_next_expiry(self, now):
+        expiries = [max(chunk_leases.values()) for chunk_leases in self.leases.values() if len(chunk_leases) < self.max_copies]
+        if len(expiries) == 0:
+            return None
+        return max(min(expiries) - now, 0.0)
+
+    # Give back the chunks leased to a worker which went away or failed. Each counts as a failed attempt of the chunk.
+    # Raises ValueError once a chunk failed on too many workers, i.e. it crashes every worker playing it
+    def release(self, worker_id):
+        failed_chunk_id = None
+        for chunk_id in list(self.leases):
+            chunk_leases = self.leases[chunk_id]
+            if worker_id not in chunk_leases:
+                continue
+            del chunk_leases[worker_id]
+            if len(chunk_leases) == 0:
+                del self.leases[chunk_id]
+                self.pending.appendleft(chunk_id)
+            self.failures[chunk_id] += 1
+            if self.failures[chunk_id] >= self.max_attempts:
+                failed_chunk_id = chunk_id
+        if failed_chunk_id is not None:
+            raise ValueError('Chunk {0} failed on {1} workers'.format(failed_chunk_id, self.max_attempts))
+
+    # Merge the result of a chunk. Returns the position of its matchup if this was the matchup's last chunk
+    def complete(self, chunk_id, chunk):
+        if chunk_id < 0 or chunk_id >= len(self.chunks):
+            raise ValueError('Unknown chunk: {0}'.format(chunk_id))
+        if self.is_done[chunk_id]:
+            self.num_duplicates += 1
+            return None
+        position, start_i, end_i = self.chunks[chunk_id]
+        if chunk['episodes'] != end_i - start_i:
+            raise ValueError('Chunk {0} has {1} episodes instead of {2}'.format(chunk_id, chunk['episodes'], end_i - start_i))
+        self.is_done[chunk_id] = True
+        self.num_done += 1
+        self.leases.pop(chunk_id, None)
+        if chunk_id in self.pending:
+            self.pending.remove(chunk_id)
+        result = self.results[position]
+        result['episodes'] += chunk['episodes']
+        for winner in chunk['wins']:
+            result['wins'][winner] = result['wins'].get(winner, 0) + chunk['wins'][winner]
+        result['total_turns'] += chunk['total_turns']
+        result['turn_squares'] += chunk['turn_squares']
+        self.remaining_chunks[position] -= 1
+        if self.remaining_chunks[position] == 0:
+            return position
+        return None
+
+    def get_message(self, chunk_id):
+        position, start_i, end_i = self.chunks[chunk_id]
+        message = {}
+        message['type'] = 'chunk'
+        message['chunk'] = chunk_id
+        message['matchup'] = self.matchups[position][1]
+        message['start'] = start_i
+        message['end'] = end_i
+        message['seed'] = self.seed
+        return message
+
+    def get_matchup_summary(self, position):
+        index, matchup = self.matchups[position]
+        result = self.results[position]
+        win_rate, margin = get_win_rate(result['wins'], Team.BLUE.name, result['episodes'])
+        summary = {}
+        summary['index'] = index
+        summary['matchup'] = matchup
+        summary['seed'] = self.seed
+        summary['episodes'] = result['episodes']
+        summary['wins'] = dict(sorted(result['wins'].items()))
+        summary['blue_win_rate'] = win_rate
+        summary['blue_win_rate_margin'] = margin
+        summary['mean_turns'] = result['total_turns'] / result['episodes'] if result['episodes'] > 0 else 0
+        summary['turns_deviation'] = math.sqrt(get_variance(result['episodes'], result['total_turns'], result['turn_squares']))
+        return summary
+
+# Atomically replace the job state file, keeping the previous one as a fallback
+def write_job_state(filename, state):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(filename):
+        os.replace(filename, filename + '.prev')
+    os.replace(temp_filename, filename)
+
+# Load the last readable job state, or None if there is none
+def load_job_state(filename):
+    for state_filename in [filename, filename + '.prev']:
+        if not os.path.exists(state_filename):
+            continue
+        try:
+            with open(state_filename) as f:
+                return json.load(f)
+        except ValueError as ex:
+            print('Unable to read job state {0}: {1}'.format(state_filename, ex), file=sys.stderr)
+    return None
+
+"""
+Coordinator of a simulation job played by worker agents connecting over TCP, possibly from other hosts.
+The protocol is line-delimited JSON. A worker opens with {"type": "hello", "worker": name, "ruleset": hash} and
+gets {"type": "chunk", ...} assignments, answering each with {"type": "result", "chunk": id, "result": {...}}
+(see run_matchup_chunk), until it gets {"type": "done"}. Workers with a different ruleset are turned away
+with {"type": "error", ...} so every chunk of a job plays by the same rules.
+The summary of every matchup is written to the output as one JSON line with sorted keys as soon as its last chunk is merged,
+so the output of a job does not depend on the order its chunks were played in.
+With a state file, the finished chunks and their aggregates are saved at intervals and a restarted coordinator
+continues from them, writing the summaries of the matchups finished before the restart first.
+"""
+class ClusterCoordinator:
+    def __init__(self, game_data, job, output=None, host=constants.CLUSTER_HOST, port=constants.CLUSTER_PORT, progress=False,
+                 state_filename=None, state_interval=constants.CLUSTER_STATE_INTERVAL):
+        self.game_data = game_data
+        self.job = job
+        self.output = output
+        self.host = host
+        self.port = port
+        self.progress = progress
+        self.state_filename = state_filename
+        self.state_interval = state_interval
+        # Number of finished chunks in the last state written
+        self.num_saved = None
+        self.state_task = None
+        # Held while the state file is written, so a write cancelled on the loop can't overlap the final one
+        self.state_lock = threading.Lock()
+        self.server = None
+        self.changed = None
+        self.finished = None
+        self.error = None
+        self.num_workers = 0
+        self.worker_chunks = {}
+        self.client_tasks = set()
+
+    async def start(self):
+        self.changed = asyncio.Condition()
+        self.finished = asyncio.Event()
+        if self.state_filename is not None:
+            self.restore()
+            self.state_task = asyncio.create_task(self.run_state_writer())
+        if self.job.is_finished():
+            self.finished.set()
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        # Port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            for task in list(self.client_tasks):
+                task.cancel()
+            if len(self.client_tasks) > 0:
+                await asyncio.gather(*self.client_tasks, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if self.state_task is not None:
+            self.state_task.cancel()
+            await asyncio.gather(self.state_task, return_exceptions=True)
+            self.state_task = None
+            await self.save()
+
+    # Continue from the state file if there is one. Raises ValueError if it belongs to another job
+    def restore(self):
+        state = load_job_state(self.state_filename)
+        if state is None:
+            return
+        for position in self.job.restore_state(state, self.game_data.ruleset_hash):
+            self.write_matchup_summary(position)
+        self.num_saved = self.job.num_done
+        print('Resumed with {0}/{1} chunks finished'.format(self.job.num_done, len(self.job.chunks)), file=sys.stderr, flush=True)
+
+    # Write the state if chunks finished since the last write. The file is written off the event loop
+    async def save(self):
+        if self.num_saved == self.job.num_done:
+            return
+        num_done = self.job.num_done
+        await asyncio.to_thread(self.write_state, self.job.get_state(self.game_data.ruleset_hash))
+        self.num_saved = num_done
+
+    def write_state(self, state):
+        with self.state_lock:
+            write_job_state(self.state_filename, state)
+
+    async def run_state_writer(self):
+        while True:
+            await asyncio.sleep(self.state_interval)
+            try:
+                await self.save()
+            except OSError as ex:
+                print('Unable to write job state {0}: {1}'.format(self.state_filename, ex), file=sys.stderr, flush=True)
+
+    # Serve workers until every chunk is merged. Raises ValueError if the job failed
+    async def run(self):
+        await self.start()
+        print('Coordinator listening on {0}:{1} with {2} chunks'.format(self.host, self.port, len(self.job.chunks)),
+              file=sys.stderr, flush=True)
+        try:
+            await self.finished.wait()
+        finally:
+            await self.stop()
+        if self.error is not None:
+            raise ValueError(self.error)
+        return self.get_summary()
+
+    def get_summary(self):
+        summary = {}
+        summary['matchups'] = len(self.job.matchups)
+        summary['chunks'] = len(self.job.chunks)
+        summary['workers'] = self.num_workers
+        summary['reassigned'] = self.job.num_reassigned
+        summary['duplicates'] = self.job.num_duplicates
+        summary['worker_chunks'] = dict(self.worker_chunks)
+        return summary
+
+    def write_matchup_summary(self, position):
+        if self.output is not None:
+            self.output.write(json.dumps(self.job.get_matchup_summary(position), sort_keys=True) + '\n')
+            self.output.flush()
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    # Wait for a chunk the worker can play. Returns None once the job is finished
+    async def get_assignment(self, worker_id):
+        while True:
+            if self.job.is_finished() or self.error is not None:
+                return None
+            now = time.monotonic()
+            chunk_id = self.job.assign(worker_id, now)
+            if chunk_id is not None:
+                return chunk_id
+            timeout = self.job.get_next_expiry(now)
+            async with self.changed:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def fail(self, error):
+        self.error = error
+        self.finished.set()
+
+    def merge(self, worker_id, chunk_id, chunk):
+        position = self.job.complete(chunk_id, chunk)
+        self.worker_chunks[worker_id] = self.worker_chunks.get(worker_id, 0) + 1
+        if position is not None:
+            self.write_matchup_summary(position)
+        if self.progress:
+            print('{0}/{1} chunks'.format(self.job.num_done, len(self.job.chunks)), file=sys.stderr, flush=True)
+        if self.job.is_finished():
+            self.finished.set()
+
+    async def send(self, writer, message):
+        writer.write((json.dumps(message) + '\n').encode('utf-8'))
+        await writer.drain()
+
+    async def handle_client(self, reader, writer):
+        client_task = asyncio.current_task()
+        self.client_tasks.add(client_task)
+        self.num_workers += 1
+        connection_number = self.num_workers
+        worker_id = None
+        try:
+            line = await reader.readline()
+            hello = json.loads(line) if line else None
+            if not isinstance(hello, dict) or hello.get('type') != 'hello':
+                await self.send(writer, {'type': 'error', 'message': 'Expected hello'})
+                return
+            if hello.get('ruleset') != self.game_data.ruleset_hash:
+                await self.send(writer, {'type': 'error', 'message': 'Ruleset {0} differs from {1}'.format(
+                    hello.get('ruleset'), self.game_data.ruleset_hash)})
+                return
+            worker_id = '{0}#{1}'.format(hello.get('worker'), connection_number)
+            while True:
+                chunk_id = await self.get_assignment(worker_id)
+                if chunk_id is None:
+                    await self.send(writer, {'type': 'done'})
+                    return
+                await self.send(writer, self.job.get_message(chunk_id))
+                line = await reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+                if message.get('type') != 'result' or message.get('chunk') != chunk_id:
+                    await self.send(writer, {'type': 'error', 'message': 'Expected the result of chunk {0}'.format(chunk_id)})
+                    return
+                self.merge(worker_id, chunk_id, message['result'])
+                await self.notify()
+        except (ConnectionError, ValueError, KeyError, asyncio.CancelledError):
+            # The worker went away, broke the protocol or the coordinator is stopping
+            pass
+        finally:
+            if worker_id is not None:
+                try:
+                    self.job.release(worker_id)
+                except ValueError as ex:
+                    self.fail(str(ex))
+                await self.notify()
+            writer.close()
+            self.client_tasks.discard(client_task)
+
+def run_cluster_coordinator(game_data, matchups, episodes, seed, output, host=constants.CLUSTER_HOST, port=constants.CLUSTER_PORT,
+                            chunk_episodes=constants.CLUSTER_CHUNK_EPISODES, progress=False, state_filename=None):
+    job = ClusterJob(matchups, episodes, seed, chunk_episodes)
+    coordinator = ClusterCoordinator(game_data, job, output, host, port, progress, state_filename)
+    return asyncio.run(coordinator.run())
+
+# Connect to the coordinator, retrying while it isn't listening yet
+def connect_coordinator(host, port, timeout=constants.CLUSTER_CONNECT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(constants.CLUSTER_CONNECT_INTERVAL)
+
+# Play the chunks the coordinator assigns until it has none left. Returns the number of chunks played
+def run_cluster_worker(data_filename, host=constants.CLUSTER_HOST, port=constants.CLUSTER_PORT, name=None):
+    init_service_worker(data_filename, False)
+    game_data = GameData(data_filename)
+    if name is None:
+        name = '{0}:{1}'.format(socket.gethostname(), multiprocessing.current_process().pid)
+    num_chunks = 0
+    with connect_coordinator(host, port) as connection:
+        with connection.makefile('rw', encoding='utf-8') as lines:
+            lines.write(json.dumps({'type': 'hello', 'worker': name, 'ruleset': game_data.ruleset_hash}) + '\n')
+            lines.flush()
+            for line in lines:
+                message = json.loads(line)
+                if message['type'] == 'error':
+                    raise ValueError(message['message'])
+                if message['type'] != 'chunk':
+                    break
+                matchup_key = json.dumps(message['matchup'], sort_keys=True)
+                chunk = run_matchup_chunk(matchup_key, message['matchup'], message['start'], message['end'], message['seed'])
+                lines.write(json.dumps({'type': 'result', 'chunk': message['chunk'], 'result': chunk}) + '\n')
+                lines.flush()
+                num_chunks += 1
+    return num_chunks
+
+# Run worker agents in separate processes of this host, e.g. one per core
+def run_cluster_workers(data_filename, num_workers, host=constants.CLUSTER_HOST, port=constants.CLUSTER_PORT):
+    if num_workers <= 1:
+        return run_cluster_worker(data_filename, host, port)
+    with multiprocessing.get_context('spawn').Pool(num_workers) as pool:
+        return sum(pool.starmap(run_cluster_worker, [(data_filename, host, port)] * num_workers))
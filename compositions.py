@@ -0,0 +1,150 @@
+import itertools
+import json
+from game_data import *
+from targetable import *
+
+# Range of item indices [start, stop) of the shard when num_items are split across num_shards
+def get_shard_range(num_items, shard_index, num_shards):
+    if num_shards <= 0 or shard_index < 0 or shard_index >= num_shards:
+        raise ValueError('Invalid shard {0}/{1}'.format(shard_index, num_shards))
+    return num_items * shard_index // num_shards, num_items * (shard_index + 1) // num_shards
+
+"""
+Every team of team_size units which can be built from the Classes, in a canonical order without duplicates.
+Each team spends exactly level_budget class levels and every unit has at least one level. Units are at one of
+the locations and their classes may be restricted to the given tiers.
+A unit is a multiset of classes and a location, and a team is a multiset of units, so teams which only differ by
+the order of their units or of a unit's classes are the same team. Teams are ranked: the number of teams and the
+team at any index are computed from counts of partial teams, so ranges of teams and matchups can be iterated
+from any index without building the teams before them. Teams and matchups use the normalized matchup layout
+of scenarios.py and can be played with create_scenario_battle.
+"""
+class CompositionSpace:
+    def __init__(self, game_data, team_size, level_budget, locations=[Location.FRONT.name, Location.BACK.name],
+                 tiers=None, max_unit_levels=None):
+        if team_size <= 0 or level_budget < team_size:
+            raise ValueError('A team of {0} units can\'t spend {1} levels'.format(team_size, level_budget))
+        self.team_size = team_size
+        self.level_budget = level_budget
+        if max_unit_levels is None:
+            max_unit_levels = level_budget - team_size + 1
+        max_unit_levels = min(max_unit_levels, level_budget - team_size + 1)
+
+        classes = game_data.get_sheet(SheetId.Classes)
+        class_ids = sorted([class_id for class_id in classes if tiers is None or classes[class_id].tier in tiers])
+        locations = sorted(set(locations), key=lambda location: Location[location].value)
+        # Unit types ordered by levels, so the types which fit in the levels left are always the first ones
+        self.unit_types = []
+        for num_levels in range(1, max_unit_levels + 1):
+            for unit_classes in itertools.combinations_with_replacement(class_ids, num_levels):
+                for location in locations:
+                    self.unit_types.append((unit_classes, location))
+        self.unit_levels = [len(unit_classes) for unit_classes, location in self.unit_types]
+
+        # counts[x][s][l] is the number of multisets of s unit types of index x or above spending l levels
+        num_types = len(self.unit_types)
+        self.counts = [None] * (num_types + 1)
+        self.counts[num_types] = [[1 if s == 0 and l == 0 else 0 for l in range(level_budget + 1)] for s in range(team_size + 1)]
+        for x in range(num_types - 1, -1, -1):
+            above = self.counts[x + 1]
+            levels = self.unit_levels[x]
+            table = [list(above[s]) for s in range(team_size + 1)]
+            for s in range(1, team_size + 1):
+                for l in range(levels, level_budget + 1):
+                    table[s][l] += table[s - 1][l - levels]
+            self.counts[x] = table
+        self.num_teams = self.counts[0][team_size][level_budget]
+
+    def get_num_matchups(self, ordered=False):
+        if ordered:
+            return self.num_teams * self.num_teams
+        return self.num_teams * (self.num_teams + 1) // 2
+
+    def get_unit(self, type_index):
+        unit_classes, location = self.unit_types[type_index]
+        return {'classes': list(unit_classes), 'location': location}
+
+    # Units of the team in a stable order, front units first
+    def get_team_units(self, type_indices):
+        type_indices = sorted(type_indices, key=lambda x: (-Location[self.unit_types[x][1]].value, self.unit_types[x][0]))
+        return [self.get_unit(x) for x in type_indices]
+
+    # Type indices of the teams from index start on, each team's in non-decreasing order. Whole ranges
+    # of teams before start are skipped by their count
+    def iterate_team_types(self, start=0):
+        def walk(prefix, first_type, num_units, num_levels, skip):
+            if num_units == 0:
+                yield prefix
+                return
+            for x in range(first_type, len(self.unit_types)):
+                if self.unit_levels[x] > num_levels:
+                    break
+                count = self.counts[x][num_units - 1][num_levels - self.unit_levels[x]]
+                if count <= 0:
+                    continue
+                if skip >= count:
+                    skip -= count
+                    continue
+                yield from walk(prefix + [x], x, num_units - 1, num_levels - self.unit_levels[x], skip)
+                skip = 0
+
+        if start >= self.num_teams:
+            return
+        yield from walk([], 0, self.team_size, self.level_budget, start)
+
+    # Yields (index, team) for the teams from start up to stop (exclusive)
+    def iterate_teams(self, start=0, stop=None):
+        stop = self.num_teams if stop is None else min(stop, self.num_teams)
+        index = start
+        for type_indices in self.iterate_team_types(start):
+            if index >= stop:
+                return
+            yield index, self.get_team_units(type_indices)
+            index += 1
+
+    def get_team(self, index):
+        if index < 0 or index >= self.num_teams:
+            raise IndexError('Team index {0} out of range'.format(index))
+        return next(self.iterate_teams(index, index + 1))[1]
+
+    # Teams of the matchup at the index. Unordered matchups only pair a team with itself and the teams after it
+    def get_matchup_teams(self, index, ordered=False):
+        if ordered:
+            return divmod(index, self.num_teams)
+        # Largest blue team index whose row of matchups starts at or before the index
+        low = 0
+        high = self.num_teams - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if middle * self.num_teams - middle * (middle - 1) // 2 <= index:
+                low = middle
+            else:
+                high = middle - 1
+        row_start = low * self.num_teams - low * (low - 1) // 2
+        return low, low + index - row_start
+
+    # Yields (index, matchup) for the matchups from start up to stop (exclusive).
+    # Unordered matchups don't repeat a pair of teams with blue and red swapped
+    def iterate_matchups(self, start=0, stop=None, ordered=False):
+        num_matchups = self.get_num_matchups(ordered)
+        stop = num_matchups if stop is None else min(stop, num_matchups)
+        index = start
+        while index < stop:
+            blue_index, red_index = self.get_matchup_teams(index, ordered)
+            blue_team = self.get_team(blue_index)
+            for red_team_index, red_team in self.iterate_teams(red_index, stop=self.num_teams):
+                if index >= stop:
+                    return
+                yield index, {'blue': blue_team, 'red': red_team}
+                index += 1
+
+# Write the teams or matchups of a shard as JSON lines
+def write_compositions(output, composition_space, matchups=False, ordered=False, shard_index=0, num_shards=1):
+    num_items = composition_space.get_num_matchups(ordered) if matchups else composition_space.num_teams
+    start, stop = get_shard_range(num_items, shard_index, num_shards)
+    items = composition_space.iterate_matchups(start, stop, ordered) if matchups else composition_space.iterate_teams(start, stop)
+    num_written = 0
+    for index, item in items:
+        output.write(json.dumps({'index': index, 'matchup' if matchups else 'team': item}) + '\n')
+        num_written += 1
+    return num_items, num_written
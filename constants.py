@@ -11,6 +11,14 @@ DEFAULT_RHO = 0.0
 # Number of accepted invalid actions from the Player before the battle terminates
 # This is to prevent the Learning Agent from indefinitely exploring invalid routes
 INVALID_ACTION_LIMIT = 10000
+# Number of invalid actions in a row, without a valid one between them, before the battle terminates.
+# A player whose choices keep failing in the same state is stuck, so this cuts the battle long before INVALID_ACTION_LIMIT
+INVALID_ACTION_STREAK_LIMIT = 100
+# Number of whole rounds in a row in which no unit's health changes and no unit rolls a face which can lower health
+# before the battle ends in a stalemate
+STALEMATE_ROUNDS = 10
+# Turns a status lasts if its ability doesn't say, i.e. BUFF X
+STATUS_DEFAULT_TURNS = 2
 # Reward for every step the Learning Agent takes. This is primarily to prevent the agent from stalling
 REWARD_AMOUNT_STEP_PENALTY = -1
 # Reward for the Learning Agent winning a Battle
@@ -24,4 +32,101 @@ REWARD_SCORE_PLAYER_UNIT_HEALTH = 5000
 # Score for player unit's health not being 0. This is averaged across all player units
 REWARD_SCORE_ENEMY_UNIT_SURVIVING = -5000
 # Score for player unit being healthy multiplied by its percent health. This is averaged across all player units
-REWARD_SCORE_ENEMY_UNIT_HEALTH = -5000
\ No newline at end of file
+REWARD_SCORE_ENEMY_UNIT_HEALTH = -5000
+# Learning rate of the Learning Agent's optimizer
+DEFAULT_LEARNING_RATE = 3e-2
+# Number of episodes collected before the Learning Agent updates its Policy. 0 disables this threshold
+DEFAULT_UPDATE_EPISODES = 1
+# Number of steps collected before the Learning Agent updates its Policy. 0 disables this threshold
+# Updates only happen once an episode is finished
+DEFAULT_UPDATE_STEPS = 0
+# Number of passes over the collected batch for every update
+DEFAULT_UPDATE_EPOCHS = 1
+# Most the probability of an action may change relative to the Policy which sampled it, on epochs after the first
+POLICY_CLIP = 0.2
+# Number of training episodes between saved checkpoints
+CHECKPOINT_INTERVAL = 100
+# Number of steps in each trajectory chunk an actor sends to the learner
+ACTOR_CHUNK_LENGTH = 32
+# Number of trajectory chunks the learner trains on at once
+ACTOR_BATCH_SIZE = 8
+# Seconds the learner waits for a full chunk before checking that every actor is still running
+ACTOR_QUEUE_TIMEOUT = 5
+# Seconds an actor waits before reading the shared weights again while the learner is writing them
+SHARED_POLICY_RETRY_SECONDS = 0.0001
+# Scale applied to rewards by the actor-learner. Keeps the large win/loss rewards in a trainable range
+ACTOR_LEARNER_REWARD_SCALE = 1e-4
+# Truncation of the importance weights used by V-trace when correcting for actors lagging the learner
+VTRACE_RHO_BAR = 1.0
+VTRACE_C_BAR = 1.0
+# Seconds the simulation modules may take to import in a fresh interpreter
+STARTUP_TIME_BUDGET = 0.5
+# Number of episodes handed to a simulation worker at once
+SIMULATION_CHUNK_SIZE = 16
+# Number of episodes between progress reports of long running commands
+PROGRESS_INTERVAL = 100
+# Number of episode records buffered before they are written to a results file
+RESULTS_BLOCK_RECORDS = 4096
+# Number of sides and areas which can be targeted by index, see Battle.get_target_by_index
+NUM_SIDE_TARGETS = 2
+NUM_AREA_TARGETS = 4
+# Seconds between checks of a watched data file for changes
+DATA_WATCH_INTERVAL = 1.0
+# Address the balance service listens on. It only serves the local machine by default
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+# Episodes simulated per task of the balance service. A partial estimate is streamed after each task
+SERVICE_CHUNK_EPISODES = 100
+# Episodes simulated for a query which doesn't ask for a number
+SERVICE_DEFAULT_EPISODES = 1000
+# Most episodes a single query may ask for
+SERVICE_MAX_EPISODES = 1000000
+# Number of completed query results kept in memory
+SERVICE_CACHE_SIZE = 256
+# z score of the confidence interval reported around win rates, 1.96 for 95%
+WIN_RATE_CONFIDENCE_Z = 1.96
+# Address the game server listens on
+GAME_SERVER_HOST = '127.0.0.1'
+GAME_SERVER_PORT = 8766
+# Seconds without commands after which a session's battle is packed into its compact encoding
+SESSION_IDLE_SECONDS = 60
+# Seconds without commands after which a session is dropped
+SESSION_EXPIRE_SECONDS = 3600
+# Seconds between sweeps of idle and expired sessions
+SESSION_SWEEP_INTERVAL = 10
+# Seconds a SearchPlayer may think about each decision
+SEARCH_DEFAULT_BUDGET = 0.05
+# Exploration constant of the UCB1 choice between candidate actions
+SEARCH_EXPLORATION = 1.4
+# Turns a rollout is played for before the battle is scored by remaining health
+SEARCH_ROLLOUT_TURNS = 30
+# Seconds between exports of the metrics registry
+METRICS_EXPORT_INTERVAL = 10
+# Upper bounds of the histogram buckets of the metrics registry
+METRICS_TURN_BUCKETS = [5, 10, 20, 30, 50, 75, TURN_LIMIT]
+METRICS_INVALID_ACTION_BUCKETS = [0, 1, 10, 100, 1000, INVALID_ACTION_LIMIT]
+METRICS_REWARD_BUCKETS = [REWARD_AMOUNT_LOSS, -1000, -100, 0, 100, 1000, REWARD_AMOUNT_WIN]
+METRICS_SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+# Episodes an actor plays between sending its metrics to the learner
+METRICS_WORKER_EPISODES = 50
+# Address the cluster coordinator listens on. Use 0.0.0.0 to accept workers from other hosts
+CLUSTER_HOST = '127.0.0.1'
+CLUSTER_PORT = 8767
+# Episodes of one matchup in each chunk the coordinator assigns
+CLUSTER_CHUNK_EPISODES = 200
+# Seconds a worker may hold a chunk before it is also assigned to another worker
+CLUSTER_LEASE_SECONDS = 60
+# Most workers which may play a chunk at the same time, counting slow ones whose lease expired
+CLUSTER_MAX_COPIES = 2
+# Most workers which may disconnect or fail while playing a chunk before the job is given up
+CLUSTER_MAX_ATTEMPTS = 5
+# Seconds a worker keeps trying to reach the coordinator, and between tries
+CLUSTER_CONNECT_SECONDS = 30
+CLUSTER_CONNECT_INTERVAL = 0.5
+# Seconds between writes of the state file of a cluster job
+CLUSTER_STATE_INTERVAL = 10
+# Bytes of disk the entries of a result cache may take before the least recently used ones are deleted
+RESULT_CACHE_BUDGET = 64 * 1024 * 1024
+# Bins of the telemetry histograms as (low, width, number of bins). Values past the last bin are counted in it
+TELEMETRY_DAMAGE_BINS = (0, 1, 20)
+TELEMETRY_TURN_BINS = (0, 5, TURN_LIMIT // 5)
@@ -0,0 +1,85 @@
+import os
+import threading
+import warnings
+import constants
+from game_data import *
+
+"""
+Holds the Game Data in use. Readers take get() once per unit of work, i.e. per episode, and keep that
+Game Data until the work is done so they never mix two rulesets. A reload builds the new Game Data
+incrementally from the current one and swaps it in with a single assignment.
+"""
+class GameDataHandle:
+    def __init__(self, game_data):
+        self.game_data = game_data
+        # Incremented on every swap
+        self.version = 0
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def get(self):
+        return self.game_data
+
+    # listener(previous, game_data) is called after every swap. game_data.affected_rows lists what changed
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    # Parse the data file again. Returns the new Game Data, or None if the ruleset is unchanged or the file is invalid
+    def reload(self):
+        with self.lock:
+            previous = self.game_data
+            try:
+                game_data = GameData(previous.filename, previous)
+            except Exception as ex:
+                # Likely a partially written export or a malformed row. Keep the current ruleset until the next change,
+                # as an error here would stop the watcher thread and every later reload with it
+                warnings.warn('Unable to reload {0}: {1}: {2}'.format(previous.filename, type(ex).__name__, ex))
+                return None
+            if game_data.ruleset_hash == previous.ruleset_hash:
+                return None
+            self.game_data = game_data
+            self.version += 1
+        for listener in self.listeners:
+            listener(previous, game_data)
+        return game_data
+
+"""
+Polls the data file of a Game Data Handle in a background thread and reloads it when it changes.
+"""
+class DataWatcher:
+    def __init__(self, handle, interval=constants.DATA_WATCH_INTERVAL):
+        self.handle = handle
+        self.interval = interval
+        self.filename = handle.get().filename
+        self.file_stat = self.get_file_stat()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get_file_stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # Reload if the file changed since the last check. Returns the new Game Data if it was swapped in
+    def check(self):
+        file_stat = self.get_file_stat()
+        if file_stat is None or file_stat == self.file_stat:
+            return None
+        self.file_stat = file_stat
+        return self.handle.reload()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='data_watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
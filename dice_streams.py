@@ -0,0 +1,44 @@
+import random
+
+"""
+Random generator whose randint mirrors the one of an identically seeded generator: a roll of a becomes b and b becomes a.
+Pairing a battle with its mirror gives negatively correlated outcomes, whose average varies less than two independent ones.
+"""
+class AntitheticRandom(random.Random):
+    def randint(self, a, b):
+        return a + b - random.Random.randint(self, a, b)
+
+"""
+Separate random stream for every die in a battle, seeded from the episode seed, the unit and the die.
+The n-th roll of a die is then the same whatever else consumed random numbers before it, i.e. if a ruleset
+variant makes a unit act differently or a battle last longer. Variants played with the same seed see the
+same dice (common random numbers) and differences in their results come from the rules rather than the rolls.
+Attach to Battle.dice_streams to roll the dice of a battle from it.
+"""
+class DiceStreams:
+    def __init__(self, seed=0, antithetic=False):
+        self.reset(seed, antithetic)
+
+    # Restart every stream for a new episode
+    def reset(self, seed, antithetic=False):
+        self.seed = seed
+        self.antithetic = antithetic
+        self.streams = {}
+
+    def get_stream(self, unit, die_index):
+        key = (unit.uid, die_index)
+        stream = self.streams.get(key)
+        if stream is None:
+            # String seeds are hashed the same way in every process
+            stream_seed = '{0}:{1}:{2}'.format(self.seed, unit.uid, die_index)
+            stream = AntitheticRandom(stream_seed) if self.antithetic else random.Random(stream_seed)
+            self.streams[key] = stream
+        return stream
+
+    def roll_unit_die(self, unit):
+        for die_index, die in enumerate(unit.die):
+            die.roll_dice(self.get_stream(unit, die_index))
+
+# Seed of the choices a player makes in an episode, kept apart from the dice for the same reason
+def get_player_seed(seed, team):
+    return '{0}:player:{1}'.format(seed, team.name)
@@ -11,12 +11,37 @@ class DieFace:
         face_data = game_data.get_row(SheetId.Faces, face_id)
         self.index = face_data.index
         self.x = face_data.base_x
+        ability_data = game_data.get_row(SheetId.Abilities, face_data.ability_id)
+        self.can_reduce_health = any([effect.can_reduce_health(self.x) for effect in ability_data.effects])
+
+    # Faces are shared templates which never change
+    def __deepcopy__(self, memo):
+        return self
 
     def get_details(self):
         face_data = self.game_data.get_row(SheetId.Faces, self.face_id)
         return  '{0}-{1}'.format(face_data.ability_id, self.x)
 
 
+# The DieFace of the face id, shared by every die with the face
+def get_face_template(game_data, face_id):
+    key = (SheetId.Faces, face_id)
+    face = game_data.templates.get(key)
+    if face is None:
+        face = DieFace(game_data, face_id)
+        game_data.templates[key] = face
+    return face
+
+# The faces of the die of the Class, shared by every die of the Class
+def get_class_face_templates(game_data, class_id):
+    key = (SheetId.Classes, class_id)
+    faces = game_data.templates.get(key)
+    if faces is None:
+        class_faces = game_data.get_row(SheetId.Classes, class_id).faces
+        faces = tuple([get_face_template(game_data, class_faces[i]) for i in range(constants.NUM_DIE_FACES)])
+        game_data.templates[key] = faces
+    return faces
+
 """
 Base Die for a Unit
 """
@@ -52,18 +77,12 @@ class BaseDie:
         return ret
 
 """
-Class Die for a Unit
+Class Die for a Unit. Only the roll belongs to the die, its faces are the templates shared by the Class
 """
 class ClassDie(BaseDie):
     def __init__(self, game_data, class_id):
         self.class_id = class_id
-        faces = [None] * constants.NUM_DIE_FACES
-        class_data = game_data.get_row(SheetId.Classes, class_id)
-        class_faces = class_data.faces
-        for i in range(constants.NUM_DIE_FACES):
-            face_id = class_faces[i]
-            faces[i] = DieFace(game_data, face_id)
-        BaseDie.__init__(self, game_data, faces)
+        BaseDie.__init__(self, game_data, get_class_face_templates(game_data, class_id))
 
 """
 Generated Die which are temporary for a Unit
@@ -1,4 +1,5 @@
 import warnings
+import constants
 from enum import Enum
 
 """
@@ -9,6 +10,22 @@ class EffectType(Enum):
     MOVE = 1
     HEAL = 2
     BUFF = 3
+    APPLY = 4
+
+"""
+Statuses last on a unit over several of its turns, see Status
+"""
+class StatusType(Enum):
+    # Lose health equal to the stacks at the start of each turn, then lose a stack. Applying again adds stacks
+    POISON = 0
+    # Initiative raised by the amount until the end of the unit's last turn. Applying again keeps the larger
+    # amount and the longer duration
+    BUFF = 1
+
+# Part of a unit's turn at which its statuses tick
+class StatusTick(Enum):
+    START = 0
+    END = 1
 
 """
 Base class defining game state changes against Entities
@@ -26,6 +43,10 @@ class Effect:
     def apply(self, logger, battlefield, source, target, x):
         logger.warning('Expected to override for action of type:{0}'.format(self.effect_type))
 
+    # True if applying the effect with some value of x can lower a unit's health, i.e. decide a battle
+    def can_reduce_health(self, x):
+        return False
+
 """
 Apply damage to a target reducing their health
 """
@@ -39,9 +60,61 @@ class EffectDamage(Effect):
         final_amount = max(0, self.m * x + self.c)
         # Ensure damage doesn't cause target to go under 0
         final_amount = min(final_amount, target.current_health)
-        target.current_health -= final_amount
+        if final_amount > 0:
+            battlefield.change_health(target, -final_amount)
+        if battlefield.telemetry is not None:
+            battlefield.telemetry.record_damage(source, target, final_amount)
         logger.info('{0} deals {1} damage to {2}'.format(source.label, final_amount, target.label))
 
+    # A larger x deals more damage if m is positive
+    def can_reduce_health(self, x):
+        return self.m > 0 or self.m * x + self.c > 0
+
+"""
+Restore health of a target, up to their max health
+"""
+class EffectHeal(Effect):
+    def __init__(self, m, c):
+        Effect.__init__(self, EffectType.HEAL, m, c)
+
+    def apply(self, logger, battlefield, source, target, x):
+        final_amount = max(0, self.m * x + self.c)
+        final_amount = min(final_amount, target.character.max_health - target.current_health)
+        if final_amount > 0:
+            battlefield.change_health(target, final_amount)
+        logger.info('{0} heals {1} health of {2}'.format(source.label, final_amount, target.label))
+
+"""
+Put a Status on the target, i.e. APPLY 3 POISON or BUFF X
+"""
+class EffectApply(Effect):
+    def __init__(self, status_type, m, c, turns):
+        Effect.__init__(self, EffectType.APPLY, m, c)
+        self.status_type = status_type
+        self.turns = turns
+
+    def apply(self, logger, battlefield, source, target, x):
+        amount = max(0, self.m * x + self.c)
+        if amount > 0:
+            battlefield.apply_status(target, self.status_type, amount, self.turns, source)
+        logger.info('{0} applies {1} {2} to {3}'.format(source.label, amount, self.status_type.name, target.label))
+
+    # Poison takes health when it ticks
+    def can_reduce_health(self, x):
+        return self.status_type == StatusType.POISON and (self.m > 0 or self.m * x + self.c > 0)
+
+"""
+Status of a unit lasting over its turns. What the amount and turns mean depends on the StatusType
+"""
+class Status:
+    def __init__(self, status_type, amount, turns, source_uid=-1):
+        self.status_type = status_type
+        self.amount = amount
+        # Turns left, only used by statuses which don't run out by amount
+        self.turns = turns
+        # uid of the unit which last applied the status, -1 if none did. Damage of the status is credited to it
+        self.source_uid = source_uid
+
 """
 Move the target swapping their positions on their side
 """
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import warnings
 from game_data_obj import *
@@ -11,38 +12,119 @@ class SheetId(Enum):
     Classes = 1
     Faces = 2
 
+# Stable hash of raw JSON contents
+def hash_raw(raw):
+    return hashlib.sha256(json.dumps(raw, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
 """
 Manager to quickly access data objects from a JSON file
 Ideally, we want this JSON file to be generated from a google spreadsheet
+When created from a previous Game Data, rows whose contents didn't change are shared with it instead of
+being parsed again, and the changed rows plus every row depending on them are listed in affected_rows.
 """
 class GameData:
-    def __init__(self, filename):
+    def __init__(self, filename, previous=None):
+        self.filename = filename
         self.raw = self.load(filename)
         self.data = {}
+        # Hash of the raw contents of every row by (sheet id, row id)
+        self.row_hashes = {}
+        # Rows added, removed or modified since the previous Game Data. Every row on the first load
+        self.changed_rows = set()
         for sheet_id in self.raw:
             rows = {}
             sheet_data = self.raw[sheet_id]
             sheet_index = SheetId[sheet_id]
             for row_id in sheet_data:
                 row_data = sheet_data[row_id]
-                row_obj = None
-                if sheet_index == SheetId.Abilities:
-                    row_obj = AbilityData(row_data)
-                elif sheet_index == SheetId.Classes:
-                    row_obj = ClassData(row_data)
-                elif sheet_index == SheetId.Faces:
-                    row_obj = FaceData(row_data)
+                row_key = (sheet_index, row_id)
+                row_hash = hash_raw(row_data)
+                self.row_hashes[row_key] = row_hash
+                if previous is not None and previous.row_hashes.get(row_key) == row_hash:
+                    rows[row_id] = previous.data[sheet_index][row_id]
                 else:
-                    warnings.warn('Unknown sheet id {0}'.format(sheet_id))
-                rows[row_id] = row_obj
+                    rows[row_id] = self.parse_row(sheet_index, sheet_id, row_data)
+                    self.changed_rows.add(row_key)
             self.data[sheet_index] = rows
-    
+        for sheet_index in SheetId:
+            if sheet_index not in self.data:
+                self.data[sheet_index] = {}
+        if previous is not None:
+            for row_key in previous.row_hashes:
+                if row_key not in self.row_hashes:
+                    self.changed_rows.add(row_key)
+
+        # Rows referring to each row, i.e. the Faces using an Ability and the Classes rolling a Face
+        self.dependents = {}
+        for sheet_index in self.data:
+            for row_id in self.data[sheet_index]:
+                for dependency in self.get_row_dependencies(sheet_index, row_id):
+                    self.dependents.setdefault(dependency, []).append((sheet_index, row_id))
+        self.affected_rows = self.get_dependent_rows(self.changed_rows)
+        # Identifies the whole ruleset, i.e. to key results simulated with it
+        self.ruleset_hash = hash_raw(sorted([[key[0].name, key[1], row_hash] for key, row_hash in self.row_hashes.items()]))
+        self.dependency_hashes = {}
+        # Objects derived from the rows which are shared by everything built from them, i.e. die faces by face id
+        self.templates = {}
+
+    # Game Data doesn't change once loaded, a reload creates a new one. Copies of objects referring to it share it
+    def __deepcopy__(self, memo):
+        return self
+
+    def parse_row(self, sheet_index, sheet_id, row_data):
+        row_obj = None
+        if sheet_index == SheetId.Abilities:
+            row_obj = AbilityData(row_data)
+        elif sheet_index == SheetId.Classes:
+            row_obj = ClassData(row_data)
+        elif sheet_index == SheetId.Faces:
+            row_obj = FaceData(row_data)
+        else:
+            warnings.warn('Unknown sheet id {0}'.format(sheet_id))
+        return row_obj
+
+    # Rows the row refers to: a Face uses an Ability and a Class rolls its Faces
+    def get_row_dependencies(self, sheet_id, row_id):
+        row = self.data[sheet_id].get(row_id)
+        if row is None:
+            return []
+        if sheet_id == SheetId.Faces:
+            return [(SheetId.Abilities, row.ability_id)]
+        elif sheet_id == SheetId.Classes:
+            return [(SheetId.Faces, face_id) for face_id in sorted(set(row.faces))]
+        return []
+
+    # The rows and every row depending on them directly or indirectly
+    def get_dependent_rows(self, rows):
+        affected_rows = set(rows)
+        pending = list(rows)
+        while len(pending) > 0:
+            row_key = pending.pop()
+            for dependent in self.dependents.get(row_key, []):
+                if dependent not in affected_rows:
+                    affected_rows.add(dependent)
+                    pending.append(dependent)
+        return affected_rows
+
+    # Hash of the row and every row it depends on. It only changes when something affecting the row changes,
+    # so results cached by the hashes of the Classes they use survive edits to unrelated rows
+    def get_dependency_hash(self, sheet_id, row_id):
+        row_key = (sheet_id, row_id)
+        dependency_hash = self.dependency_hashes.get(row_key)
+        if dependency_hash is None:
+            dependency_hashes = [self.get_dependency_hash(*dependency) for dependency in self.get_row_dependencies(sheet_id, row_id)]
+            dependency_hash = hash_raw([self.row_hashes.get(row_key), dependency_hashes])
+            self.dependency_hashes[row_key] = dependency_hash
+        return dependency_hash
+
+    # Hash of everything the Classes depend on, i.e. to key results of battles between units of those Classes
+    def get_classes_hash(self, class_ids):
+        return hash_raw(sorted(set([self.get_dependency_hash(SheetId.Classes, class_id) for class_id in class_ids])))
+
     def load(self, filename):
         # Opening JSON file
-        f = open(filename)
-        raw_json = json.load(f)
-        # Closing file
-        f.close()
+        with open(filename) as f:
+            raw_json = json.load(f)
         return raw_json
 
     def get_sheet(self, sheet_id):
@@ -51,3 +133,6 @@ class GameData:
     def get_row(self, sheet_id, row_id):
         return self.data[sheet_id][row_id]
 
+    # Highest index of the rows in a sheet with indexed rows, i.e. Classes and Faces. Index 0 is reserved for none
+    def get_max_index(self, sheet_id):
+        return max([row.index for row in self.data[sheet_id].values()], default=0)
@@ -85,9 +85,13 @@ class AbilityData:
             if (num_components > 0):
                 # Parse properties like DAMAGE 2 or HEAL 3
                 # Parsing DAMAGE X means X is dependent on the die value
-                # We want also APPLY 3 POISON 
+                # Statuses are applied with APPLY 3 POISON or APPLY X BUFF 2, where the last number is the turns it lasts.
+                # BUFF X is short for APPLY X BUFF
                 # Would be great also to support DAMAGE 2X
                 comp0 = components[0].strip(' \t\n')
+                if comp0 not in EffectType.__members__:
+                    warnings.warn('Unknown effect {0} - ability {1}'.format(comp0, self.uid))
+                    continue
                 effect_type = EffectType[comp0]
 
                 m = 0
@@ -102,16 +106,32 @@ class AbilityData:
                             c = int(comp1)
                         except ValueError as ex:
                             warnings.warn('{0} cannot be converted to int - ability {1}'.format(comp1, self.uid))
-                        return ret
+                            continue
                 else:
                     # By default if no value is specified set constant to 1
                     c = 1
 
                 # Generate and cache the generated effect
                 effect = None
-                if effect_type == EffectType.DAMAGE:
-                    effect = EffectDamage(m, c)
-                    
+                try:
+                    if effect_type == EffectType.DAMAGE:
+                        effect = EffectDamage(m, c)
+                    elif effect_type == EffectType.HEAL:
+                        effect = EffectHeal(m, c)
+                    elif effect_type == EffectType.BUFF:
+                        turns = int(components[2]) if num_components > 2 else constants.STATUS_DEFAULT_TURNS
+                        effect = EffectApply(StatusType.BUFF, m, c, turns)
+                    elif effect_type == EffectType.APPLY and num_components > 2:
+                        status_type = StatusType[components[2].strip(' \t\n')]
+                        turns = int(components[3]) if num_components > 3 else constants.STATUS_DEFAULT_TURNS
+                        effect = EffectApply(status_type, m, c, turns)
+                except ValueError as ex:
+                    warnings.warn('{0} cannot be converted to int - ability {1}'.format(key_str, self.uid))
+                    continue
+                except KeyError as ex:
+                    warnings.warn('Unknown status {0} - ability {1}'.format(ex, self.uid))
+                    continue
+
                 if effect != None:
                     self.effects.append(effect)
                 else:
@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+import constants
+from game_data import *
+from battle_runner import *
+from battle_codec import *
+from player import *
+from search_player import *
+from scenarios import *
+
+"""
+Interactive battle of one human player against a NonPlayer opponent, driven by commands instead of input().
+With an opponent budget, the opponent is a SearchPlayer which thinks up to that many seconds before each reply.
+The opponent acts inline whenever it's their turn, so after every command the battle waits on the player again.
+While idle the battle is packed with battle_codec and only the scenario and its encoding are kept.
+"""
+class GameSession:
+    def __init__(self, session_id, logger, game_data, scenario, rng, team=Team.BLUE, opponent_budget=0, deadline=None):
+        self.session_id = session_id
+        self.opponent_budget = opponent_budget
+        # Held while a command is being run so the session isn't packed or changed under it
+        self.lock = asyncio.Lock()
+        self.logger = logger
+        self.game_data = game_data
+        self.scenario = scenario
+        self.rng = rng
+        self.team = team
+        self.battle_env = None
+        self.opponent = None
+        # Encoded battle while the session is packed
+        self.packed_battle = None
+        self.last_active = time.monotonic()
+        self.build(None)
+        self.advance(deadline)
+
+    # Create the battle of the scenario, restoring its state if an encoding is given
+    def build(self, packed_battle):
+        battle = create_scenario_battle(self.logger, self.game_data, self.rng, self.scenario)
+        if packed_battle is not None:
+            decode_battle_into(battle, packed_battle)
+        self.battle_env = BattleRunner(self.logger, battle)
+        opponent_team = Team.RED if self.team == Team.BLUE else Team.BLUE
+        if self.opponent_budget > 0:
+            self.opponent = SearchPlayer(self.logger, self.game_data, self.battle_env, opponent_team, self.rng, self.opponent_budget)
+        else:
+            self.opponent = NonPlayer(self.logger, self.game_data, self.battle_env, opponent_team, self.rng)
+
+    def is_packed(self):
+        return self.packed_battle is not None
+
+    def pack(self):
+        if self.is_packed():
+            return
+        self.packed_battle = encode_battle(self.battle_env.battle)
+        self.battle_env = None
+        self.opponent = None
+
+    def unpack(self):
+        if not self.is_packed():
+            return
+        self.build(self.packed_battle)
+        self.packed_battle = None
+
+    def is_finished(self):
+        self.unpack()
+        return self.battle_env.battle.state == BattleState.BATTLE_FINISHED
+
+    # Step the battle until it's the player's turn to act or the battle is over.
+    # The opponent's decisions are cut short at the perf_counter deadline if one is given
+    def advance(self, deadline=None):
+        if isinstance(self.opponent, SearchPlayer):
+            self.opponent.deadline = deadline
+        battle = self.battle_env.battle
+        while battle.state != BattleState.BATTLE_FINISHED:
+            action = None
+            if battle.state == BattleState.MAIN_PHASE:
+                unit = battle.get_current_turn()
+                if unit.team == self.team:
+                    return
+                action = self.opponent.select_action()
+            battle.step(action)
+
+    # Perform a player command. Returns an error message if it was rejected, the battle is unchanged then
+    def run_command(self, command, deadline=None):
+        self.last_active = time.monotonic()
+        self.unpack()
+        battle = self.battle_env.battle
+        if battle.state == BattleState.BATTLE_FINISHED:
+            return 'Battle is over'
+        unit = battle.get_current_turn()
+        action, error = parse_player_command(self.logger, self.game_data, battle, unit, command)
+        if error is not None:
+            return error
+        if not is_battle_action_valid(action):
+            return 'Action can not be used: {0}'.format(command)
+        battle.step(action)
+        self.advance(deadline)
+        return None
+
+    def get_state(self):
+        self.last_active = time.monotonic()
+        self.unpack()
+        battle = self.battle_env.battle
+        current_unit = battle.get_current_turn() if battle.state != BattleState.BATTLE_FINISHED else None
+        units = []
+        for unit in battle.battlefield.units + battle.battlefield.dead_list:
+            unit_state = {}
+            unit_state['label'] = unit.label
+            unit_state['team'] = unit.team.name
+            unit_state['location'] = unit.location.name
+            unit_state['health'] = unit.current_health
+            unit_state['max_health'] = unit.character.max_health
+            units.append(unit_state)
+        state = {}
+        state['type'] = 'state'
+        state['session'] = self.session_id
+        state['state'] = battle.state.name
+        state['round'] = battle.round
+        state['turn'] = battle.turn
+        state['current'] = current_unit.label if current_unit is not None else None
+        # Faces of every die of the unit in turn, the rolled face is marked with *
+        state['die'] = [die.get_details() for die in current_unit.die] if current_unit is not None else []
+        state['units'] = units
+        if battle.state == BattleState.BATTLE_FINISHED:
+            state['winner'] = battle.get_winning_team().name
+            state['outcome'] = battle.outcome.name
+        return state
+
+"""
+Hosts many Game Sessions on one asyncio event loop.
+Clients send one text command per line and get one JSON message per line back:
+    new [scenario]      start a session and attach to it
+    resume <session>    attach to an existing session
+    primary <die> <target>, move <die>, end
+                        act with the unit in turn, same as the console game
+    state               get the state of the attached session
+    quit                end the attached session
+Every command is answered with the session's state or {"type": "error", "message": ...}.
+Sessions outlive their connection, so players can resume them until they expire.
+Commands run in worker threads so the loop keeps serving other sessions while an opponent is thinking.
+The opponent budget counts from when a command arrives, so replies stay within it however many sessions are busy
+and opponents just search less under load.
+"""
+class GameServer:
+    def __init__(self, game_data, host=constants.GAME_SERVER_HOST, port=constants.GAME_SERVER_PORT,
+                 idle_seconds=constants.SESSION_IDLE_SECONDS, expire_seconds=constants.SESSION_EXPIRE_SECONDS, opponent_budget=0):
+        self.game_data = game_data
+        self.opponent_budget = opponent_budget
+        self.host = host
+        self.port = port
+        self.idle_seconds = idle_seconds
+        self.expire_seconds = expire_seconds
+        # Battles don't log while hosted, the state sent back describes them
+        self.logger = logging.getLogger('game_server')
+        self.logger.setLevel(logging.WARNING)
+        # Sessions share a generator since hosted games don't need to be reproducible
+        self.rng = random.Random()
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.server = None
+        self.sweeper = None
+        self.client_tasks = set()
+
+    async def create_session(self, scenario):
+        if scenario not in SCENARIOS:
+            raise ValueError('Unknown scenario: {0}'.format(scenario))
+        session_id = next(self.session_ids)
+        # The opponent may act first
+        session = await asyncio.to_thread(GameSession, session_id, self.logger, self.game_data, scenario, self.rng,
+                                          Team.BLUE, self.opponent_budget, self.get_reply_deadline())
+        self.sessions[session_id] = session
+        return session
+
+    def get_reply_deadline(self):
+        return time.perf_counter() + self.opponent_budget
+
+    # Pack idle sessions and drop expired ones
+    def sweep_sessions(self):
+        now = time.monotonic()
+        for session_id in list(self.sessions.keys()):
+            session = self.sessions[session_id]
+            if session.lock.locked():
+                continue
+            idle_time = now - session.last_active
+            if idle_time >= self.expire_seconds:
+                del self.sessions[session_id]
+            elif idle_time >= self.idle_seconds:
+                session.pack()
+
+    async def run_sweeper(self):
+        while True:
+            await asyncio.sleep(constants.SESSION_SWEEP_INTERVAL)
+            self.sweep_sessions()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        # Port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.sweeper = asyncio.create_task(self.run_sweeper())
+
+    async def stop(self):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            self.sweeper = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for task in list(self.client_tasks):
+            task.cancel()
+        if len(self.client_tasks) > 0:
+            await asyncio.gather(*self.client_tasks, return_exceptions=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print('Game server listening on {0}:{1}'.format(self.host, self.port), file=sys.stderr, flush=True)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    # Returns the message answering the command and the session the connection is attached to afterwards
+    async def handle_command(self, session, line):
+        deadline = self.get_reply_deadline()
+        args = line.split()
+        if len(args) <= 0:
+            return {'type': 'error', 'message': 'Empty command'}, session
+        cmd = args[0]
+        if cmd == 'new':
+            try:
+                session = await self.create_session(args[1] if len(args) > 1 else 'fighters')
+            except ValueError as ex:
+                return {'type': 'error', 'message': str(ex)}, session
+        elif cmd == 'resume':
+            session_id, error = try_parse_value(args[1], 'session') if len(args) == 2 else (None, 'Expected a session id')
+            if error is not None:
+                return {'type': 'error', 'message': error}, session
+            if session_id not in self.sessions:
+                return {'type': 'error', 'message': 'Unknown session: {0}'.format(session_id)}, session
+            session = self.sessions[session_id]
+        if session is None or session.session_id not in self.sessions:
+            return {'type': 'error', 'message': 'No session, start one with: new [scenario]'}, None
+
+        async with session.lock:
+            if cmd == 'quit':
+                self.sessions.pop(session.session_id, None)
+                return {'type': 'closed', 'session': session.session_id}, None
+            elif cmd not in ['new', 'resume', 'state']:
+                error = await asyncio.to_thread(session.run_command, line, deadline)
+                if error is not None:
+                    return {'type': 'error', 'message': error}, session
+            return session.get_state(), session
+
+    async def handle_client(self, reader, writer):
+        client_task = asyncio.current_task()
+        self.client_tasks.add(client_task)
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message, session = await self.handle_command(session, line.decode('utf-8', errors='replace'))
+                writer.write((json.dumps(message) + '\n').encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # The client went away or the server is stopping
+            pass
+        finally:
+            writer.close()
+            self.client_tasks.discard(client_task)
+
+def run_game_server(game_data, host=constants.GAME_SERVER_HOST, port=constants.GAME_SERVER_PORT, opponent_budget=0):
+    server = GameServer(game_data, host, port, opponent_budget=opponent_budget)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,151 @@
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+import constants
+from torch.distributions import Categorical
+from policy import *
+from metrics import *
+
+"""
+Steps collected during a single episode of a Learning Agent
+"""
+class Trajectory:
+    def __init__(self):
+        # Preprocessed observation tensors fed to the Policy
+        self.observations = []
+        # Index of the sampled action for each observation
+        self.actions = []
+        # Reward earned by each action
+        self.rewards = []
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add_step(self, observation, action_index):
+        self.observations.append(observation)
+        self.actions.append(action_index)
+
+    def add_reward(self, reward):
+        self.rewards.append(reward)
+
+    def has_pending_reward(self):
+        return len(self.actions) > len(self.rewards)
+
+    # Discounted return for every step of the episode
+    def get_returns(self, gamma):
+        R = 0
+        returns = [0] * len(self.rewards)
+        for i in range(len(self.rewards) - 1, -1, -1):
+            R = self.rewards[i] + gamma * R
+            returns[i] = R
+        return returns
+
+"""
+Owns the Policy and optimizer of Learning Agents and decides when to update them.
+Trajectories are accumulated, possibly from several agents each running their own environment,
+until the update schedule is met. They are then trained on in a single batched backward pass.
+"""
+class Learner:
+    def __init__(self, model, gamma,
+                 learning_rate=constants.DEFAULT_LEARNING_RATE,
+                 update_episodes=constants.DEFAULT_UPDATE_EPISODES,
+                 update_steps=constants.DEFAULT_UPDATE_STEPS,
+                 update_epochs=constants.DEFAULT_UPDATE_EPOCHS):
+        self.model = model
+        self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
+        self.eps = np.finfo(np.float32).eps.item()
+        self.gamma = gamma
+        # Update after this many episodes are collected. 0 disables the episode threshold
+        self.update_episodes = update_episodes
+        # Update after this many steps are collected. 0 disables the step threshold
+        self.update_steps = update_steps
+        # Number of passes over a collected batch per update
+        self.update_epochs = update_epochs
+        self.trajectories = []
+        self.num_steps = 0
+        self.num_updates = 0
+
+    def add_trajectory(self, trajectory):
+        if len(trajectory) <= 0:
+            return
+        self.trajectories.append(trajectory)
+        self.num_steps += len(trajectory)
+
+    def is_update_ready(self):
+        if len(self.trajectories) <= 0:
+            return False
+        if self.update_episodes > 0 and len(self.trajectories) >= self.update_episodes:
+            return True
+        if self.update_steps > 0 and self.num_steps >= self.update_steps:
+            return True
+        return False
+
+    # Add a finished episode and train if the schedule is met. Returns true if an update happened
+    def finish_trajectory(self, trajectory):
+        self.add_trajectory(trajectory)
+        if not self.is_update_ready():
+            return False
+        self.update()
+        return True
+
+    # Adapted from https://github.com/pytorch/examples.git to train on batches of episodes.
+    # Calculates actor and critic loss and performs backprop.
+    def update(self):
+        if len(self.trajectories) <= 0:
+            return
+
+        start = time.perf_counter()
+        observations = []
+        actions = []
+        returns = []
+        for trajectory in self.trajectories:
+            observations.extend(trajectory.observations)
+            actions.extend(trajectory.actions)
+            returns.extend(trajectory.get_returns(self.gamma))
+
+        observations = torch.stack(observations)
+        actions = torch.tensor(actions)
+        returns = torch.tensor(returns, dtype=torch.float32)
+        # Normalize across the whole batch rather than per episode
+        if len(returns) > 1:
+            returns = (returns - returns.mean()) / (returns.std() + self.eps)
+        else:
+            returns = returns - returns.mean()
+
+        # Advantages and the log probabilities of the actions are fixed against the Policy before the first epoch,
+        # so later epochs keep optimizing towards the same targets
+        with torch.no_grad():
+            probs, values = self.model.forward_tensor(observations)
+            old_log_probs = Categorical(probs).log_prob(actions)
+            advantages = returns - values.squeeze(-1)
+            if len(advantages) > 1:
+                advantages = (advantages - advantages.mean()) / (advantages.std() + self.eps)
+
+        for epoch in range(self.update_epochs):
+            probs, values = self.model.forward_tensor(observations)
+            distribution = Categorical(probs)
+            log_probs = distribution.log_prob(actions)
+
+            # actor (policy) loss. Epochs after the first train on actions sampled from an older Policy, so the change
+            # in probability of each action is clipped as in PPO. On the first epoch the ratio is 1 and this is the
+            # plain policy gradient
+            ratios = torch.exp(log_probs - old_log_probs)
+            clipped_ratios = torch.clamp(ratios, 1.0 - constants.POLICY_CLIP, 1.0 + constants.POLICY_CLIP)
+            policy_loss = -torch.min(ratios * advantages, clipped_ratios * advantages).mean()
+            # critic (value) loss using L1 smooth loss
+            value_loss = F.smooth_l1_loss(values.squeeze(-1), returns)
+
+            # Losses are averaged over the steps of the batch rather than summed, so the size of a batch doesn't
+            # scale its gradient. Adam mostly cancels out a constant scale, but a learning rate tuned against
+            # summed losses of long batches may need raising
+            self.optimizer.zero_grad()
+            loss = policy_loss + value_loss
+            loss.backward()
+            self.optimizer.step()
+
+        self.num_updates += 1
+        self.trajectories = []
+        self.num_steps = 0
+        record_update(metrics_registry, time.perf_counter() - start, distribution.entropy().mean().item())
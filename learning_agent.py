@@ -0,0 +1,121 @@
+import numpy as np
+import torch
+from torch.distributions import Categorical
+from player import *
+from battle_runner import *
+from policy import *
+from learner import *
+
+"""
+Player Class which trains itself on the battles it runs on.
+"""
+class LearningAgent(Player):
+    def __init__(self, logger, game_data, battle_env, team, gamma, epsilon, rho, learner=None):
+        Player.__init__(self, logger, game_data, battle_env, team)
+        # Several agents, each with their own environment, may share a single Learner
+        if learner is None:
+            learner = Learner(Policy(battle_env.observation_space, battle_env.action_space), gamma)
+        self.learner = learner
+        self.model = learner.model
+        self.trajectory = Trajectory()
+        self.epsilon = epsilon
+        self.rho = rho
+        self.should_print_probabilities = False
+
+    def calculate_reward(self):
+        return calculate_reward(self.battle_env.battle, self.team)
+
+    # Creates a Battle Action from a dictionary defined in the Learning Agent's Action Space
+    def create_battle_action(self, action, unit):
+        return create_battle_action(self.logger, self.game_data, self.battle_env.battle, unit, action)
+
+    def on_select_action(self, unit):
+        # Before selecting the next action. Evaluate how much reward we earned from our prior action.
+        if self.has_pending_reward():
+            reward = self.calculate_reward()
+            self.total_reward += reward
+            self.record_reward(reward, False)
+
+        state = self.battle_env.get_observed_state()
+        if (self.should_print_probabilities):
+            self.print_action_probabilities(state)
+        observation = self.model.preprocess_observation(state)
+        # Gradients are computed later from the whole batch of trajectories
+        with torch.no_grad():
+            probs, state_value = self.model.forward_tensor(observation)
+
+        # create a categorical distribution over the list of probabilities of actions
+        m = Categorical(probs)
+
+        should_explore = False
+        should_exploit = False
+        if self.epsilon > 0:
+            random_num = np.random.uniform()
+            should_explore = random_num < self.epsilon
+        if not should_explore and self.rho > 0:
+            random_num = np.random.uniform()
+            should_exploit = random_num < self.rho
+
+        if should_explore:
+            # Explore
+            sampled_action = torch.randint(0, self.model.output_size, (1,))[0]
+        elif should_exploit:
+            # Exploit
+            sampled_action = torch.argmax(probs)
+        else:
+            # Stochastic
+            sampled_action = m.sample()
+
+        # the action to take
+        action_index = sampled_action.item()
+
+        # save to the episode's trajectory
+        self.record_step(observation, action_index, probs)
+
+        action = self.get_action_dict(action_index)
+        battle_action = self.create_battle_action(action, unit)
+
+        # Ensure the battle action can be used. If we pass none, this is similar to the
+        # game rejecting the player input with the state not changing.
+        if battle_action is not None and battle_action.can_ability_use_resources() and battle_action.can_ability_be_used() and battle_action.can_ability_apply_to_target():
+            return battle_action
+        else:
+            # Return no action if it's invalid. 
+            return None
+
+    def get_action_dict(self, action_index):
+        action_space = self.battle_env.action_space
+        return decode_action_index(action_index, action_space['die_index'].n, action_space['target_index'].n)
+
+    def get_action_probabilities(self, state):
+        probs, state_value = self.model(state)
+        return (probs, state_value)
+
+    def print_action_probabilities(self, state):
+        print('Printing probabilities for state: {0}'.format(state))
+        probs, state_value = self.model(state)
+        for i in range(len(probs)):
+            action = self.get_action_dict(i)
+            print('{0:.3} - {1}'.format(probs[i], action))
+
+    def has_pending_reward(self):
+        return self.trajectory.has_pending_reward()
+
+    # Store the action taken from the observation. probs is the distribution it was sampled from
+    def record_step(self, observation, action_index, probs):
+        self.trajectory.add_step(observation, action_index)
+
+    # Store the reward of the last recorded action. is_done is true if it ended the episode
+    def record_reward(self, reward, is_done):
+        self.trajectory.add_reward(reward)
+
+    def on_finish_episode(self):
+        # Before finishing. Evaluate how much reward we earned from our last action.
+        if self.has_pending_reward():
+            reward = self.calculate_reward()
+            self.total_reward += reward
+            self.record_reward(reward, True)
+
+        # Hand off the episode to the learner which trains once enough trajectories are collected
+        self.learner.finish_trajectory(self.trajectory)
+        self.trajectory = Trajectory()
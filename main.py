@@ -3,72 +3,46 @@ from game_data import *
 from player import *
 from targetable import *
 from battle import *
-from battle_env import *
+from battle_runner import *
+from scenarios import *
+from simulation import *
+from results import *
+from metrics import *
+import argparse
+import json
 import random
+import sys
+import time
 import constants
 import logging
-from gym.wrappers import FlattenObservation
-
-def run_episode(battle_env, players):
-    battle = battle_env.battle
-    is_done = False
-    while not is_done:
-        action = None
-        if battle.state == BattleState.MAIN_PHASE:
-            turn = battle.get_current_turn()
-            player = players[turn.team]
-            action = player.select_action()
-        next_state, reward, is_done, is_terminated, info = battle_env.step(action)
-
-    for team in players:
-        player = players[team]
-        player.finish_episode()
-    turns = battle_env.battle.turn
-    winning_team = battle_env.battle.get_winning_team()
-    return turns, winning_team
-
-def get_battle_training_dummies(logger, game_data, random):
-    player_character1 = Character(game_data, 'John Wayne', ['fighter', 'fighter'])
-    player_unit1 = Unit(logger, game_data, player_character1, Team.BLUE, Location.FRONT, 'P1')
-    player_character2 = Character(game_data, 'Hilbert Wayne', ['fighter', 'fighter'])
-    player_unit2 = Unit(logger, game_data, player_character2, Team.BLUE, Location.FRONT, 'P2')
-    enemy_character1 = Character(game_data, 'Rubick Coridano', ['training_dummy', 'training_dummy'])
-    enemy_unit1 = Unit(logger, game_data, enemy_character1, Team.RED, Location.FRONT, 'E1')
-    enemy_character2 = Character(game_data, 'Aaron Keller', ['training_dummy', 'training_dummy'])
-    enemy_unit2 = Unit(logger, game_data, enemy_character2, Team.RED, Location.BACK, 'E2')
-
-    units = [player_unit1, player_unit2, enemy_unit1, enemy_unit2]
-
-    battle = Battle(logger, units, random)
-    return battle
-
-def get_battle_fighters(logger, game_data, random):
-    player_character1 = Character(game_data, 'John Wayne', ['fighter', 'fighter'])
-    player_unit1 = Unit(logger, game_data, player_character1, Team.BLUE, Location.FRONT, 'P1')
-    player_character2 = Character(game_data, 'Hilbert Wayne', ['fighter', 'fighter'])
-    player_unit2 = Unit(logger, game_data, player_character2, Team.BLUE, Location.FRONT, 'P2')
-    enemy_character1 = Character(game_data, 'Rubick Coridano', ['fighter', 'fighter'])
-    enemy_unit1 = Unit(logger, game_data, enemy_character1, Team.RED, Location.FRONT, 'E1')
-    enemy_character2 = Character(game_data, 'Aaron Keller', ['fighter', 'fighter'])
-    enemy_unit2 = Unit(logger, game_data, enemy_character2, Team.RED, Location.BACK, 'E2')
-
-    units = [player_unit1, player_unit2, enemy_unit1, enemy_unit2]
-
-    battle = Battle(logger, units, random)
-    return battle
-
-def train_episodes(battle_env, players, start_i, end_i):
+
+# Train on episodes start_i to end_i (exclusive). If a seed is given, episode i reseeds the game with seed + i.
+# Every episode is recorded to the result writer while only one in progress_interval is printed
+def train_episodes(battle_env, players, start_i, end_i, checkpointer=None, progress_interval=1, result_writer=None, seed=None):
     for i_episode in range(start_i, end_i):
-        print('Training episode: {0} eps: {1:.3}'.format(i_episode, players[Team.BLUE].epsilon), end = " ")
+        if seed is not None:
+            random.seed(seed + i_episode)
         turns, winning_team = run_episode(battle_env, players)
-        print('Turns {0} Winner {1} Player (Iterations, Reward) {2} {3}'.format(
-            turns, winning_team, players[Team.BLUE].get_episode_details(), players[Team.RED].get_episode_details()))
+        record_episode(metrics_registry, turns, sum([players[team].total_steps for team in players]),
+                       battle_env.battle.invalid_actions, players[Team.BLUE].total_reward)
+        if result_writer is not None:
+            steps, reward = players[Team.BLUE].get_episode_details()
+            result_writer.write(i_episode, seed + i_episode if seed is not None else -1, turns, winning_team,
+                                steps, battle_env.battle.invalid_actions, battle_env.battle.outcome, reward)
+        if i_episode % progress_interval == 0:
+            print('Training episode: {0} eps: {1:.3} Turns {2} Winner {3} Player (Iterations, Reward) {4} {5}'.format(
+                i_episode, players[Team.BLUE].epsilon, turns, winning_team,
+                players[Team.BLUE].get_episode_details(), players[Team.RED].get_episode_details()), file=sys.stderr, flush=True)
 
         battle_env.reset()
         for team in players:
             player = players[team]
             player.reset_episode()
 
+        is_last_episode = i_episode == end_i - 1
+        if checkpointer is not None and (i_episode % constants.CHECKPOINT_INTERVAL == 0 or is_last_episode):
+            checkpointer.save(players[Team.BLUE], i_episode)
+
 def create_logger(log_level):
     # Get the root logger
     logger = logging.getLogger()
@@ -88,47 +62,449 @@ def create_logger(log_level):
     logger.addHandler(handler)
     return logger
 
+# Seed every random generator used by the game and the agents
+def seed_everything(seed):
+    random.seed(seed)
+    if 'numpy' in sys.modules:
+        sys.modules['numpy'].random.seed(seed)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].manual_seed(seed)
+
 # Run a training experiment with Actor Critic
-def run_training_agent(game_data):
+# Episodes are split evenly across the scenarios which are trained on in order.
+# If a checkpoint file is given, training is periodically saved to it and resumes from it when it exists
+def run_training_agent(game_data, scenarios=DEFAULT_TRAINING_SCENARIOS, episodes=2000, seed=None,
+                       checkpoint_filename=None, weights_filename=None, progress_interval=1, should_run_test_episode=True,
+                       results_filename=None):
+    # torch and gym are only loaded when training so the console game starts quickly
+    from battle_env import BattleEnv, get_battle_env_sizes
+    from learning_agent import LearningAgent
+    from checkpoint import Checkpointer, restore_training_state
+
+    if seed is not None:
+        seed_everything(seed)
     game_logger = create_logger(logging.WARNING)
 
-    battle = get_battle_training_dummies(game_logger, game_data, random)
-    battle_env = BattleEnv(game_logger, battle)
+    # The spaces are sized for the largest of the scenarios so one Policy can play all of them
+    battles = [SCENARIOS[scenario](game_logger, game_data, random) for scenario in scenarios]
+    battle_env = BattleEnv(game_logger, battles[0], game_data, **get_battle_env_sizes(battles))
 
     players = {}
     players[Team.BLUE] = LearningAgent(game_logger, game_data, battle_env, Team.BLUE, constants.DEFAULT_GAMMA, constants.DEFAULT_EPSILON, constants.DEFAULT_RHO)
-    players[Team.RED] = NonPlayer(game_logger, game_data, battle_env, Team.RED, random)
 
-    train_episodes(battle_env, players, 1, 1000)
+    start_i = 1
+    checkpointer = None
+    if checkpoint_filename is not None:
+        checkpointer = Checkpointer(checkpoint_filename)
+        checkpoint = checkpointer.load()
+        if checkpoint is not None:
+            start_i = restore_training_state(players[Team.BLUE], checkpoint)
+            print('Resuming training from episode: {0}'.format(start_i), file=sys.stderr, flush=True)
 
-    battle = get_battle_fighters(game_logger, game_data, random)
-    battle_env.change_battle(battle)
-    players[Team.RED] = NonPlayer(game_logger, game_data, battle_env, Team.RED, random)
+    result_writer = ResultWriter(results_filename) if results_filename is not None else None
+    scenario_start_i = 1
+    for scenario_index in range(len(scenarios)):
+        scenario_end_i = 1 + episodes * (scenario_index + 1) // len(scenarios)
+        if scenario_index > 0:
+            battle_env.change_battle(battles[scenario_index])
+        players[Team.RED] = NonPlayer(game_logger, game_data, battle_env, Team.RED, random)
+        train_episodes(battle_env, players, max(start_i, scenario_start_i), scenario_end_i, checkpointer, progress_interval,
+                       result_writer, seed)
+        scenario_start_i = scenario_end_i
 
-    train_episodes(battle_env, players, 1001, 2000)
+    if result_writer is not None:
+        result_writer.close()
 
-    print('Test episode {0}'.format(1))
-    players[Team.BLUE].should_print_probabilities = True
-    players[Team.BLUE].epsilon = 0
-    players[Team.BLUE].rho = 0
-    run_episode(battle_env, players)
+    if checkpointer is not None:
+        checkpointer.close()
+
+    if weights_filename is not None:
+        players[Team.BLUE].model.export_weights(weights_filename)
+
+    if should_run_test_episode:
+        print('Test episode {0}'.format(1))
+        players[Team.BLUE].should_print_probabilities = True
+        players[Team.BLUE].epsilon = 0
+        players[Team.BLUE].rho = 0
+        run_episode(battle_env, players)
+
+# Train with actor processes feeding a learner until the actors have played the requested episodes
+def run_actor_learner(data_filename, scenario, episodes, num_workers, seed, weights_filename=None, progress_interval=1):
+    from actor_learner import ActorLearner
+
+    actor_learner = ActorLearner(scenario, data_filename, num_workers, seed)
+    actor_learner.start()
+    try:
+        next_report = progress_interval
+        while actor_learner.get_num_episodes() < episodes:
+            actor_learner.update(actor_learner.next_batch())
+            actor_learner.collect_worker_metrics()
+            num_episodes = actor_learner.get_num_episodes()
+            if num_episodes >= next_report:
+                print('Training episodes: {0} updates: {1} policy lag: {2:.2f}'.format(
+                    num_episodes, actor_learner.num_updates, actor_learner.policy_lag), file=sys.stderr, flush=True)
+                next_report = num_episodes + progress_interval
+    finally:
+        actor_learner.stop()
+
+    if weights_filename is not None:
+        actor_learner.model.export_weights(weights_filename)
+
+# Play battles without learning and stream the results to the output.
+# Results are JSON lines unless a result writer is given to record them in the compact binary layout.
+# If a Telemetry is given, the battles are recorded into it
+def run_simulation_command(data_filename, scenario, episodes, num_workers, seed, output, weights_filename=None, progress_interval=1,
+                           result_writer=None, watch=False, telemetry=None):
+    win_counts = {}
+    total_turns = 0
+    num_results = 0
+    for result in run_simulation(scenario, data_filename, 0, episodes, seed, num_workers, weights_filename, watch=watch,
+                                 telemetry=telemetry):
+        if result_writer is not None:
+            result_writer.write(result['episode'], result['seed'], result['turns'], Team[result['winner']],
+                                result['blue_steps'], result['invalid_actions'], BattleOutcome[result['outcome']],
+                                result['blue_reward'])
+        else:
+            output.write(json.dumps(result) + '\n')
+        record_episode(metrics_registry, result['turns'], result['blue_steps'] + result['red_steps'], result['invalid_actions'])
+        win_counts[result['winner']] = win_counts.get(result['winner'], 0) + 1
+        total_turns += result['turns']
+        num_results += 1
+        if num_results % progress_interval == 0:
+            if result_writer is None:
+                output.flush()
+            print('Simulated episodes: {0}/{1}'.format(num_results, episodes), file=sys.stderr, flush=True)
+    if result_writer is None:
+        output.flush()
+
+    summary = {}
+    summary['episodes'] = num_results
+    summary['wins'] = win_counts
+    summary['mean_turns'] = total_turns / num_results if num_results > 0 else 0
+    print(json.dumps(summary), file=sys.stderr, flush=True)
+    return summary
+
+# Estimate how much the variant ruleset changes blue's score from paired episodes sharing their dice rolls
+def run_compare_command(data_filename, variant_filename, scenario, episodes, num_workers, seed, antithetic, progress_interval=1):
+    from paired_simulation import PairedEstimate, run_paired_simulation
+
+    estimate = PairedEstimate()
+    for result in run_paired_simulation(scenario, data_filename, variant_filename, 0, episodes, seed, num_workers, antithetic):
+        estimate.add(result['scores'], result['variant_scores'])
+        if estimate.num_pairs % progress_interval == 0:
+            summary = estimate.get_summary()
+            print('Compared episodes: {0}/{1} difference: {2:+.4f} +/- {3:.4f}'.format(
+                estimate.num_pairs, episodes, summary['difference'], summary['margin']), file=sys.stderr, flush=True)
+    summary = estimate.get_summary()
+    print(json.dumps(summary), flush=True)
+    return summary
+
+# Shard of the form index/count, i.e. 0/4 for the first of four shards
+def parse_shard(text):
+    try:
+        shard_index, num_shards = [int(value) for value in text.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected a shard as index/count: {0}'.format(text))
+    return shard_index, num_shards
+
+# Write the teams or matchups of the shard as JSON lines
+def run_compositions_command(game_data, team_size, levels, tiers, locations, max_unit_levels, matchups, ordered, shard, output):
+    from compositions import CompositionSpace, write_compositions
+
+    composition_space = CompositionSpace(game_data, team_size, levels if levels is not None else team_size, locations, tiers,
+                                         max_unit_levels)
+    num_items, num_written = write_compositions(output, composition_space, matchups, ordered, shard[0], shard[1])
+    output.flush()
+    summary = {}
+    summary['teams'] = composition_space.num_teams
+    summary['total'] = num_items
+    summary['written'] = num_written
+    print(json.dumps(summary), file=sys.stderr, flush=True)
+    return summary
+
+# Play every matchup of the file (JSON lines written by compositions --matchups) or the scenario on workers connecting over TCP
+def run_coordinate_command(game_data, scenario, matchups_filename, episodes, seed, chunk_episodes, host, port, output, progress,
+                           state_filename=None):
+    from cluster import run_cluster_coordinator
+
+    if matchups_filename is not None:
+        matchups = []
+        with open(matchups_filename) as f:
+            for i, line in enumerate(f):
+                if len(line.strip()) == 0:
+                    continue
+                item = json.loads(line)
+                matchups.append((item.get('index', i), normalize_matchup(item.get('matchup'), game_data)))
+    else:
+        matchups = [(0, scenario)]
+    summary = run_cluster_coordinator(game_data, matchups, episodes, seed, output, host, port, chunk_episodes, progress, state_filename)
+    print(json.dumps(summary), file=sys.stderr, flush=True)
+    return summary
+
+# Measure import time of the simulation core and how many episodes per second the simulator plays
+def run_benchmark(data_filename, scenario, episodes, num_workers, seed):
+    from benchmark import check_startup
+
+    is_startup_ok = check_startup()
+    start = time.perf_counter()
+    num_results = 0
+    for result in run_simulation(scenario, data_filename, 0, episodes, seed, num_workers):
+        num_results += 1
+    elapsed = time.perf_counter() - start
+    print('Simulation: {0} episodes in {1:.3f}s ({2:.1f} episodes/s) with {3} workers'.format(
+        num_results, elapsed, num_results / elapsed if elapsed > 0 else 0, num_workers), flush=True)
+    return is_startup_ok
 
 # Run a crappy UI console input example of the game
-def run_manual_game(game_data):
+def run_manual_game(game_data, opponent_budget=0):
     game_logger = create_logger(logging.INFO)
 
     battle = get_battle_fighters(game_logger, game_data, random)
-    battle_env = BattleEnv(game_logger, battle)
+    battle_env = BattleRunner(game_logger, battle)
 
     players = {}
     players[Team.BLUE] = ConsolePlayer(game_logger, game_data, battle_env, Team.BLUE)
-    players[Team.RED] = NonPlayer(game_logger, game_data, battle_env, Team.RED, random)
+    if opponent_budget > 0:
+        from search_player import SearchPlayer
+        players[Team.RED] = SearchPlayer(game_logger, game_data, battle_env, Team.RED, random, opponent_budget)
+    else:
+        players[Team.RED] = NonPlayer(game_logger, game_data, battle_env, Team.RED, random)
 
     run_episode(battle_env, players)
 
-def main():
-    game_data = GameData('data.json')
-    #run_training_agent(game_data)
-    run_manual_game(game_data)
+# Unit of a matchup from the command line: comma separated class levels, optionally prefixed with its location,
+# i.e. fighter,fighter or back:training_dummy
+def parse_matchup_unit(text):
+    location = Location.FRONT.name
+    if ':' in text:
+        location, text = text.split(':', 1)
+        location = location.upper()
+    return {'classes': [class_id.strip() for class_id in text.split(',') if class_id.strip()], 'location': location}
+
+# Integer argument of at least 1, i.e. the episodes between progress reports
+def parse_positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected an integer: {0}'.format(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError('Expected at least 1: {0}'.format(text))
+    return value
+
+# Ask a running balance service for the win rate of a matchup, printing every estimate as it arrives
+def run_balance_query(blue_units, red_units, episodes, seed, host, port):
+    from balance_service import request_balance
+
+    request = {'id': 1, 'matchup': {'blue': blue_units, 'red': red_units}, 'episodes': episodes, 'seed': seed}
+    for message in request_balance(request, host, port):
+        if message['type'] == 'partial':
+            print('{0}/{1} episodes blue win rate: {2:.3f} +- {3:.3f}'.format(
+                message['episodes'], message['requested_episodes'], message['blue_win_rate'], message['blue_win_rate_margin']),
+                file=sys.stderr, flush=True)
+        else:
+            print(json.dumps(message), flush=True)
+            return message['type'] == 'result'
+    return False
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Redice battle simulator. Runs the console game when no command is given.')
+    parser.add_argument('--data', default='data.json', help='game data file')
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_common_arguments(subparser, default_scenario, default_episodes):
+        subparser.add_argument('--scenario', default=default_scenario, choices=sorted(SCENARIOS.keys()))
+        subparser.add_argument('--episodes', type=int, default=default_episodes)
+        subparser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+        subparser.add_argument('--seed', type=int, default=0, help='root seed, episode i uses seed + i')
+        subparser.add_argument('--progress', type=parse_positive_int, default=constants.PROGRESS_INTERVAL, help='episodes between progress reports')
+
+    def add_metrics_arguments(subparser):
+        subparser.add_argument('--metrics', help='file the metrics are periodically written to in the text exposition format')
+        subparser.add_argument('--metrics-port', type=int, help='serve the metrics on http://127.0.0.1:<port>/metrics')
+
+    play = subparsers.add_parser('play', help='play a battle from the console')
+    play.add_argument('--opponent-budget', type=float, default=0,
+                      help='milliseconds the opponent searches per decision, 0 plays the scripted NonPlayer')
+
+    simulate = subparsers.add_parser('simulate', help='play a matchup between scripted players')
+    add_common_arguments(simulate, 'fighters', 1000)
+    simulate.add_argument('--output', help='file receiving one JSON result per episode, defaults to stdout')
+    simulate.add_argument('--format', default='jsonl', choices=['jsonl', 'binary'], help='binary requires --output, see results.py')
+    simulate.add_argument('--watch', action='store_true', help='reload the data file when it changes, between episodes')
+    simulate.add_argument('--telemetry', help='file receiving ability usage, damage and death timing by Class, see telemetry.py')
+    add_metrics_arguments(simulate)
+
+    train = subparsers.add_parser('train', help='train the Learning Agent')
+    add_common_arguments(train, None, 2000)
+    train.add_argument('--output', help='file receiving the exported Policy weights')
+    train.add_argument('--checkpoint', help='checkpoint file to save to and resume from, single worker only')
+    train.add_argument('--results', help='file recording every episode in the binary layout of results.py, single worker only')
+    add_metrics_arguments(train)
+
+    evaluate = subparsers.add_parser('evaluate', help='play a matchup with exported Policy weights as blue')
+    add_common_arguments(evaluate, 'fighters', 1000)
+    evaluate.add_argument('--weights', required=True, help='Policy weights exported by train')
+    evaluate.add_argument('--output', help='file receiving one JSON result per episode, defaults to stdout')
+    evaluate.add_argument('--format', default='jsonl', choices=['jsonl', 'binary'], help='binary requires --output, see results.py')
+    evaluate.add_argument('--watch', action='store_true', help='reload the data file when it changes, between episodes')
+    evaluate.add_argument('--telemetry', help='file receiving ability usage, damage and death timing by Class, see telemetry.py')
+    add_metrics_arguments(evaluate)
+
+    compare = subparsers.add_parser('compare', help='estimate how a variant of the data file changes win rates, see paired_simulation.py')
+    add_common_arguments(compare, 'fighters', 1000)
+    compare.add_argument('--variant', required=True, help='data file of the variant ruleset')
+    compare.add_argument('--antithetic', action='store_true', help='also play every episode with mirrored dice rolls')
+
+    compositions = subparsers.add_parser('compositions', help='list every distinct team or matchup, see compositions.py')
+    compositions.add_argument('--team-size', type=int, default=2)
+    compositions.add_argument('--levels', type=int, help='class levels every team spends, defaults to one per unit')
+    compositions.add_argument('--max-unit-levels', type=int)
+    compositions.add_argument('--tier', type=int, action='append', help='only use classes of the tier, repeat for several tiers')
+    compositions.add_argument('--location', action='append', choices=[Location.FRONT.name, Location.BACK.name],
+                              help='locations units can be at, defaults to both')
+    compositions.add_argument('--matchups', action='store_true', help='list pairs of teams instead of teams')
+    compositions.add_argument('--ordered', action='store_true', help='list both sides of every pair of different teams')
+    compositions.add_argument('--shard', type=parse_shard, default=(0, 1), help='only list this part, i.e. 0/4 for the first quarter')
+    compositions.add_argument('--output', help='file receiving one JSON line per team or matchup, defaults to stdout')
+
+    benchmark = subparsers.add_parser('benchmark', help='measure startup time and simulation speed')
+    add_common_arguments(benchmark, 'fighters', 1000)
+
+    serve = subparsers.add_parser('serve', help='run the balance service answering matchup queries, see balance_service.py')
+    serve.add_argument('--host', default=constants.SERVICE_HOST)
+    serve.add_argument('--port', type=int, default=constants.SERVICE_PORT)
+    serve.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    serve.add_argument('--watch', action='store_true', help='reload the data file when it changes')
+    serve.add_argument('--cache', help='directory keeping results between runs, see result_cache.py')
+    serve.add_argument('--cache-budget', type=float, default=constants.RESULT_CACHE_BUDGET / (1024 * 1024),
+                       help='megabytes the cache may take on disk')
+
+    query = subparsers.add_parser('query', help='ask a running balance service for the win rate of a matchup')
+    query.add_argument('--host', default=constants.SERVICE_HOST)
+    query.add_argument('--port', type=int, default=constants.SERVICE_PORT)
+    query.add_argument('--blue', action='append', required=True, type=parse_matchup_unit,
+                       help='blue unit as comma separated classes, i.e. fighter,fighter or back:fighter. Repeat for every unit')
+    query.add_argument('--red', action='append', required=True, type=parse_matchup_unit, help='red unit, same as --blue')
+    query.add_argument('--episodes', type=int, default=constants.SERVICE_DEFAULT_EPISODES)
+    query.add_argument('--seed', type=int, default=0)
+
+    game_server = subparsers.add_parser('game-server', help='host interactive battles over TCP, see game_server.py')
+    game_server.add_argument('--host', default=constants.GAME_SERVER_HOST)
+    game_server.add_argument('--port', type=int, default=constants.GAME_SERVER_PORT)
+    game_server.add_argument('--opponent-budget', type=float, default=0,
+                             help='milliseconds the opponent searches before replying to a command, 0 plays the scripted NonPlayer')
+
+    coordinate = subparsers.add_parser('coordinate', help='split a simulation between cluster-worker agents, see cluster.py')
+    coordinate.add_argument('--scenario', default='fighters', choices=sorted(SCENARIOS.keys()))
+    coordinate.add_argument('--matchups', help='file of matchups written by compositions --matchups, replaces --scenario')
+    coordinate.add_argument('--episodes', type=int, default=1000, help='episodes of every matchup')
+    coordinate.add_argument('--seed', type=int, default=0, help='root seed, episode i uses seed + i')
+    coordinate.add_argument('--chunk-episodes', type=int, default=constants.CLUSTER_CHUNK_EPISODES)
+    coordinate.add_argument('--host', default=constants.CLUSTER_HOST)
+    coordinate.add_argument('--port', type=int, default=constants.CLUSTER_PORT)
+    coordinate.add_argument('--output', help='file receiving one JSON summary per matchup, defaults to stdout')
+    coordinate.add_argument('--progress', action='store_true', help='report every merged chunk')
+    coordinate.add_argument('--state', help='file saving the finished chunks at intervals, a restarted job continues from it')
+
+    cluster_worker = subparsers.add_parser('cluster-worker', help='play chunks assigned by a coordinator')
+    cluster_worker.add_argument('--host', default=constants.CLUSTER_HOST)
+    cluster_worker.add_argument('--port', type=int, default=constants.CLUSTER_PORT)
+    cluster_worker.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    return parser
+
+def main(argv=None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    # The actor learner neither checkpoints nor records results, so don't drop them silently
+    if args.command == 'train' and args.workers > 1 and (args.checkpoint is not None or args.results is not None):
+        parser.error('--checkpoint and --results require --workers 1')
+
+    metrics_exporter = None
+    if getattr(args, 'metrics', None) is not None or getattr(args, 'metrics_port', None) is not None:
+        metrics_exporter = MetricsExporter(metrics_registry, args.metrics, args.metrics_port)
+        metrics_exporter.start()
+    try:
+        return run_command(args)
+    finally:
+        if metrics_exporter is not None:
+            metrics_exporter.stop()
+
+def run_command(args):
+    if args.command is None or args.command == 'play':
+        game_data = GameData(args.data)
+        run_manual_game(game_data, args.opponent_budget / 1000 if args.command == 'play' else 0)
+    elif args.command == 'simulate' or args.command == 'evaluate':
+        weights_filename = args.weights if args.command == 'evaluate' else None
+        telemetry = Telemetry() if args.telemetry is not None else None
+        if args.format == 'binary':
+            if args.output is None:
+                print('--format binary requires --output', file=sys.stderr)
+                return 2
+            with ResultWriter(args.output) as result_writer:
+                run_simulation_command(args.data, args.scenario, args.episodes, args.workers, args.seed, None, weights_filename,
+                                       args.progress, result_writer, args.watch, telemetry)
+        else:
+            output = open(args.output, 'w') if args.output is not None else sys.stdout
+            try:
+                run_simulation_command(args.data, args.scenario, args.episodes, args.workers, args.seed, output, weights_filename,
+                                       args.progress, watch=args.watch, telemetry=telemetry)
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+        if telemetry is not None:
+            with open(args.telemetry, 'w') as f:
+                json.dump(telemetry.get_report(), f, indent=2)
+    elif args.command == 'train':
+        if args.workers > 1:
+            scenario = args.scenario if args.scenario is not None else DEFAULT_TRAINING_SCENARIOS[-1]
+            run_actor_learner(args.data, scenario, args.episodes, args.workers, args.seed, args.output, args.progress)
+        else:
+            scenarios = [args.scenario] if args.scenario is not None else DEFAULT_TRAINING_SCENARIOS
+            game_data = GameData(args.data)
+            run_training_agent(game_data, scenarios, args.episodes, args.seed, args.checkpoint, args.output, args.progress, False,
+                               args.results)
+    elif args.command == 'compare':
+        run_compare_command(args.data, args.variant, args.scenario, args.episodes, args.workers, args.seed, args.antithetic,
+                            args.progress)
+    elif args.command == 'compositions':
+        locations = args.location if args.location is not None else [Location.FRONT.name, Location.BACK.name]
+        output = open(args.output, 'w') if args.output is not None else sys.stdout
+        try:
+            run_compositions_command(GameData(args.data), args.team_size, args.levels, args.tier, locations, args.max_unit_levels,
+                                     args.matchups, args.ordered, args.shard, output)
+        except ValueError as ex:
+            print(ex, file=sys.stderr)
+            return 2
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elif args.command == 'benchmark':
+        if not run_benchmark(args.data, args.scenario, args.episodes, args.workers, args.seed):
+            return 1
+    elif args.command == 'serve':
+        from balance_service import run_balance_service
+        run_balance_service(args.data, args.workers, args.watch, args.host, args.port, args.cache, int(args.cache_budget * 1024 * 1024))
+    elif args.command == 'query':
+        if not run_balance_query(args.blue, args.red, args.episodes, args.seed, args.host, args.port):
+            return 1
+    elif args.command == 'coordinate':
+        output = open(args.output, 'w') if args.output is not None else sys.stdout
+        try:
+            run_coordinate_command(GameData(args.data), args.scenario, args.matchups, args.episodes, args.seed, args.chunk_episodes,
+                                   args.host, args.port, output, args.progress, args.state)
+        except ValueError as ex:
+            print(ex, file=sys.stderr)
+            return 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elif args.command == 'cluster-worker':
+        from cluster import run_cluster_workers
+        run_cluster_workers(args.data, args.workers, args.host, args.port)
+    elif args.command == 'game-server':
+        from game_server import run_game_server
+        run_game_server(GameData(args.data), args.host, args.port, args.opponent_budget / 1000)
+    return 0
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import bisect
+import http.server
+import math
+import os
+import threading
+import time
+import constants
+
+"""
+Value which only goes up, i.e. episodes played
+"""
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get_data(self):
+        return self.value
+
+"""
+Value which is set to its latest measure, i.e. policy entropy
+"""
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def get_data(self):
+        return self.value
+
+"""
+Distribution of observed values counted into buckets given by their upper bounds, i.e. turns per episode
+"""
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        # The last count is for values above every bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_data(self):
+        return {'buckets': self.buckets, 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+"""
+Metrics of a process by name. Recording only updates a number in place, so it can be done on the hot path.
+Worker processes send snapshots of their own registry which are added to this one's when exporting.
+Snapshots are cumulative, so receiving one again from a worker replaces its previous one.
+"""
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.worker_snapshots = {}
+
+    def get_metric(self, metric_class, name, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = metric_class(name, *args)
+            self.metrics[name] = metric
+        elif not isinstance(metric, metric_class):
+            raise ValueError('Metric {0} is a {1}'.format(name, metric.kind))
+        return metric
+
+    def counter(self, name, help):
+        return self.get_metric(Counter, name, help)
+
+    def gauge(self, name, help):
+        return self.get_metric(Gauge, name, help)
+
+    def histogram(self, name, help, buckets):
+        return self.get_metric(Histogram, name, help, buckets)
+
+    def set_worker_snapshot(self, worker_id, snapshot):
+        self.worker_snapshots[worker_id] = snapshot
+
+    # Plain data of every metric by name, which can be pickled to another process
+    def get_snapshot(self):
+        return {name: (metric.kind, metric.help, metric.get_data()) for name, metric in list(self.metrics.items())}
+
+    # Snapshot of this registry with the ones of every worker added in.
+    # Counters and histograms are summed and gauges keep the value of this registry, or the last worker's
+    def get_aggregate_snapshot(self):
+        aggregate = self.get_snapshot()
+        for worker_id in sorted(self.worker_snapshots.keys()):
+            for name, (kind, help, data) in self.worker_snapshots[worker_id].items():
+                if name not in aggregate:
+                    aggregate[name] = (kind, help, data)
+                elif kind == 'counter':
+                    aggregate[name] = (kind, help, aggregate[name][2] + data)
+                elif kind == 'histogram':
+                    total = aggregate[name][2]
+                    aggregate[name] = (kind, help, {
+                        'buckets': total['buckets'],
+                        'counts': [a + b for a, b in zip(total['counts'], data['counts'])],
+                        'sum': total['sum'] + data['sum'],
+                        'count': total['count'] + data['count'],
+                    })
+                elif name not in self.metrics:
+                    aggregate[name] = (kind, help, data)
+        return aggregate
+
+def format_metric_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+# Render a snapshot in the Prometheus text exposition format
+def format_metrics_text(snapshot):
+    lines = []
+    for name in sorted(snapshot.keys()):
+        kind, help, data = snapshot[name]
+        lines.append('# HELP {0} {1}'.format(name, help))
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        if kind == 'histogram':
+            cumulative = 0
+            for bound, count in zip(data['buckets'] + [float('inf')], data['counts']):
+                cumulative += count
+                lines.append('{0}_bucket{{le="{1}"}} {2}'.format(name, format_metric_value(float(bound)), cumulative))
+            lines.append('{0}_sum {1}'.format(name, format_metric_value(data['sum'])))
+            lines.append('{0}_count {1}'.format(name, data['count']))
+        else:
+            lines.append('{0} {1}'.format(name, format_metric_value(data)))
+    return '\n'.join(lines) + '\n'
+
+# Registry of this process
+metrics_registry = MetricsRegistry()
+
+# Record the metrics of a finished episode. steps counts the actions selected by every player
+def record_episode(registry, turns, steps, invalid_actions, reward=None):
+    registry.counter('redice_episodes_total', 'Episodes played').inc()
+    registry.counter('redice_steps_total', 'Actions selected by players').inc(steps)
+    registry.histogram('redice_episode_turns', 'Turns per episode', constants.METRICS_TURN_BUCKETS).observe(turns)
+    registry.histogram('redice_episode_invalid_actions', 'Invalid actions per episode',
+                       constants.METRICS_INVALID_ACTION_BUCKETS).observe(invalid_actions)
+    if invalid_actions > constants.INVALID_ACTION_LIMIT:
+        registry.counter('redice_invalid_action_limit_total', 'Episodes ended by reaching the invalid action limit').inc()
+    if reward is not None:
+        registry.histogram('redice_episode_reward', 'Reward of the learning player per episode',
+                           constants.METRICS_REWARD_BUCKETS).observe(reward)
+
+# Record the duration and policy entropy of a Policy update
+def record_update(registry, seconds, entropy):
+    registry.counter('redice_updates_total', 'Policy updates').inc()
+    registry.histogram('redice_update_seconds', 'Duration of Policy updates', constants.METRICS_SECONDS_BUCKETS).observe(seconds)
+    registry.gauge('redice_policy_entropy', 'Mean entropy of the Policy over the last update batch').set(entropy)
+
+# Gauges computed from how fast a counter increased between exports
+METRICS_RATES = {
+    'redice_episodes_per_second': 'redice_episodes_total',
+    'redice_steps_per_second': 'redice_steps_total',
+}
+
+"""
+Periodically writes the registry to a text exposition file and serves it on a local scrape endpoint.
+Exports happen on a background thread. The endpoint answers with the last export, so scrapes don't touch the registry.
+The file is replaced atomically so readers never see a partial export.
+"""
+class MetricsExporter:
+    def __init__(self, registry, filename=None, port=None, host='127.0.0.1', interval=constants.METRICS_EXPORT_INTERVAL):
+        self.registry = registry
+        self.filename = filename
+        self.interval = interval
+        self.text = ''
+        self.last_export_time = time.monotonic()
+        self.last_counter_values = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.server = None
+        self.server_thread = None
+        if port is not None:
+            exporter = self
+
+            class MetricsHandler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path not in ['/', '/metrics']:
+                        self.send_error(404)
+                        return
+                    body = exporter.text.encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    return
+
+            self.server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+            self.port = self.server.server_address[1]
+
+    # Set the rate gauges from the counters' increase since the last export
+    def update_rates(self):
+        now = time.monotonic()
+        elapsed = now - self.last_export_time
+        snapshot = self.registry.get_aggregate_snapshot()
+        for gauge_name, counter_name in METRICS_RATES.items():
+            if counter_name not in snapshot:
+                continue
+            value = snapshot[counter_name][2]
+            last_value = self.last_counter_values.get(counter_name, 0)
+            if elapsed > 0:
+                self.registry.gauge(gauge_name, 'Increase of {0} per second'.format(counter_name)).set((value - last_value) / elapsed)
+            self.last_counter_values[counter_name] = value
+        self.last_export_time = now
+
+    def export(self):
+        self.update_rates()
+        self.text = format_metrics_text(self.registry.get_aggregate_snapshot())
+        if self.filename is not None:
+            temp_filename = self.filename + '.tmp'
+            with open(temp_filename, 'w') as f:
+                f.write(self.text)
+            os.replace(temp_filename, self.filename)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self.export()
+        self.thread = threading.Thread(target=self.run, name='metrics_exporter', daemon=True)
+        self.thread.start()
+        if self.server is not None:
+            self.server_thread = threading.Thread(target=self.server.serve_forever, name='metrics_server', daemon=True)
+            self.server_thread.start()
+
+    # Stop exporting after a last export with the final values
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.export()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
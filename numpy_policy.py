@@ -0,0 +1,94 @@
+import numpy as np
+
+# Version of the arrays written by Policy.export_weights. Exports from before versioning count as version 1,
+# they lack obs_nvec so discrete keys of more than one value can't be laid out
+POLICY_WEIGHTS_VERSION = 2
+
+"""
+Forward pass of an exported Policy using only NumPy.
+Matches Policy.forward for the weights written by Policy.export_weights, so evaluation workers
+can act with a trained model without importing torch or gym.
+"""
+class NumpyPolicy:
+    def __init__(self, filename):
+        with np.load(filename) as data:
+            version = int(data['version']) if 'version' in data.files else 1
+            if version != POLICY_WEIGHTS_VERSION:
+                raise ValueError('Unsupported policy weights version:{0} in {1}, export them again'.format(version, filename))
+            # Weights are stored transposed so a forward pass is x @ W + b
+            self.layers = []
+            for layer_name in ['affine1', 'affine2', 'affine3']:
+                self.layers.append((np.ascontiguousarray(data[layer_name + '_weight'].T), data[layer_name + '_bias']))
+            self.action_weight = np.ascontiguousarray(data['action_head_weight'].T)
+            self.action_bias = data['action_head_bias']
+            self.value_weight = np.ascontiguousarray(data['value_head_weight'].T)
+            self.value_bias = data['value_head_bias']
+
+            obs_keys = [str(key) for key in data['obs_keys']]
+            obs_kinds = data['obs_kinds'].tolist()
+            obs_sizes = data['obs_sizes'].tolist()
+            obs_nvec = data['obs_nvec'].tolist()
+            obs_low = data['obs_low']
+            obs_high = data['obs_high']
+            self.action_keys = [str(key) for key in data['action_keys']]
+            self.action_sizes = data['action_sizes'].tolist()
+
+        # Same layout as Policy.preprocess_observation - all one-hot discrete keys first, then scaled boxes.
+        # Each discrete key has the offset of the one-hot group of each of its values, and whether it's a single value
+        self.discrete_keys = []
+        self.box_keys = []
+        offset = 0
+        nvec_offset = 0
+        for key, kind, size in zip(obs_keys, obs_kinds, obs_sizes):
+            if kind == 0 or kind == 2:
+                offsets = []
+                for n in obs_nvec[nvec_offset:nvec_offset + size]:
+                    offsets.append(offset)
+                    offset += n
+                nvec_offset += size
+                self.discrete_keys.append((key, offsets, kind == 0))
+        box_offset = 0
+        for key, kind, size in zip(obs_keys, obs_kinds, obs_sizes):
+            if kind == 1:
+                low = obs_low[box_offset:box_offset + size]
+                high = obs_high[box_offset:box_offset + size]
+                self.box_keys.append((key, offset, size, low, 1.0 / (high - low)))
+                offset += size
+                box_offset += size
+        self.input_size = offset
+        self.output_size = int(np.prod(self.action_sizes))
+
+    def preprocess_observation(self, x):
+        ret = np.zeros(self.input_size, dtype=np.float32)
+        for key, offsets, is_single in self.discrete_keys:
+            if is_single:
+                ret[offsets[0] + int(x[key])] = 1.0
+            else:
+                values = x[key]
+                for i in range(len(offsets)):
+                    ret[offsets[i] + int(values[i])] = 1.0
+        for key, offset, size, low, inv_range in self.box_keys:
+            ret[offset:offset + size] = (np.asarray(x[key], dtype=np.float32).reshape(size) - low) * inv_range
+        return ret
+
+    # Returns the probability of each action and the value of the observation
+    def forward(self, x):
+        x = self.preprocess_observation(x)
+        return self.forward_array(x)
+
+    # Forward on already preprocessed observations, either one or a batch stacked on the first axis
+    def forward_array(self, x):
+        for weight, bias in self.layers:
+            x = np.maximum(x @ weight + bias, 0.0)
+        logits = x @ self.action_weight + self.action_bias
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp_logits = np.exp(logits)
+        action_prob = exp_logits / exp_logits.sum(axis=-1, keepdims=True)
+        state_values = x @ self.value_weight + self.value_bias
+        return action_prob, state_values
+
+    # Sample an action index from the probabilities. rng only needs a random() method
+    def sample(self, probs, rng):
+        cumulative = np.cumsum(probs)
+        index = int(np.searchsorted(cumulative, rng.random() * cumulative[-1], side='right'))
+        return min(index, len(probs) - 1)
@@ -0,0 +1,65 @@
+import numpy as np
+from gym.spaces import Box, Discrete, MultiDiscrete
+
+"""
+Flattens observations of a Dict observation space into the input of the Policy:
+every discrete value one-hot encoded, followed by every box value scaled to [0, 1].
+Values can be read by key from a dict, or by position from BattleRunner.get_observed_values.
+The cost of an encoding is linear in the number of observed values.
+"""
+class ObservationEncoder:
+    def __init__(self, observation_space, value_keys=None):
+        value_indices = {key: i for i, key in enumerate(value_keys)} if value_keys is not None else {}
+        # (key, value index, offsets of each one-hot group) for Discrete and MultiDiscrete values
+        self.discrete = []
+        # (key, value index, offset, low, 1 / (high - low)) for Box values
+        self.box = []
+        offset = 0
+        for var_key in observation_space.spaces.keys():
+            space = observation_space[var_key]
+            if isinstance(space, Discrete):
+                self.discrete.append((var_key, value_indices.get(var_key), None, offset))
+                offset += space.n
+            elif isinstance(space, MultiDiscrete):
+                offsets = []
+                for n in space.nvec.flatten().tolist():
+                    offsets.append(offset)
+                    offset += n
+                self.discrete.append((var_key, value_indices.get(var_key), offsets, None))
+        for var_key in observation_space.spaces.keys():
+            space = observation_space[var_key]
+            if isinstance(space, Box):
+                size = int(np.prod(space.shape))
+                low = space.low.flatten().astype(np.float32)
+                high = space.high.flatten().astype(np.float32)
+                self.box.append((var_key, value_indices.get(var_key), offset, size, low, 1.0 / (high - low)))
+                offset += size
+        self.size = offset
+
+    # Encode values ordered like the value_keys given on construction
+    def encode(self, values, out=None):
+        return self.encode_entries(values, 1, out)
+
+    # Encode a dict of values keyed like the observation space
+    def encode_dict(self, observation, out=None):
+        return self.encode_entries(observation, 0, out)
+
+    def encode_entries(self, values, lookup_index, out):
+        if out is None:
+            out = np.zeros(self.size, dtype=np.float32)
+        else:
+            out[:] = 0.0
+        for entry in self.discrete:
+            value = values[entry[lookup_index]]
+            offsets = entry[2]
+            if offsets is None:
+                out[entry[3] + int(value)] = 1.0
+            else:
+                for i in range(len(offsets)):
+                    out[offsets[i] + int(value[i])] = 1.0
+        for entry in self.box:
+            value = values[entry[lookup_index]]
+            offset = entry[2]
+            size = entry[3]
+            out[offset:offset + size] = (np.asarray(value, dtype=np.float32).reshape(size) - entry[4]) * entry[5]
+        return out
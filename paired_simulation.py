@@ -0,0 +1,116 @@
+import math
+import multiprocessing
+import constants
+from simulation import *
+
+# Score of blue in a simulation result: 1 for a win, 0.5 for a draw and 0 for a loss
+def get_blue_score(result):
+    if result['winner'] == Team.BLUE.name:
+        return 1.0
+    elif result['winner'] == Team.RED.name:
+        return 0.0
+    return 0.5
+
+# Sample variance from the count, sum and sum of squares of the samples
+def get_variance(count, total, total_squares):
+    if count <= 1:
+        return 0.0
+    return max(total_squares - total * total / count, 0.0) / (count - 1)
+
+"""
+Difference between the blue scores of a ruleset and its variant estimated from paired episodes.
+Each pair adds the scores of the battles both rulesets played from one seed. The margin of the difference
+comes from the variance of the paired differences, which is far smaller than the one of two independent runs
+when the rolls are shared. For comparison, independent_margin is the margin two independent runs playing
+as many battles would get and speedup how many times more battles they would need to match the paired margin.
+"""
+class PairedEstimate:
+    def __init__(self):
+        self.num_pairs = 0
+        self.difference_sum = 0.0
+        self.difference_squares = 0.0
+        # Per battle sums, scores of the ruleset at 0 and of the variant at 1
+        self.num_battles = [0, 0]
+        self.score_sums = [0.0, 0.0]
+        self.score_squares = [0.0, 0.0]
+
+    def add(self, scores, variant_scores):
+        difference = sum(variant_scores) / len(variant_scores) - sum(scores) / len(scores)
+        self.num_pairs += 1
+        self.difference_sum += difference
+        self.difference_squares += difference * difference
+        for i, battle_scores in enumerate([scores, variant_scores]):
+            for score in battle_scores:
+                self.num_battles[i] += 1
+                self.score_sums[i] += score
+                self.score_squares[i] += score * score
+
+    def get_summary(self, z=constants.WIN_RATE_CONFIDENCE_Z):
+        summary = {}
+        summary['pairs'] = self.num_pairs
+        summary['battles'] = sum(self.num_battles)
+        summary['score'] = self.score_sums[0] / self.num_battles[0] if self.num_battles[0] > 0 else 0.0
+        summary['variant_score'] = self.score_sums[1] / self.num_battles[1] if self.num_battles[1] > 0 else 0.0
+        summary['difference'] = self.difference_sum / self.num_pairs if self.num_pairs > 0 else 0.0
+        paired_variance = get_variance(self.num_pairs, self.difference_sum, self.difference_squares) / max(self.num_pairs, 1)
+        independent_variance = 0.0
+        for i in range(2):
+            independent_variance += get_variance(self.num_battles[i], self.score_sums[i], self.score_squares[i]) / max(self.num_battles[i], 1)
+        summary['margin'] = z * math.sqrt(paired_variance)
+        summary['independent_margin'] = z * math.sqrt(independent_variance)
+        summary['speedup'] = independent_variance / paired_variance if paired_variance > 0 else None
+        return summary
+
+"""
+Plays every seed with a ruleset and a variant of it using common random numbers.
+With antithetic, every seed is also played with the mirrored rolls by both, see AntitheticRandom.
+"""
+class PairedSimulator:
+    def __init__(self, scenario, data_filename, variant_filename, antithetic=False):
+        self.simulators = [
+            Simulator(scenario, data_filename, common_random_numbers=True),
+            Simulator(scenario, variant_filename, common_random_numbers=True),
+        ]
+        self.antithetic = antithetic
+
+    def run_episode(self, episode, seed):
+        all_scores = []
+        for simulator in self.simulators:
+            scores = [get_blue_score(simulator.run_episode(episode, seed))]
+            if self.antithetic:
+                scores.append(get_blue_score(simulator.run_episode(episode, seed, True)))
+            all_scores.append(scores)
+        result = {}
+        result['episode'] = episode
+        result['seed'] = seed
+        result['scores'] = all_scores[0]
+        result['variant_scores'] = all_scores[1]
+        result['difference'] = sum(all_scores[1]) / len(all_scores[1]) - sum(all_scores[0]) / len(all_scores[0])
+        return result
+
+worker_paired_simulator = None
+
+def init_paired_worker(scenario, data_filename, variant_filename, antithetic):
+    global worker_paired_simulator
+    worker_paired_simulator = PairedSimulator(scenario, data_filename, variant_filename, antithetic)
+
+def run_paired_worker_chunk(episodes):
+    return [worker_paired_simulator.run_episode(episode, seed) for episode, seed in episodes]
+
+# Play episodes start_i to end_i (exclusive) seeded from seed + episode index with both rulesets.
+# Paired results are yielded in episode order as soon as they are available
+def run_paired_simulation(scenario, data_filename, variant_filename, start_i, end_i, seed, num_workers=1, antithetic=False,
+                          chunk_size=constants.SIMULATION_CHUNK_SIZE):
+    episodes = [(i, seed + i) for i in range(start_i, end_i)]
+    if num_workers <= 1:
+        simulator = PairedSimulator(scenario, data_filename, variant_filename, antithetic)
+        for episode, episode_seed in episodes:
+            yield simulator.run_episode(episode, episode_seed)
+        return
+
+    chunks = [episodes[i:i + chunk_size] for i in range(0, len(episodes), chunk_size)]
+    with multiprocessing.Pool(num_workers, initializer=init_paired_worker,
+                              initargs=(scenario, data_filename, variant_filename, antithetic)) as pool:
+        for results in pool.imap(run_paired_worker_chunk, chunks):
+            for result in results:
+                yield result
@@ -4,9 +4,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 import gym
-from collections import namedtuple
-
-SavedAction = namedtuple('SavedAction', ['log_prob', 'value'])
+from observation_encoder import *
+from numpy_policy import *
 
 """
 implements both actor and critic in one model
@@ -18,6 +17,7 @@ class Policy(nn.Module):
         # Determine the input size for the neural network
         self.observation_space = observation_space
         self.action_space = action_space
+        self.encoder = ObservationEncoder(observation_space)
         self.input_size = self.get_input_size()
         self.affine1 = nn.Linear(self.input_size, 128)
         self.affine2 = nn.Linear(128, 64)
@@ -31,13 +31,14 @@ class Policy(nn.Module):
         # critic's layer
         self.value_head = nn.Linear(128, 1)
 
-        # action & reward buffer
-        self.saved_actions = []
-        self.rewards = []
-
     def forward(self, x):
         # forward of both actor and critic
         x = self.preprocess_observation(x)
+        return self.forward_tensor(x)
+
+    # Forward on already preprocessed observations. Accepts a single observation
+    # or a batch of them stacked along the first dimension
+    def forward_tensor(self, x):
         x = F.relu(self.affine1(x))
         x = F.relu(self.affine2(x))
         x = F.relu(self.affine3(x))
@@ -55,39 +56,60 @@ class Policy(nn.Module):
         return action_prob, state_values
 
     def get_input_size(self):
-        input_size = 0
-        for var_key in self.observation_space.spaces.keys():
-            if isinstance(self.observation_space[var_key], gym.spaces.Discrete):
-                input_size += self.observation_space[var_key].n
-            elif isinstance(self.observation_space[var_key], gym.spaces.Box):
-                input_size += self.observation_space[var_key].shape[0]
-        return input_size
+        return self.encoder.size
 
     def get_output_size(self):
         # Assumes all discrete
         return np.prod([self.action_space[action].n for action in self.action_space.keys()])
 
+    # One-hot encode the discrete variables and scale the continuous variables to [0, 1]
     def preprocess_observation(self, x):
-        # Preprocess discrete variables
-        one_hot_encoded_discrete = []
-        for var_key in self.observation_space.spaces.keys():
-            if isinstance(self.observation_space[var_key], gym.spaces.Discrete):
-                num_classes = self.observation_space[var_key].n
-                one_hot_encoded = np.eye(num_classes)[x[var_key]]
-                one_hot_encoded_discrete.extend(one_hot_encoded)
-
-        # Preprocess continuous variables
-        scaled_continuous = []
-        for var_key in self.observation_space.spaces.keys():
-            if isinstance(self.observation_space[var_key], gym.spaces.Box):
-                lower_bound = self.observation_space[var_key].low
-                upper_bound = self.observation_space[var_key].high
-                scaled_value = (x[var_key] - lower_bound) / (upper_bound - lower_bound)
-                scaled_continuous.extend(scaled_value)
-
-        # Concatenate the preprocessed variables
-        preprocessed_observation = np.concatenate((one_hot_encoded_discrete, scaled_continuous))
+        preprocessed_observation = self.encoder.encode_dict(x)
         # Convert the preprocessed observation to a PyTorch Tensor
-        preprocessed_tensor = torch.from_numpy(preprocessed_observation).float()
-        return preprocessed_tensor
-
+        return torch.from_numpy(preprocessed_observation)
+
+    # Write the weights and the observation layout to a compact .npz file which can be run
+    # without torch or gym by NumpyPolicy
+    def export_weights(self, filename):
+        arrays = {}
+        for layer_name in ['affine1', 'affine2', 'affine3', 'action_head', 'value_head']:
+            layer = getattr(self, layer_name)
+            arrays[layer_name + '_weight'] = layer.weight.detach().cpu().numpy().astype(np.float32)
+            arrays[layer_name + '_bias'] = layer.bias.detach().cpu().numpy().astype(np.float32)
+
+        # Describe how preprocess_observation lays out every observation key.
+        # Kinds are 0 for Discrete, 1 for Box and 2 for MultiDiscrete. Sizes are the number of values of the key
+        obs_keys = []
+        obs_kinds = []
+        obs_sizes = []
+        obs_nvec = []
+        obs_low = []
+        obs_high = []
+        for var_key in self.observation_space.spaces.keys():
+            space = self.observation_space[var_key]
+            if isinstance(space, gym.spaces.Discrete):
+                obs_keys.append(var_key)
+                obs_kinds.append(0)
+                obs_sizes.append(1)
+                obs_nvec.append(space.n)
+            elif isinstance(space, gym.spaces.MultiDiscrete):
+                obs_keys.append(var_key)
+                obs_kinds.append(2)
+                obs_sizes.append(space.nvec.size)
+                obs_nvec.extend(space.nvec.flatten().tolist())
+            elif isinstance(space, gym.spaces.Box):
+                obs_keys.append(var_key)
+                obs_kinds.append(1)
+                obs_sizes.append(int(np.prod(space.shape)))
+                obs_low.extend(space.low.flatten().tolist())
+                obs_high.extend(space.high.flatten().tolist())
+        arrays['obs_keys'] = np.array(obs_keys)
+        arrays['obs_kinds'] = np.array(obs_kinds, dtype=np.int64)
+        arrays['obs_sizes'] = np.array(obs_sizes, dtype=np.int64)
+        arrays['obs_nvec'] = np.array(obs_nvec, dtype=np.int64)
+        arrays['obs_low'] = np.array(obs_low, dtype=np.float32)
+        arrays['obs_high'] = np.array(obs_high, dtype=np.float32)
+        arrays['action_keys'] = np.array(list(self.action_space.keys()))
+        arrays['action_sizes'] = np.array([self.action_space[action].n for action in self.action_space.keys()], dtype=np.int64)
+        arrays['version'] = np.array(POLICY_WEIGHTS_VERSION, dtype=np.int64)
+        np.savez(filename, **arrays)
@@ -0,0 +1,174 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+import constants
+from game_data import *
+
+# Version of the index and entry files of a result cache
+RESULT_CACHE_VERSION = 1
+RESULT_CACHE_INDEX = 'index.json'
+
+# Sum two aggregates of episodes, i.e. the ones returned by run_matchup_chunk. Every field is an integer count
+def merge_aggregates(aggregate, other):
+    ret = {}
+    ret['episodes'] = aggregate['episodes'] + other['episodes']
+    ret['wins'] = dict(aggregate['wins'])
+    for winner in other['wins']:
+        ret['wins'][winner] = ret['wins'].get(winner, 0) + other['wins'][winner]
+    ret['total_turns'] = aggregate['total_turns'] + other['total_turns']
+    ret['turn_squares'] = aggregate.get('turn_squares', 0) + other.get('turn_squares', 0)
+    return ret
+
+# Key of the results of a normalized matchup played by the policy, i.e. 'scripted' for NonPlayers on both sides,
+# from the root seed. classes_hash is the hash of the rows the matchup's Classes depend on, see get_classes_hash
+def get_result_cache_key(classes_hash, matchup, policy, seed):
+    return hash_raw([RESULT_CACHE_VERSION, classes_hash, matchup, policy, seed])
+
+# Write a file through a temporary one so readers never see it partially written
+def write_file_atomically(filename, content):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as f:
+        f.write(content)
+    os.replace(temp_filename, filename)
+
+"""
+Persistent store of simulation aggregates which outlives the process, i.e. between sessions of the balance service.
+An entry is keyed by the hash of the rows the matchup's Classes depend on, the normalized matchup, the identity
+of the players' policy and the root seed, and holds the aggregate of episodes 0 to n of that seed.
+Simulating further episodes of the seed extends the entry with merge, so later questions asking for more
+episodes only pay for the difference.
+Entries are small JSON files found through an index file which lists them from least to most recently used.
+The least recently used entries are deleted while the cache is over its disk budget.
+A cache directory should only be written by one process at a time. Within the process, methods may be called
+from several threads, i.e. to keep disk access off an event loop.
+"""
+class ResultCache:
+    def __init__(self, directory, budget_bytes=constants.RESULT_CACHE_BUDGET):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.index_filename = os.path.join(directory, RESULT_CACHE_INDEX)
+        # Key to [size in bytes, episodes], from least to most recently used
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.is_dirty = False
+        self.num_hits = 0
+        self.num_misses = 0
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self.load_index()
+
+    def get_entry_filename(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    # A missing or unreadable index starts an empty cache. Entries whose file is gone are dropped
+    def load_index(self):
+        if not os.path.exists(self.index_filename):
+            return
+        try:
+            with open(self.index_filename) as f:
+                index = json.load(f)
+        except ValueError as ex:
+            print('Unable to read result cache index {0}: {1}'.format(self.index_filename, ex), file=sys.stderr)
+            return
+        if index.get('version') != RESULT_CACHE_VERSION:
+            return
+        for key, size, episodes in index['entries']:
+            if os.path.exists(self.get_entry_filename(key)):
+                self.entries[key] = [size, episodes]
+                self.total_bytes += size
+            else:
+                self.is_dirty = True
+
+    def flush(self):
+        with self.lock:
+            if not self.is_dirty:
+                return
+            index = {}
+            index['version'] = RESULT_CACHE_VERSION
+            index['entries'] = [[key, size, episodes] for key, (size, episodes) in self.entries.items()]
+            write_file_atomically(self.index_filename, json.dumps(index))
+            self.is_dirty = False
+
+    def close(self):
+        self.flush()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # Number of episodes stored under the key without reading the entry, 0 if there is none
+    def get_episodes(self, key):
+        entry = self.entries.get(key)
+        return entry[1] if entry is not None else 0
+
+    # Aggregate stored under the key or None
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.num_misses += 1
+                return None
+            try:
+                with open(self.get_entry_filename(key)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.remove(key)
+                self.num_misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.is_dirty = True
+            self.num_hits += 1
+            return entry['aggregate']
+
+    # Store an aggregate, replacing the one under the key. description is kept in the entry to tell what it is
+    def put(self, key, aggregate, description=None):
+        with self.lock:
+            entry = {}
+            entry['version'] = RESULT_CACHE_VERSION
+            entry['description'] = description
+            entry['aggregate'] = aggregate
+            content = json.dumps(entry)
+            write_file_atomically(self.get_entry_filename(key), content)
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[0]
+            self.entries[key] = [len(content), aggregate['episodes']]
+            self.total_bytes += len(content)
+            self.is_dirty = True
+            self.evict()
+            self.flush()
+
+    # Add the aggregate of the next episodes of the seed, i.e. from get_episodes(key) on, to the entry of the key.
+    # Returns the combined aggregate
+    def merge(self, key, aggregate, description=None):
+        with self.lock:
+            existing = self.get(key)
+            if existing is not None:
+                aggregate = merge_aggregates(existing, aggregate)
+            self.put(key, aggregate, description)
+            return aggregate
+
+    def remove(self, key):
+        with self.lock:
+            size, episodes = self.entries.pop(key)
+            self.total_bytes -= size
+            self.is_dirty = True
+            try:
+                os.remove(self.get_entry_filename(key))
+            except FileNotFoundError:
+                pass
+
+    # Delete the least recently used entries until the cache fits its budget, always keeping the newest entry
+    def evict(self):
+        with self.lock:
+            while self.total_bytes > self.budget_bytes and len(self.entries) > 1:
+                self.remove(next(iter(self.entries)))
+
+    def get_stats(self):
+        with self.lock:
+            stats = {}
+            stats['entries'] = len(self.entries)
+            stats['bytes'] = self.total_bytes
+            stats['budget_bytes'] = self.budget_bytes
+            stats['hits'] = self.num_hits
+            stats['misses'] = self.num_misses
+            return stats
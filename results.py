@@ -0,0 +1,121 @@
+import os
+import queue
+import struct
+import threading
+import constants
+
+# Identifies a results file and the version of its record layout
+RESULTS_MAGIC = b'RDRS'
+RESULTS_VERSION = 2
+# Header: magic, version, record size
+RESULTS_HEADER = struct.Struct('<4sII')
+# Record: episode, seed, turns, winner, steps, invalid actions, outcome, reward
+RESULTS_RECORD = struct.Struct('<qqiiiiid')
+RESULTS_FIELDS = ['episode', 'seed', 'turns', 'winner', 'steps', 'invalid_actions', 'outcome', 'reward']
+
+# Raises ValueError unless the header is the one of results files of this version
+def check_results_header(filename, header):
+    magic, version, record_size = RESULTS_HEADER.unpack(header)
+    if magic != RESULTS_MAGIC:
+        raise ValueError('{0} is not a results file'.format(filename))
+    if version != RESULTS_VERSION or record_size != RESULTS_RECORD.size:
+        raise ValueError('Unsupported results version:{0} record size:{1}'.format(version, record_size))
+
+"""
+Append-only writer of fixed size episode records.
+Records are packed into a block in memory and whole blocks are written by a background thread,
+so recording an episode never waits on the disk.
+An existing file is appended to after checking its header. A partially written trailing record, i.e. from a crash,
+is cut off first so later records stay aligned.
+"""
+class ResultWriter:
+    def __init__(self, filename, block_records=constants.RESULTS_BLOCK_RECORDS):
+        self.filename = filename
+        self.block_records = block_records
+        self.block = bytearray(block_records * RESULTS_RECORD.size)
+        self.num_block_records = 0
+        self.num_records = 0
+        self.file = self.open_file(filename)
+        self.blocks = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='result_writer', daemon=True)
+        self.thread.start()
+
+    # Open the file positioned after its last whole record, writing the header if it has none
+    def open_file(self, filename):
+        f = open(filename, 'r+b' if os.path.exists(filename) else 'wb')
+        size = f.seek(0, os.SEEK_END)
+        if size < RESULTS_HEADER.size:
+            # Empty, or the header itself was cut off before any record
+            f.seek(0)
+            f.truncate()
+            f.write(RESULTS_HEADER.pack(RESULTS_MAGIC, RESULTS_VERSION, RESULTS_RECORD.size))
+            return f
+        f.seek(0)
+        try:
+            check_results_header(filename, f.read(RESULTS_HEADER.size))
+        except ValueError:
+            f.close()
+            raise
+        num_records = (size - RESULTS_HEADER.size) // RESULTS_RECORD.size
+        end = RESULTS_HEADER.size + num_records * RESULTS_RECORD.size
+        if end != size:
+            f.truncate(end)
+        f.seek(end)
+        return f
+
+    # winner is the Team which won the episode and outcome the BattleOutcome it finished with
+    def write(self, episode, seed, turns, winner, steps, invalid_actions, outcome, reward):
+        RESULTS_RECORD.pack_into(self.block, self.num_block_records * RESULTS_RECORD.size,
+                                 episode, seed, turns, winner.value, steps, invalid_actions, outcome.value, reward)
+        self.num_block_records += 1
+        self.num_records += 1
+        if self.num_block_records >= self.block_records:
+            self.flush()
+
+    # Hand the records packed so far to the writing thread
+    def flush(self):
+        if self.num_block_records <= 0:
+            return
+        self.blocks.put(bytes(self.block[:self.num_block_records * RESULTS_RECORD.size]))
+        self.num_block_records = 0
+
+    def close(self):
+        self.flush()
+        self.blocks.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def run(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            self.file.write(block)
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Load a results file into a NumPy structured array with one named field per record column
+def load_results(filename):
+    import numpy as np
+
+    with open(filename, 'rb') as f:
+        check_results_header(filename, f.read(RESULTS_HEADER.size))
+
+    dtype = np.dtype([
+        ('episode', '<i8'),
+        ('seed', '<i8'),
+        ('turns', '<i4'),
+        ('winner', '<i4'),
+        ('steps', '<i4'),
+        ('invalid_actions', '<i4'),
+        ('outcome', '<i4'),
+        ('reward', '<f8'),
+    ])
+    # Ignore a partially written trailing record
+    num_records = (os.path.getsize(filename) - RESULTS_HEADER.size) // RESULTS_RECORD.size
+    return np.fromfile(filename, dtype=dtype, count=num_records, offset=RESULTS_HEADER.size)
@@ -0,0 +1,97 @@
+import random
+from character import *
+from targetable import *
+from battle import *
+
+def get_battle_training_dummies(logger, game_data, random):
+    player_character1 = Character(game_data, 'John Wayne', ['fighter', 'fighter'])
+    player_unit1 = Unit(logger, game_data, player_character1, Team.BLUE, Location.FRONT, 'P1')
+    player_character2 = Character(game_data, 'Hilbert Wayne', ['fighter', 'fighter'])
+    player_unit2 = Unit(logger, game_data, player_character2, Team.BLUE, Location.FRONT, 'P2')
+    enemy_character1 = Character(game_data, 'Rubick Coridano', ['training_dummy', 'training_dummy'])
+    enemy_unit1 = Unit(logger, game_data, enemy_character1, Team.RED, Location.FRONT, 'E1')
+    enemy_character2 = Character(game_data, 'Aaron Keller', ['training_dummy', 'training_dummy'])
+    enemy_unit2 = Unit(logger, game_data, enemy_character2, Team.RED, Location.BACK, 'E2')
+
+    units = [player_unit1, player_unit2, enemy_unit1, enemy_unit2]
+
+    battle = Battle(logger, units, random)
+    return battle
+
+def get_battle_fighters(logger, game_data, random):
+    player_character1 = Character(game_data, 'John Wayne', ['fighter', 'fighter'])
+    player_unit1 = Unit(logger, game_data, player_character1, Team.BLUE, Location.FRONT, 'P1')
+    player_character2 = Character(game_data, 'Hilbert Wayne', ['fighter', 'fighter'])
+    player_unit2 = Unit(logger, game_data, player_character2, Team.BLUE, Location.FRONT, 'P2')
+    enemy_character1 = Character(game_data, 'Rubick Coridano', ['fighter', 'fighter'])
+    enemy_unit1 = Unit(logger, game_data, enemy_character1, Team.RED, Location.FRONT, 'E1')
+    enemy_character2 = Character(game_data, 'Aaron Keller', ['fighter', 'fighter'])
+    enemy_unit2 = Unit(logger, game_data, enemy_character2, Team.RED, Location.BACK, 'E2')
+
+    units = [player_unit1, player_unit2, enemy_unit1, enemy_unit2]
+
+    battle = Battle(logger, units, random)
+    return battle
+
+# Validate a matchup and write it in its canonical form, so equal matchups compare and hash equal.
+# A matchup lists the units of each team, e.g. {'blue': [['fighter', 'fighter']], 'red': [['training_dummy']]}
+# where each unit is the list of its class levels or a dict {'classes': [...], 'location': 'BACK'}. Units start in the front by default
+def normalize_matchup(matchup, game_data):
+    if not isinstance(matchup, dict):
+        raise ValueError('Matchup must be an object with blue and red units')
+    ret = {}
+    for team_key in ['blue', 'red']:
+        unit_specs = matchup.get(team_key)
+        if not isinstance(unit_specs, list) or len(unit_specs) == 0:
+            raise ValueError('Matchup needs at least one {0} unit'.format(team_key))
+        units = []
+        for unit_spec in unit_specs:
+            if isinstance(unit_spec, dict):
+                class_ids = unit_spec.get('classes')
+                location = unit_spec.get('location', Location.FRONT.name)
+            else:
+                class_ids = unit_spec
+                location = Location.FRONT.name
+            if not isinstance(class_ids, list) or len(class_ids) == 0:
+                raise ValueError('Every unit needs a list of classes: {0}'.format(unit_spec))
+            for class_id in class_ids:
+                if not isinstance(class_id, str) or class_id not in game_data.get_sheet(SheetId.Classes):
+                    raise ValueError('Unknown class: {0}'.format(class_id))
+            if location not in [Location.FRONT.name, Location.BACK.name]:
+                raise ValueError('Unknown location: {0}'.format(location))
+            units.append({'classes': list(class_ids), 'location': location})
+        ret[team_key] = units
+    return ret
+
+# Battle between the units of a normalized matchup
+def get_battle_matchup(logger, game_data, random, matchup):
+    units = []
+    for team, team_key, label_prefix in [(Team.BLUE, 'blue', 'P'), (Team.RED, 'red', 'E')]:
+        for i, unit_spec in enumerate(matchup[team_key]):
+            label = '{0}{1}'.format(label_prefix, i + 1)
+            character = Character(game_data, label, unit_spec['classes'])
+            units.append(Unit(logger, game_data, character, team, Location[unit_spec['location']], label))
+    return Battle(logger, units, random)
+
+# Ids of every Class levelled by the units of a normalized matchup
+def get_matchup_class_ids(matchup):
+    class_ids = set()
+    for team_key in ['blue', 'red']:
+        for unit_spec in matchup[team_key]:
+            class_ids.update(unit_spec['classes'])
+    return sorted(class_ids)
+
+# Create the battle of a scenario given by name or as a normalized matchup
+def create_scenario_battle(logger, game_data, random, scenario):
+    if isinstance(scenario, dict):
+        return get_battle_matchup(logger, game_data, random, scenario)
+    return SCENARIOS[scenario](logger, game_data, random)
+
+# Battles which can be created by name, i.e. from other processes or the command line
+SCENARIOS = {
+    'training_dummies': get_battle_training_dummies,
+    'fighters': get_battle_fighters,
+}
+
+# Scenarios the Learning Agent is trained on by default, in order
+DEFAULT_TRAINING_SCENARIOS = ['training_dummies', 'fighters']
@@ -0,0 +1,146 @@
+import logging
+import math
+import random
+import time
+import constants
+from battle import *
+from battle_action import *
+from battle_codec import *
+from battle_runner import *
+from game_data import *
+from player import *
+
+# Every action the unit could take this step as action dicts for create_battle_action.
+# Dice showing the same face give the same outcomes, so only the first of them is kept
+def get_legal_action_dicts(logger, game_data, battle, unit):
+    action_dicts = []
+    seen = set()
+    for die_index, die in enumerate(unit.die):
+        face = die.get_rolled_face()
+        if face is None:
+            continue
+        face_data = game_data.get_row(SheetId.Faces, face.face_id)
+        ability_data = game_data.get_row(SheetId.Abilities, face_data.ability_id)
+        if ability_data.target_type == TargetType.UNIT:
+            num_targets = len(battle.battlefield.units)
+        elif ability_data.target_type == TargetType.SIDE:
+            num_targets = constants.NUM_SIDE_TARGETS
+        elif ability_data.target_type == TargetType.AREA:
+            num_targets = constants.NUM_AREA_TARGETS
+        else:
+            num_targets = 1
+
+        candidates = [(BattleActionType.PRIMARY, target_index) for target_index in range(num_targets)]
+        candidates.append((BattleActionType.MOVE, 0))
+        for action_type, target_index in candidates:
+            key = (face.face_id, action_type, target_index)
+            if key in seen:
+                continue
+            action_dict = {'action_type': action_type, 'die_index': die_index, 'target_index': target_index}
+            if is_battle_action_valid(create_battle_action(logger, game_data, battle, unit, action_dict)):
+                seen.add(key)
+                action_dicts.append(action_dict)
+    action_dicts.append({'action_type': BattleActionType.END, 'die_index': 0, 'target_index': 0})
+    return action_dicts
+
+# Score of the battle for the team between 0 and 1. It's the difference between the fraction of health the team
+# and its enemies have left, so a win scores higher the less it cost and a loss the more damage it dealt
+def score_battle(battle, team):
+    health = {Team.BLUE: 0, Team.RED: 0}
+    max_health = {Team.BLUE: 0, Team.RED: 0}
+    for unit in battle.battlefield.units + battle.battlefield.dead_list:
+        health[unit.team] += max(unit.current_health, 0)
+        max_health[unit.team] += unit.character.max_health
+    enemy_team = Team.RED if team == Team.BLUE else Team.BLUE
+    team_fraction = health[team] / max_health[team] if max_health[team] > 0 else 0.0
+    enemy_fraction = health[enemy_team] / max_health[enemy_team] if max_health[enemy_team] > 0 else 0.0
+    return 0.5 + 0.5 * (team_fraction - enemy_fraction)
+
+"""
+NonPlayer which searches for its move within a time budget per decision.
+Every legal action is tried with rollouts of the rest of the battle played by NonPlayers on a copy of the battle,
+restored from the encoded battle before each rollout. Rollouts go to the actions picked by UCB1 and the action
+with the best average score is taken once the deadline passes. A rollout still running at the deadline is dropped,
+so a decision never takes much longer than its budget however many are being made at once, and strength only
+depends on the budget. With no finished rollout it falls back to the NonPlayer's choice.
+Callers answering to a deadline of their own, i.e. a server replying to a command, set deadline to cut every
+decision short at that time, so time spent waiting to be run is taken off the search instead of added to the reply.
+"""
+class SearchPlayer(NonPlayer):
+    def __init__(self, logger, game_data, battle_env, team, rng, budget=constants.SEARCH_DEFAULT_BUDGET,
+                 exploration=constants.SEARCH_EXPLORATION, rollout_turns=constants.SEARCH_ROLLOUT_TURNS):
+        NonPlayer.__init__(self, logger, game_data, battle_env, team, rng)
+        self.budget = budget
+        self.exploration = exploration
+        self.rollout_turns = rollout_turns
+        # perf_counter time no decision may go past, if any
+        self.deadline = None
+        # Rollouts draw from their own generator so searching doesn't change the rolls of the real battle
+        self.search_rng = random.Random(rng.random())
+        self.search_logger = logging.getLogger('search')
+        self.search_logger.setLevel(logging.WARNING)
+        self.search_battle = None
+        self.search_env = None
+        self.rollout_players = None
+        # Rollouts finished for the last decision
+        self.num_rollouts = 0
+
+    # Copy of the battle the rollouts are played on. Rebuilt if the battle was changed
+    def get_search_battle(self):
+        battle = self.battle_env.battle
+        if self.search_battle is None or self.search_battle.signature is not battle.signature:
+            self.search_battle = Battle(self.search_logger, battle.signature.units, self.search_rng)
+            self.search_battle.signature = battle.signature
+            self.search_env = BattleRunner(self.search_logger, self.search_battle)
+            self.rollout_players = {}
+            for team in [Team.BLUE, Team.RED]:
+                self.rollout_players[team] = NonPlayer(self.search_logger, self.game_data, self.search_env, team, self.search_rng)
+        return self.search_battle
+
+    # Play the action then the rest of the battle from the encoded battle.
+    # Returns the score of the rollout, or None if the deadline passed before it finished
+    def rollout(self, encoded_battle, action_dict, deadline):
+        battle = decode_battle_into(self.get_search_battle(), encoded_battle)
+        unit = battle.get_current_turn()
+        battle.step(create_battle_action(self.search_logger, self.game_data, battle, unit, action_dict))
+        last_turn = battle.turn + self.rollout_turns
+        while battle.state != BattleState.BATTLE_FINISHED and battle.turn < last_turn:
+            if time.perf_counter() >= deadline:
+                return None
+            action = None
+            if battle.state == BattleState.MAIN_PHASE:
+                action = self.rollout_players[battle.get_current_turn().team].select_action()
+            battle.step(action)
+        return score_battle(battle, self.team)
+
+    def on_select_action(self, unit):
+        deadline = time.perf_counter() + self.budget
+        if self.deadline is not None:
+            deadline = min(deadline, self.deadline)
+        battle = self.battle_env.battle
+        action_dicts = get_legal_action_dicts(self.logger, self.game_data, battle, unit)
+        self.num_rollouts = 0
+        if len(action_dicts) == 1:
+            return create_battle_action(self.logger, self.game_data, battle, unit, action_dicts[0])
+
+        encoded_battle = encode_battle(battle)
+        visits = [0] * len(action_dicts)
+        scores = [0.0] * len(action_dicts)
+        while time.perf_counter() < deadline:
+            if self.num_rollouts < len(action_dicts):
+                action_index = self.num_rollouts
+            else:
+                log_rollouts = math.log(self.num_rollouts)
+                action_index = max(range(len(action_dicts)), key=lambda i: scores[i] / visits[i] +
+                                   self.exploration * math.sqrt(log_rollouts / visits[i]))
+            score = self.rollout(encoded_battle, action_dicts[action_index], deadline)
+            if score is None:
+                break
+            visits[action_index] += 1
+            scores[action_index] += score
+            self.num_rollouts += 1
+
+        if self.num_rollouts <= 0:
+            return NonPlayer.on_select_action(self, unit)
+        best_index = max([i for i in range(len(action_dicts)) if visits[i] > 0], key=lambda i: scores[i] / visits[i])
+        return create_battle_action(self.logger, self.game_data, battle, unit, action_dicts[best_index])
@@ -0,0 +1,140 @@
+import logging
+import multiprocessing
+import random
+import constants
+from game_data import *
+from data_watcher import *
+from dice_streams import *
+from battle_runner import *
+from player import *
+from scenarios import *
+from telemetry import *
+
+"""
+Plays battles of a scenario without any learning. The scenario is a name in SCENARIOS or a normalized matchup.
+Blue is played by a NonPlayer, or by an InferenceAgent if exported Policy weights are given. Red is always a NonPlayer.
+Every episode reseeds the shared random generator from its own seed, so results only depend on
+the seed and not on which worker or in which order the episode was played.
+With common random numbers, dice and players draw from separate streams instead so that simulators of
+different rulesets play every seed with the same rolls, see dice_streams.py.
+If a Telemetry is given, every battle records into it.
+"""
+class Simulator:
+    def __init__(self, scenario, data_filename, weights_filename=None, watch=False, game_data_handle=None,
+                 common_random_numbers=False, telemetry=None):
+        self.logger = logging.getLogger('simulation')
+        self.logger.setLevel(logging.WARNING)
+        self.scenario = scenario
+        self.rng = random.Random()
+        self.dice_streams = DiceStreams() if common_random_numbers else None
+        self.telemetry = telemetry
+        self.player_rngs = {}
+        for team in [Team.BLUE, Team.RED]:
+            self.player_rngs[team] = random.Random() if common_random_numbers else self.rng
+        self.policy = None
+        if weights_filename is not None:
+            # numpy is only needed when playing with a trained policy
+            from numpy_policy import NumpyPolicy
+            self.policy = NumpyPolicy(weights_filename)
+        # Simulators in one process may share a handle to follow the same reloads
+        self.game_data_handle = game_data_handle
+        self.data_watcher = None
+        self.set_game_data(game_data_handle.get() if game_data_handle is not None else GameData(data_filename))
+
+        # Reload the data file when it changes. Episodes which already started finish with the previous ruleset
+        if watch and game_data_handle is None:
+            self.game_data_handle = GameDataHandle(self.game_data)
+            self.data_watcher = DataWatcher(self.game_data_handle)
+            self.data_watcher.start()
+
+    # Build the battle and players of the scenario with the Game Data
+    def set_game_data(self, game_data):
+        self.game_data = game_data
+        battle = create_scenario_battle(self.logger, game_data, self.rng, self.scenario)
+        battle.dice_streams = self.dice_streams
+        battle.telemetry = self.telemetry
+        self.classes_hash = game_data.get_classes_hash(battle.get_class_ids())
+        self.battle_env = BattleRunner(self.logger, battle)
+
+        self.players = {}
+        if self.policy is not None:
+            self.players[Team.BLUE] = InferenceAgent(self.logger, game_data, self.battle_env, Team.BLUE, self.policy,
+                                                     self.player_rngs[Team.BLUE])
+        else:
+            self.players[Team.BLUE] = NonPlayer(self.logger, game_data, self.battle_env, Team.BLUE, self.player_rngs[Team.BLUE])
+        self.players[Team.RED] = NonPlayer(self.logger, game_data, self.battle_env, Team.RED, self.player_rngs[Team.RED])
+
+    # Switch to a reloaded Game Data. The battle is only rebuilt if a row its Classes depend on changed
+    def change_game_data(self, game_data):
+        battle_class_ids = self.battle_env.battle.get_class_ids()
+        if game_data.get_classes_hash(battle_class_ids) != self.classes_hash:
+            self.set_game_data(game_data)
+        else:
+            self.game_data = game_data
+
+    # With common random numbers, antithetic plays the mirrored rolls of the seed, see AntitheticRandom
+    def run_episode(self, episode, seed, antithetic=False):
+        if self.game_data_handle is not None and self.game_data_handle.get() is not self.game_data:
+            self.change_game_data(self.game_data_handle.get())
+        self.rng.seed(seed)
+        if self.dice_streams is not None:
+            self.dice_streams.reset(seed, antithetic)
+            for team in self.player_rngs:
+                self.player_rngs[team].seed(get_player_seed(seed, team))
+        self.battle_env.reset()
+        for team in self.players:
+            self.players[team].reset_episode()
+
+        turns, winning_team = run_episode(self.battle_env, self.players)
+        result = {}
+        result['episode'] = episode
+        result['seed'] = seed
+        result['turns'] = turns
+        result['winner'] = winning_team.name
+        result['blue_steps'] = self.players[Team.BLUE].total_steps
+        result['red_steps'] = self.players[Team.RED].total_steps
+        result['invalid_actions'] = self.battle_env.battle.invalid_actions
+        result['outcome'] = self.battle_env.battle.outcome.name
+        result['blue_reward'] = calculate_episode_reward(self.battle_env.battle, Team.BLUE, result['blue_steps'])
+        result['ruleset'] = self.game_data.ruleset_hash
+        return result
+
+# Each worker process keeps its own Simulator between chunks
+worker_simulator = None
+
+def init_worker(scenario, data_filename, weights_filename, watch, use_telemetry):
+    global worker_simulator
+    telemetry = Telemetry() if use_telemetry else None
+    worker_simulator = Simulator(scenario, data_filename, weights_filename, watch, telemetry=telemetry)
+
+# Returns the results of the chunk and, with telemetry, the snapshot of what was recorded while playing it
+def run_worker_chunk(episodes):
+    results = [worker_simulator.run_episode(episode, seed) for episode, seed in episodes]
+    telemetry = worker_simulator.telemetry
+    if telemetry is None:
+        return results, None
+    snapshot = telemetry.get_snapshot()
+    telemetry.reset()
+    return results, snapshot
+
+# Play episodes start_i to end_i (exclusive) seeded from seed + episode index.
+# Results are yielded in episode order as soon as they are available.
+# If watch is true, every worker picks up changes to the data file between episodes.
+# If a Telemetry is given, the battles of every worker are recorded into it
+def run_simulation(scenario, data_filename, start_i, end_i, seed, num_workers=1, weights_filename=None,
+                   chunk_size=constants.SIMULATION_CHUNK_SIZE, watch=False, telemetry=None):
+    episodes = [(i, seed + i) for i in range(start_i, end_i)]
+    if num_workers <= 1:
+        simulator = Simulator(scenario, data_filename, weights_filename, watch, telemetry=telemetry)
+        for episode, episode_seed in episodes:
+            yield simulator.run_episode(episode, episode_seed)
+        return
+
+    chunks = [episodes[i:i + chunk_size] for i in range(0, len(episodes), chunk_size)]
+    initargs = (scenario, data_filename, weights_filename, watch, telemetry is not None)
+    with multiprocessing.Pool(num_workers, initializer=init_worker, initargs=initargs) as pool:
+        for results, snapshot in pool.imap(run_worker_chunk, chunks):
+            if snapshot is not None:
+                telemetry.merge_snapshot(snapshot)
+            for result in results:
+                yield result
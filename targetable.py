@@ -22,6 +22,8 @@ class Unit(Targetable):
     def __init__(self, logger, game_data, character, team, location, label):
         Targetable.__init__(self, logger, TargetType.UNIT, team, location, label)
         self.game_data = game_data
+        # Identifies the unit within its battle. Assigned by the Battlefield in the order units are given
+        self.uid = None
         # Character Data
         self.character = character
         # Tracked Unit Attributes
@@ -29,6 +31,8 @@ class Unit(Targetable):
         self.total_init = character.base_init
         # Determined at the start of battle to eliminate ties
         self.prec_init = 0
+        # Active Status by StatusType
+        self.statuses = {}
         # References to Instances of Die in play
         self.die = []
         for class_id in character.class_levels:
@@ -48,6 +52,27 @@ class Unit(Targetable):
     def is_dead(self):
         return self.current_health <= 0
 
+    # Initiative from the character and an active BUFF. The battle only applies it to total_init between rounds
+    def get_initiative(self):
+        buff = self.statuses.get(StatusType.BUFF)
+        return self.character.base_init + (buff.amount if buff is not None else 0)
+
+    # True if any face of the unit's die can lower a unit's health, see DieFace.can_reduce_health
+    def can_reduce_health(self):
+        for die in self.die:
+            for face in die.faces:
+                if face.can_reduce_health:
+                    return True
+        return False
+
+    # True if a face the unit's die rolled can lower a unit's health
+    def has_rolled_reduce_health(self):
+        for die in self.die:
+            face = die.get_rolled_face()
+            if face is not None and face.can_reduce_health:
+                return True
+        return False
+
     def get_percent_health(self):
         return self.current_health / self.character.max_health if self.character.max_health > 0 else 0.0
 
@@ -70,6 +95,19 @@ class Unit(Targetable):
         for effect in effects:
             effect.apply(self.logger, battlefield, source, self, x)
 
+# Units are kept in lists along with the position of each by uid, so removing one moves the last unit
+# into its place in constant time. The order of the remaining units changes with every removal
+def add_listed_unit(units, positions, unit):
+    positions[unit.uid] = len(units)
+    units.append(unit)
+
+def remove_listed_unit(units, positions, unit):
+    index = positions.pop(unit.uid)
+    last_unit = units.pop()
+    if last_unit is not unit:
+        units[index] = last_unit
+        positions[last_unit.uid] = index
+
 """
 Contains information about the particular area (front or back line)
 """
@@ -77,16 +115,18 @@ class Area(Targetable):
     def __init__(self, logger, team, location, label):
         Targetable.__init__(self, logger, TargetType.AREA, team, location, label)
         self.units = []
+        # Position of each unit in units by uid
+        self.unit_positions = {}
 
     def add_unit(self, unit):
-        self.units.append(unit)
+        add_listed_unit(self.units, self.unit_positions, unit)
 
     def remove_unit(self, unit):
-        self.units.remove(unit)
+        remove_listed_unit(self.units, self.unit_positions, unit)
 
     def apply_effects(self, battlefield, source, effects, x):
         for unit in self.units:
-            unit.apply_effects(self.logger, battlefield, source, effects, x)
+            unit.apply_effects(battlefield, source, effects, x)
 
 """
 Contains information about the entire section containing both front and the back line.
@@ -98,42 +138,72 @@ class Side(Targetable):
         self.front = Area(logger, team, Location.FRONT, label + '_front')
         self.back = Area(logger, team, Location.BACK, label + '_back')
         self.units = []
+        # Position of each unit in units by uid
+        self.unit_positions = {}
         self.dead_list = []
+        # Lines closest to and furthest from the enemy, updated whenever units are added or removed
+        self.frontmost_line = self.front
+        self.backmost_line = self.back
 
     def add_unit(self, unit):
-        self.units.append(unit)
+        add_listed_unit(self.units, self.unit_positions, unit)
+        self.add_to_line(unit)
+
+    def remove_unit(self, unit):
+        remove_listed_unit(self.units, self.unit_positions, unit)
+        self.remove_from_line(unit)
+
+    # Move the unit to the other line of the side
+    def move_unit(self, unit):
+        self.remove_from_line(unit)
+        if unit.location == Location.FRONT:
+            unit.location = Location.BACK
+        elif unit.location == Location.BACK:
+            unit.location = Location.FRONT
+        self.add_to_line(unit)
+
+    def add_to_line(self, unit):
         if unit.location == Location.FRONT:
             self.front.add_unit(unit)
         elif unit.location == Location.BACK:
             self.back.add_unit(unit)
         else:
             self.logger.warning('Adding unit to side but unknown location:{0}'.format(unit.location))
+        self.update_lines()
 
-    def remove_unit(self, unit):
-        self.units.remove(unit)
+    def remove_from_line(self, unit):
         if unit.location == Location.FRONT:
             self.front.remove_unit(unit)
         elif unit.location == Location.BACK:
             self.back.remove_unit(unit)
         else:
             self.logger.warning('Removing unit to side but unknown location:{0}'.format(unit.location))
+        self.update_lines()
+
+    # An empty line is skipped unless both lines are empty
+    def update_lines(self):
+        if len(self.front.units) > 0:
+            self.frontmost_line = self.front
+        elif len(self.back.units) > 0:
+            self.frontmost_line = self.back
+        else:
+            self.frontmost_line = self.front
+
+        if len(self.back.units) > 0:
+            self.backmost_line = self.back
+        elif len(self.front.units) > 0:
+            self.backmost_line = self.front
+        else:
+            self.backmost_line = self.back
 
     def add_to_dead_list(self, unit):
         self.dead_list.append(unit)
 
     def get_frontmost_line(self):
-        if len(self.front.units) > 0:
-            return self.front
-        elif len(self.back.units) > 0:
-            return self.back
-        return self.front
+        return self.frontmost_line
 
     def get_backmost_line(self):
-        if len(self.back.units) > 0:
-            return self.back
-        elif len(self.front.units) > 0:
-            return self.front
-        return self.back
+        return self.backmost_line
 
     def get_unit_count_in_line(self, location):
         if location == Location.FRONT:
@@ -144,7 +214,7 @@ class Side(Targetable):
 
     def apply_effects(self, battlefield, source, effects, x):
         for unit in self.units:
-            unit.apply_effects(self.logger, battlefield, source, effects, x)
+            unit.apply_effects(battlefield, source, effects, x)
 
 """
 Information of all enemies and allies in the environment
@@ -155,29 +225,52 @@ class Battlefield(Targetable):
         self.blue_side = Side(logger, Team.BLUE, label + '_blue')
         self.red_side = Side(logger, Team.RED, label + '_red')
         self.units = []
+        # Position of each living unit in units by uid
+        self.unit_positions = {}
         self.dead_list = []
-        for unit in units:
+        # Living units by their lower case label, each label holding a dict of its units by uid so duplicate labels
+        # resolve to the unit added first, and every unit including the dead by uid
+        self.units_by_label = {}
+        self.units_by_uid = {}
+        # Units brought down to 0 health which the battle has yet to clear
+        self.defeated_units = []
+        # Set whenever an effect changes the health of a unit. The battle clears it at the end of every round
+        self.health_changed = False
+        # Living units with an active status by uid. Only their turns tick statuses, so units without any cost nothing
+        self.status_units = {}
+        # Records what happens in the battle if set, see telemetry.py
+        self.telemetry = None
+        for uid, unit in enumerate(units):
+            unit.uid = uid
             self.add_unit(unit)
 
+    # Moving keeps the unit's place in units, so its target index doesn't change
     def move_unit(self, unit):
-        self.remove_unit(unit)
-        if unit.location == Location.FRONT:
-            unit.location = Location.BACK
-        elif unit.location == Location.BACK:
-            unit.location = Location.FRONT
-        self.add_unit(unit)
+        if unit.team == Team.BLUE:
+            self.blue_side.move_unit(unit)
+        elif unit.team == Team.RED:
+            self.red_side.move_unit(unit)
+        else:
+            self.logger.warning('Moving unit on battlefield but unknown team:{0}'.format(unit.team))
 
     def add_unit(self, unit):
-        self.units.append(unit)
+        add_listed_unit(self.units, self.unit_positions, unit)
+        self.units_by_label.setdefault(unit.label.lower(), {})[unit.uid] = unit
+        self.units_by_uid[unit.uid] = unit
         if unit.team == Team.BLUE:
             self.blue_side.add_unit(unit)
         elif unit.team == Team.RED:
             self.red_side.add_unit(unit)
         else:
             self.logger.warning('Adding unit to battlefield but unknown team:{0}'.format(unit.team))
+        self.on_health_changed(unit)
 
     def remove_unit(self, unit):
-        self.units.remove(unit)
+        remove_listed_unit(self.units, self.unit_positions, unit)
+        label_units = self.units_by_label[unit.label.lower()]
+        del label_units[unit.uid]
+        if len(label_units) == 0:
+            del self.units_by_label[unit.label.lower()]
         if unit.team == Team.BLUE:
             self.blue_side.remove_unit(unit)
         elif unit.team == Team.RED:
@@ -186,8 +279,12 @@ class Battlefield(Targetable):
             self.logger.warning('Removing unit from battlefield but unknown team:{0}'.format(unit.team))
 
     def add_to_dead_list(self, unit):
+        # Statuses end with the unit
+        unit.statuses = {}
+        self.status_units.pop(unit.uid, None)
         # Add to dead list
         self.dead_list.append(unit)
+        self.units_by_uid[unit.uid] = unit
         if unit.team == Team.BLUE:
             self.blue_side.add_to_dead_list(unit)
         elif unit.team == Team.RED:
@@ -195,16 +292,71 @@ class Battlefield(Targetable):
         else:
             self.logger.warning('Adding unit to dead list but unknown team:{0}'.format(unit.team))
 
+    # Change the health of a unit through an effect
+    def change_health(self, unit, amount):
+        unit.current_health += amount
+        self.health_changed = True
+        self.on_health_changed(unit)
+
+    # Put a status on the unit, stacking with the one it has as described by the StatusType.
+    # The source, if given, is credited with the damage of the whole stack
+    def apply_status(self, unit, status_type, amount, turns, source=None):
+        status = unit.statuses.get(status_type)
+        if status is None:
+            status = Status(status_type, 0, 0)
+            unit.statuses[status_type] = status
+        if source is not None:
+            status.source_uid = source.uid
+        if status_type == StatusType.POISON:
+            status.amount += amount
+        elif status_type == StatusType.BUFF:
+            status.amount = max(status.amount, amount)
+            status.turns = max(status.turns, turns)
+        self.status_units[unit.uid] = unit
+
+    # Tick the statuses of a unit in the schedule at the start or end of its turn, removing the ones which ran out
+    def tick_statuses(self, unit, tick):
+        for status_type in list(unit.statuses.keys()):
+            status = unit.statuses[status_type]
+            if status_type == StatusType.POISON and tick == StatusTick.START:
+                amount = min(status.amount, unit.current_health)
+                self.change_health(unit, -amount)
+                if self.telemetry is not None:
+                    self.telemetry.record_status_damage(self.units_by_uid.get(status.source_uid), unit, status_type, amount)
+                self.logger.info('{0} loses {1} health to POISON'.format(unit.label, amount))
+                status.amount -= 1
+                if status.amount <= 0:
+                    del unit.statuses[status_type]
+            elif status_type == StatusType.BUFF and tick == StatusTick.END:
+                status.turns -= 1
+                if status.turns <= 0:
+                    del unit.statuses[status_type]
+        if len(unit.statuses) == 0:
+            self.status_units.pop(unit.uid, None)
+
+    # Must be called whenever the health of a unit drops, so the battle can clear it without scanning every unit
+    def on_health_changed(self, unit):
+        if unit.current_health <= 0 and unit not in self.defeated_units:
+            self.defeated_units.append(unit)
+
+    # Returns the units defeated since the last call
+    def pop_defeated_units(self):
+        defeated_units = self.defeated_units
+        self.defeated_units = []
+        return defeated_units
+
     def get_unit(self, unit_index):
         if unit_index < 0 or unit_index >= len(self.units):
             return None
-        return self.units[self.unit_index]
+        return self.units[unit_index]
 
+    # Living unit with the label, ignoring case
     def get_unit_by_label(self, unit_label):
-        for unit in self.units:
-            if unit.label.lower() == unit_label.lower():
-                return unit
-        return None
+        label_units = self.units_by_label.get(unit_label.lower())
+        return next(iter(label_units.values())) if label_units is not None else None
+
+    def get_unit_by_uid(self, uid):
+        return self.units_by_uid.get(uid)
 
     def get_frontmost_line(self, team):
         if team == team.BLUE:
@@ -0,0 +1,218 @@
+import constants
+
+"""
+Count, mean and variance of a stream of values, updated one value at a time with Welford's method.
+Statistics of separate streams, i.e. of two workers, merge into the one of both streams
+"""
+class RunningStat:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared differences from the mean
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    # Add the data of another RunningStat, see get_data
+    def merge_data(self, data):
+        count, mean, m2 = data
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def get_variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def get_data(self):
+        return [self.count, self.mean, self.m2]
+
+"""
+Counts of values falling in bins of equal width starting at low.
+Values past either end are counted in the first or last bin
+"""
+class FixedHistogram:
+    def __init__(self, low, width, num_bins):
+        self.low = low
+        self.width = width
+        self.counts = [0] * num_bins
+
+    def add(self, value):
+        index = int((value - self.low) // self.width)
+        self.counts[min(max(index, 0), len(self.counts) - 1)] += 1
+
+    def merge_data(self, counts):
+        if len(counts) != len(self.counts):
+            raise ValueError('Unable to merge histograms of {0} and {1} bins'.format(len(self.counts), len(counts)))
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+
+    # (low, width, number of bins) to build an empty histogram of the same bins
+    def get_bins(self):
+        return (self.low, self.width, len(self.counts))
+
+    def get_data(self):
+        return list(self.counts)
+
+# Summary of a statistic and its histogram for the report
+def get_stat_report(stat, histogram):
+    ret = {}
+    ret['count'] = stat.count
+    ret['mean'] = stat.mean
+    ret['deviation'] = stat.get_variance() ** 0.5
+    ret['histogram'] = {'low': histogram.low, 'width': histogram.width, 'counts': histogram.get_data()}
+    return ret
+
+"""
+Streaming aggregates of what happens in battles, i.e. how often each Class uses each ability,
+the damage it deals and takes and when units die, so balance can be studied over millions of battles
+without keeping their logs.
+A battle only records into its telemetry if one is set, see Battle.telemetry. Every hook is skipped otherwise.
+Aggregates are keyed by tuples starting with their name and followed by the primary Class of the unit
+and/or the ability id. Damage of statuses, i.e. POISON ticks, counts towards the Class of the unit which applied them. Telemetry of separate workers merge through get_snapshot and merge_snapshot.
+"""
+class Telemetry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.stats = {}
+        self.histograms = {}
+        # Ability of the primary action whose effects are being applied, to attribute their damage
+        self.current_ability_id = None
+
+    def count(self, key, amount=1):
+        self.counts[key] = self.counts.get(key, 0) + amount
+
+    # Add a value to the statistic and histogram of the key. bins is (low, width, number of bins)
+    def observe(self, key, value, bins):
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = RunningStat()
+            self.stats[key] = stat
+            self.histograms[key] = FixedHistogram(*bins)
+        stat.add(value)
+        self.histograms[key].add(value)
+
+    # A battle starts with the units on the battlefield
+    def record_battle(self, battlefield):
+        self.count(('battles',))
+        for unit in battlefield.units:
+            self.count(('units', unit.character.primary_class_id))
+
+    # The unit is about to apply the effects of the ability
+    def record_ability(self, unit, ability_id):
+        self.count(('ability_uses', unit.character.primary_class_id, ability_id))
+        self.current_ability_id = ability_id
+
+    # The unit finished applying the effects of the ability
+    def end_ability(self):
+        self.current_ability_id = None
+
+    def record_move(self, unit):
+        self.count(('moves', unit.character.primary_class_id))
+
+    # Health the source took from the target with a damage effect, 0 if it was all prevented
+    def record_damage(self, source, target, amount):
+        self.observe(('damage_dealt', source.character.primary_class_id), amount, constants.TELEMETRY_DAMAGE_BINS)
+        self.observe(('damage_taken', target.character.primary_class_id), amount, constants.TELEMETRY_DAMAGE_BINS)
+        if self.current_ability_id is not None:
+            self.observe(('ability_damage', self.current_ability_id), amount, constants.TELEMETRY_DAMAGE_BINS)
+
+    # Health a status which the source applied took from the target, i.e. a POISON tick.
+    # The source is None if the status wasn't applied by a unit
+    def record_status_damage(self, source, target, status_type, amount):
+        if source is not None:
+            self.observe(('damage_dealt', source.character.primary_class_id), amount, constants.TELEMETRY_DAMAGE_BINS)
+        self.observe(('damage_taken', target.character.primary_class_id), amount, constants.TELEMETRY_DAMAGE_BINS)
+        self.observe(('status_damage', status_type.name), amount, constants.TELEMETRY_DAMAGE_BINS)
+
+    # The unit was cleared from the battle on the turn. is_first is true for the first unit to die in the battle
+    def record_death(self, unit, turn, is_first):
+        self.observe(('death_turn', unit.character.primary_class_id), turn, constants.TELEMETRY_TURN_BINS)
+        if is_first:
+            self.observe(('first_death_turn',), turn, constants.TELEMETRY_TURN_BINS)
+
+    # Plain data of every aggregate, which can be pickled to another process
+    def get_snapshot(self):
+        snapshot = {}
+        snapshot['counts'] = dict(self.counts)
+        snapshot['stats'] = {}
+        for key, stat in self.stats.items():
+            histogram = self.histograms[key]
+            snapshot['stats'][key] = (stat.get_data(), histogram.get_bins(), histogram.get_data())
+        return snapshot
+
+    # Add in the aggregates of another Telemetry, see get_snapshot. Histograms of a key must have the same bins
+    def merge_snapshot(self, snapshot):
+        for key, amount in snapshot['counts'].items():
+            self.count(key, amount)
+        for key, (stat_data, bins, histogram_data) in snapshot['stats'].items():
+            if key not in self.stats:
+                self.stats[key] = RunningStat()
+                self.histograms[key] = FixedHistogram(*bins)
+            self.stats[key].merge_data(stat_data)
+            self.histograms[key].merge_data(histogram_data)
+
+    def merge(self, other):
+        self.merge_snapshot(other.get_snapshot())
+
+    # Aggregates by Class and ability, with usage rates, which can be written as JSON
+    def get_report(self):
+        num_battles = self.counts.get(('battles',), 0)
+        classes = {}
+        abilities = {}
+        statuses = {}
+
+        def get_class(class_id):
+            if class_id not in classes:
+                classes[class_id] = {'units': self.counts.get(('units', class_id), 0), 'ability_uses': 0, 'abilities': {}}
+            return classes[class_id]
+
+        def get_ability(ability_id):
+            if ability_id not in abilities:
+                abilities[ability_id] = {'uses': 0}
+            return abilities[ability_id]
+
+        for key, amount in sorted(self.counts.items()):
+            if key[0] == 'ability_uses':
+                class_report = get_class(key[1])
+                class_report['abilities'][key[2]] = {'uses': amount}
+                class_report['ability_uses'] += amount
+                get_ability(key[2])['uses'] += amount
+            elif key[0] == 'moves':
+                get_class(key[1])['moves'] = amount
+        for key, stat in sorted(self.stats.items()):
+            stat_report = get_stat_report(stat, self.histograms[key])
+            if key[0] == 'ability_damage':
+                get_ability(key[1])['damage'] = stat_report
+            elif key[0] == 'status_damage':
+                statuses[key[1]] = {'damage': stat_report}
+            elif len(key) > 1:
+                get_class(key[1])[key[0]] = stat_report
+
+        # Rates are per unit of the Class in play, and each ability's share of the abilities used by the Class
+        for class_report in classes.values():
+            units = class_report['units']
+            class_report['moves_per_unit'] = class_report.get('moves', 0) / units if units > 0 else 0.0
+            for ability_report in class_report['abilities'].values():
+                ability_report['rate'] = ability_report['uses'] / class_report['ability_uses']
+                ability_report['uses_per_unit'] = ability_report['uses'] / units if units > 0 else 0.0
+
+        ret = {}
+        ret['battles'] = num_battles
+        ret['classes'] = classes
+        ret['abilities'] = abilities
+        ret['statuses'] = statuses
+        first_death_key = ('first_death_turn',)
+        if first_death_key in self.stats:
+            ret['first_death_turn'] = get_stat_report(self.stats[first_death_key], self.histograms[first_death_key])
+        return ret
@@ -0,0 +1,220 @@
+import copy
+import json
+import logging
+import os
+import random
+import tempfile
+import unittest
+import constants
+from game_data import *
+from battle import *
+from battle_action import *
+from scenarios import *
+from battle_codec import *
+
+# Play rounds where every unit ends its turn at once, calling before_turn(battle, unit) ahead of each turn.
+# Returns the (round, label) of every turn played
+def play_rounds(battle, num_rounds, before_turn=None):
+    turns = []
+    battle.step(None)
+    while battle.round < num_rounds and battle.state != BattleState.BATTLE_FINISHED:
+        if battle.state == BattleState.START_PHASE and before_turn is not None:
+            before_turn(battle, battle.get_current_turn())
+        if battle.state == BattleState.MAIN_PHASE:
+            unit = battle.get_current_turn()
+            turns.append((battle.round, unit.label))
+            battle.step(BattleActionEnd(battle.logger, unit.game_data, battle.battlefield, unit))
+        else:
+            battle.step(None)
+    return turns
+
+class TestTurnOrder(unittest.TestCase):
+    def setUp(self):
+        logger = logging.getLogger('test')
+        logger.setLevel(logging.WARNING)
+        self.battle = create_scenario_battle(logger, GameData('data.json'), random.Random(1), 'fighters')
+
+    def assert_every_unit_acts_once_per_round(self, turns, num_rounds):
+        labels = sorted([unit.label for unit in self.battle.battlefield.units])
+        for battle_round in range(num_rounds):
+            self.assertEqual(sorted([label for turn_round, label in turns if turn_round == battle_round]), labels)
+
+    def test_buff_before_first_round(self):
+        for buff_turns in [1, 2]:
+            self.setUp()
+            def before_turn(battle, unit):
+                if battle.turn == 0:
+                    p1 = battle.battlefield.get_unit_by_label('p1')
+                    battle.battlefield.apply_status(p1, StatusType.BUFF, 10, buff_turns)
+            turns = play_rounds(self.battle, 3, before_turn)
+            self.assert_every_unit_acts_once_per_round(turns, 3)
+            # The buff only raises initiative from the next round, if it hasn't run out at the end of P1's first turn
+            round_0 = [label for turn_round, label in turns if turn_round == 0]
+            round_1 = [label for turn_round, label in turns if turn_round == 1]
+            self.assertEqual(round_0[0], 'P1')
+            self.assertEqual(round_1[-1] == 'P1', buff_turns == 2)
+
+    def test_buff_of_each_unit_mid_round(self):
+        for target_turn in range(4):
+            self.setUp()
+            def before_turn(battle, unit):
+                if battle.turn == target_turn:
+                    for other in battle.battlefield.units:
+                        if other is not unit:
+                            battle.battlefield.apply_status(other, StatusType.BUFF, 5 + other.uid, 1)
+            turns = play_rounds(self.battle, 4, before_turn)
+            self.assert_every_unit_acts_once_per_round(turns, 4)
+
+    def test_clear_units_mid_round(self):
+        def before_turn(battle, unit):
+            # P2 defeats the unit due after it, and the unit due after P1 is cleared by poison before its turn
+            if battle.round == 0 and unit.label == 'P2':
+                e1 = battle.battlefield.get_unit_by_label('e1')
+                battle.battlefield.change_health(e1, -e1.current_health)
+            if battle.round == 1 and unit.label == 'P1':
+                p2 = battle.battlefield.get_unit_by_label('p2')
+                battle.battlefield.apply_status(p2, StatusType.POISON, p2.current_health, 1)
+        turns = play_rounds(self.battle, 3, before_turn)
+        self.assertEqual(turns, [(0, 'P1'), (0, 'P2'), (0, 'E2'), (1, 'P1'), (1, 'E2'), (2, 'P1'), (2, 'E2')])
+        self.assertEqual(self.battle.turn_order, [self.battle.battlefield.get_unit_by_label(label) for label in ['p1', 'e2']])
+
+    def test_decode_after_clear(self):
+        self.battle.step(None)
+        self.battle.step(None)
+        self.battle.step(None)
+        e1 = self.battle.battlefield.get_unit_by_label('e1')
+        self.battle.battlefield.change_health(e1, -e1.current_health)
+        self.battle.step(BattleActionEnd(self.battle.logger, e1.game_data, self.battle.battlefield, self.battle.get_current_turn()))
+        self.battle.step(None)
+        self.assertEqual(self.battle.get_current_turn().label, 'P2')
+        decoded = decode_battle_into(copy.deepcopy(self.battle), encode_battle(self.battle))
+        self.assertEqual([unit.label for unit in decoded.turn_order], ['P1', 'P2', 'E2'])
+        self.assertEqual(decoded.get_current_turn().label, 'P2')
+
+# Rolls the same face of every die
+class FixedRandom(random.Random):
+    def __init__(self, face_index):
+        random.Random.__init__(self, 0)
+        self.face_index = face_index
+
+    def randint(self, a, b):
+        return self.face_index
+
+class TestOutcomes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Sparrers can strike with their last face only
+        with open('data.json') as f:
+            raw = json.load(f)
+        sparrer = dict(raw['Classes']['fighter'], uid='sparrer', index=len(raw['Classes']) + 1, name='Sparrer')
+        for i in range(1, constants.NUM_DIE_FACES):
+            sparrer['face_{0}'.format(i)] = 'waddle_1'
+        raw['Classes']['sparrer'] = sparrer
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'data.json')
+            with open(filename, 'w') as f:
+                json.dump(raw, f)
+            cls.game_data = GameData(filename)
+
+    def setUp(self):
+        self.logger = logging.getLogger('test')
+        self.logger.setLevel(logging.ERROR)
+
+    # Battle of one unit of the given classes per side, or of the lists of units given
+    def create_battle(self, blue, red, rng):
+        matchup = {'blue': blue if isinstance(blue[0], list) else [blue], 'red': red if isinstance(red[0], list) else [red]}
+        matchup = normalize_matchup(matchup, self.game_data)
+        return get_battle_matchup(self.logger, self.game_data, rng, matchup)
+
+    # Play until the battle finishes, ending every turn at once unless act(battle, unit) returns an action
+    def play(self, battle, act=None):
+        while not battle.step(None if battle.state != BattleState.MAIN_PHASE else self.get_action(battle, act)):
+            pass
+        return battle.outcome
+
+    def get_action(self, battle, act):
+        unit = battle.get_current_turn()
+        action = act(battle, unit) if act is not None else None
+        return action if action is not None else BattleActionEnd(self.logger, self.game_data, battle.battlefield, unit)
+
+    def test_no_damage(self):
+        battle = self.create_battle(['training_dummy'], ['training_dummy'], random.Random(1))
+        self.assertEqual(self.play(battle), BattleOutcome.NO_DAMAGE)
+        self.assertEqual(battle.turn, 0)
+
+    def test_no_damage_once_damage_dealers_are_cleared(self):
+        battle = self.create_battle([['fighter'], ['training_dummy']], [['training_dummy']], random.Random(1))
+        def act(battle, unit):
+            # The dummies have the lower initiative, so the fighter is defeated before its first turn
+            fighter = battle.battlefield.get_unit_by_label('p1')
+            battle.battlefield.change_health(fighter, -fighter.current_health)
+            return None
+        self.assertEqual(self.play(battle, act), BattleOutcome.NO_DAMAGE)
+        self.assertEqual(battle.turn, 0)
+        self.assertEqual([unit.label for unit in battle.battlefield.dead_list], ['P1'])
+
+    def test_stalemate(self):
+        battle = self.create_battle(['sparrer'], ['sparrer'], FixedRandom(0))
+        self.assertEqual(self.play(battle), BattleOutcome.STALEMATE)
+        self.assertEqual(battle.round, constants.STALEMATE_ROUNDS)
+
+    def test_rolled_damage_is_not_stale(self):
+        # Every turn rolls a strike which is never used, so no health changes but the battle isn't stale
+        battle = self.create_battle(['sparrer'], ['sparrer'], FixedRandom(constants.NUM_DIE_FACES - 1))
+        self.assertEqual(self.play(battle), BattleOutcome.TURN_LIMIT)
+        self.assertEqual(battle.stale_rounds, 0)
+        self.assertTrue(all([unit.current_health == unit.character.max_health for unit in battle.battlefield.units]))
+
+    def test_invalid_action_streak(self):
+        battle = self.create_battle(['fighter'], ['fighter'], random.Random(1))
+        battle.step(None)
+        while not battle.step(None):
+            self.assertNotEqual(battle.state, BattleState.END_PHASE)
+        self.assertEqual(battle.outcome, BattleOutcome.INVALID_ACTION_STREAK)
+        self.assertEqual(battle.invalid_streak, constants.INVALID_ACTION_STREAK_LIMIT)
+
+class TestBattlefield(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test')
+        self.game_data = GameData('data.json')
+
+    def create_units(self, labels, team):
+        return [Unit(self.logger, self.game_data, Character(self.game_data, label, ['fighter']), team, Location.FRONT, label) for label in labels]
+
+    def assert_positions(self, container):
+        self.assertEqual(container.unit_positions, {unit.uid: i for i, unit in enumerate(container.units)})
+
+    def test_duplicate_labels_resolve_to_first(self):
+        units = self.create_units(['Twin'], Team.BLUE) + self.create_units(['Twin'], Team.RED)
+        battlefield = Battlefield(self.logger, units, 'battlefield')
+        self.assertIs(battlefield.get_unit_by_label('twin'), units[0])
+        battlefield.remove_unit(units[0])
+        self.assertIs(battlefield.get_unit_by_label('twin'), units[1])
+        battlefield.remove_unit(units[1])
+        self.assertIsNone(battlefield.get_unit_by_label('twin'))
+
+    def test_remove_and_move_units(self):
+        units = self.create_units(['P1', 'P2', 'P3', 'P4'], Team.BLUE) + self.create_units(['E1'], Team.RED)
+        battlefield = Battlefield(self.logger, units, 'battlefield')
+        side = battlefield.blue_side
+        # The last unit takes the place of a removed one
+        battlefield.remove_unit(units[1])
+        self.assertEqual([unit.label for unit in battlefield.units], ['P1', 'E1', 'P3', 'P4'])
+        self.assertEqual([unit.label for unit in side.units], ['P1', 'P4', 'P3'])
+        # Moving keeps the place of the unit in the battlefield and side
+        battlefield.move_unit(units[0])
+        self.assertIs(battlefield.units[0], units[0])
+        self.assertIs(side.units[0], units[0])
+        self.assertEqual([unit.label for unit in side.front.units], ['P3', 'P4'])
+        self.assertEqual([unit.label for unit in side.back.units], ['P1'])
+        self.assertIs(side.get_frontmost_line(), side.front)
+        for container in [battlefield, side, side.front, side.back]:
+            self.assert_positions(container)
+        battlefield.remove_unit(units[3])
+        battlefield.remove_unit(units[2])
+        self.assertIs(side.get_frontmost_line(), side.back)
+        for container in [battlefield, side, side.front, side.back]:
+            self.assert_positions(container)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import logging
+import random
+import struct
+import unittest
+from game_data import *
+from battle import *
+from battle_action import *
+from battle_codec import *
+from scenarios import *
+
+class TestBattleCodec(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test')
+        self.logger.setLevel(logging.WARNING)
+        self.game_data = GameData('data.json')
+        self.battle = self.create_battle()
+
+    def create_battle(self):
+        return create_scenario_battle(self.logger, self.game_data, random.Random(1), 'fighters')
+
+    # Step the battle until the given turn is in its main phase, ending every turn at once
+    def play_until_turn(self, turn):
+        self.battle.step(None)
+        while self.battle.turn < turn or self.battle.state != BattleState.MAIN_PHASE:
+            if self.battle.state == BattleState.MAIN_PHASE:
+                unit = self.battle.get_current_turn()
+                self.battle.step(BattleActionEnd(self.logger, self.game_data, self.battle.battlefield, unit))
+            else:
+                self.battle.step(None)
+
+    # Mid-round battle with a dead unit, damaged units and both kinds of status
+    def play_mid_round(self):
+        battlefield = self.battle.battlefield
+        self.play_until_turn(1)
+        p1 = battlefield.get_unit_by_label('p1')
+        e1 = battlefield.get_unit_by_label('e1')
+        e2 = battlefield.get_unit_by_label('e2')
+        battlefield.apply_status(e2, StatusType.POISON, 3, 0, p1)
+        battlefield.apply_status(p1, StatusType.BUFF, 2, 2)
+        battlefield.change_health(e1, -e1.current_health)
+        battlefield.change_health(p1, -1)
+        self.play_until_turn(2)
+
+    def test_round_trip_mid_round(self):
+        self.play_mid_round()
+        buf = encode_battle(self.battle)
+        decoded = decode_battle_into(self.create_battle(), buf)
+        self.assertEqual(encode_battle(decoded), buf)
+
+        self.assertEqual(decoded.state, BattleState.MAIN_PHASE)
+        self.assertEqual(decoded.turn, self.battle.turn)
+        self.assertEqual(decoded.get_current_turn().uid, self.battle.get_current_turn().uid)
+        self.assertEqual([unit.uid for unit in decoded.battlefield.units], [unit.uid for unit in self.battle.battlefield.units])
+        self.assertEqual([unit.label for unit in decoded.battlefield.dead_list], ['E1'])
+        for unit in self.battle.battlefield.units:
+            decoded_unit = decoded.battlefield.get_unit_by_uid(unit.uid)
+            self.assertEqual(decoded_unit.current_health, unit.current_health)
+            self.assertEqual([die.roll for die in decoded_unit.die], [die.roll for die in unit.die])
+            self.assertEqual(sorted(decoded_unit.statuses.keys(), key=lambda status_type: status_type.value),
+                             sorted(unit.statuses.keys(), key=lambda status_type: status_type.value))
+        # E2's turn started, so its poison already ticked once
+        self.assertEqual(self.battle.get_current_turn().label, 'E2')
+        poison = decoded.battlefield.get_unit_by_label('e2').statuses[StatusType.POISON]
+        self.assertEqual((poison.amount, poison.source_uid), (2, decoded.battlefield.get_unit_by_label('p1').uid))
+
+    def test_round_trip_keeps_playing_the_same(self):
+        self.play_mid_round()
+        decoded = decode_battle_into(self.create_battle(), encode_battle(self.battle))
+        for battle in [self.battle, decoded]:
+            battle.rng = random.Random(2)
+            while battle.state != BattleState.BATTLE_FINISHED and battle.round < 4:
+                if battle.state == BattleState.MAIN_PHASE:
+                    battle.step(BattleActionEnd(self.logger, self.game_data, battle.battlefield, battle.get_current_turn()))
+                else:
+                    battle.step(None)
+        self.assertEqual(encode_battle(decoded), encode_battle(self.battle))
+
+    def test_rejects_bad_header(self):
+        buf = encode_battle(self.battle)
+        with self.assertRaisesRegex(ValueError, 'too short'):
+            decode_battle_into(self.create_battle(), buf[:BATTLE_HEADER.size - 1])
+        with self.assertRaisesRegex(ValueError, 'Not an encoded battle'):
+            decode_battle_into(self.create_battle(), b'XXXX' + buf[4:])
+        bad_version = bytearray(buf)
+        struct.pack_into('<H', bad_version, 4, BATTLE_CODEC_VERSION + 1)
+        with self.assertRaisesRegex(ValueError, 'version'):
+            decode_battle_into(self.create_battle(), bytes(bad_version))
+        with self.assertRaisesRegex(ValueError, 'version'):
+            decode_battle_arrays(bytes(bad_version))
+
+    def test_rejects_other_battle(self):
+        buf = encode_battle(self.battle)
+        matchup = normalize_matchup({'blue': [['fighter']], 'red': [['fighter']]}, self.game_data)
+        with self.assertRaisesRegex(ValueError, 'units'):
+            decode_battle_into(get_battle_matchup(self.logger, self.game_data, random.Random(1), matchup), buf)
+
+    def test_arrays_match_records(self):
+        self.play_mid_round()
+        buf = encode_battle(self.battle)
+        header, units, rolls, statuses = decode_battle_arrays(buf)
+
+        (magic, version, state, flags, battle_round, turn, turn_index, invalid_actions, invalid_streak, stale_rounds, outcome,
+         num_units) = BATTLE_HEADER.unpack_from(buf, 0)
+        self.assertEqual(header, {
+            'state': state,
+            'flags': flags,
+            'round': battle_round,
+            'turn': turn,
+            'turn_index': turn_index,
+            'invalid_actions': invalid_actions,
+            'invalid_streak': invalid_streak,
+            'stale_rounds': stale_rounds,
+            'outcome': outcome,
+            'num_units': num_units,
+        })
+
+        self.assertEqual(len(units), num_units)
+        offset = BATTLE_HEADER.size
+        for i in range(num_units):
+            record = UNIT_RECORD.unpack_from(buf, offset)
+            offset += UNIT_RECORD.size
+            self.assertEqual(tuple(units[i].tolist()), record)
+
+        num_die = sum([record[3] for record in UNIT_RECORD.iter_unpack(buf[BATTLE_HEADER.size:offset])])
+        self.assertEqual(rolls.tolist(), list(struct.unpack_from('<{0}b'.format(num_die), buf, offset)))
+        offset += num_die
+
+        num_statuses, = STATUS_COUNT.unpack_from(buf, offset)
+        offset += STATUS_COUNT.size
+        self.assertEqual(num_statuses, 2)
+        self.assertEqual(len(statuses), num_statuses)
+        for i in range(num_statuses):
+            self.assertEqual(tuple(statuses[i].tolist()), STATUS_RECORD.unpack_from(buf, offset))
+            offset += STATUS_RECORD.size
+        self.assertEqual(offset, len(buf))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+from cluster import *
+
+class TestClusterJob(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        init_service_worker('data.json', False)
+        cls.ruleset_hash = GameData('data.json').ruleset_hash
+        cls.chunks = {}
+
+    # With seed 0, the second chunk of fighters is the only one where red wins first
+    def create_job(self, episodes=12, seed=0):
+        return ClusterJob([(0, 'fighters'), (1, 'training_dummies')], episodes, seed, chunk_episodes=4)
+
+    # Play the chunk as a worker would and answer with its result as it comes over the wire
+    def play_chunk(self, job, chunk_id):
+        message = job.get_message(chunk_id)
+        key = (chunk_id, message['seed'])
+        if key not in self.chunks:
+            matchup_key = json.dumps(message['matchup'], sort_keys=True)
+            self.chunks[key] = json.dumps(run_matchup_chunk(matchup_key, message['matchup'], message['start'], message['end'], message['seed']))
+        return job.complete(chunk_id, json.loads(self.chunks[key]))
+
+    # Lease and finish the chunks in the order of the chunk ids given. Returns the summary line of each finished matchup
+    def play_chunks(self, job, chunk_ids):
+        lines = {}
+        for chunk_id in chunk_ids:
+            position = self.play_chunk(job, chunk_id)
+            if position is not None:
+                lines[position] = json.dumps(job.get_matchup_summary(position))
+        return lines
+
+    def test_resumed_job_matches_uninterrupted(self):
+        job = self.create_job()
+        expected = self.play_chunks(job, range(len(job.chunks)))
+        self.assertTrue(job.is_finished())
+        self.assertEqual(sorted(expected.keys()), [0, 1])
+
+        # Finish chunks out of order, with one played twice, then restart from the state file
+        job = self.create_job()
+        lines = self.play_chunks(job, [1, 3, 0, 1])
+        self.assertEqual(job.num_duplicates, 1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'job.state')
+            write_job_state(filename, job.get_state(self.ruleset_hash))
+            state = load_job_state(filename)
+
+        job = self.create_job()
+        finished_positions = job.restore_state(state, self.ruleset_hash)
+        self.assertEqual(job.num_done, 3)
+        for position in finished_positions:
+            lines[position] = json.dumps(job.get_matchup_summary(position))
+        lines.update(self.play_chunks(job, [5, 2, 4]))
+        self.assertTrue(job.is_finished())
+        self.assertEqual(lines, expected)
+
+    def test_restore_rejects_other_job(self):
+        job = self.create_job()
+        self.play_chunks(job, [0])
+        state = job.get_state(self.ruleset_hash)
+        with self.assertRaisesRegex(ValueError, 'different job'):
+            self.create_job().restore_state(state, 'other ruleset')
+        with self.assertRaisesRegex(ValueError, 'different job'):
+            self.create_job(seed=1).restore_state(state, self.ruleset_hash)
+        with self.assertRaisesRegex(ValueError, 'different job'):
+            self.create_job(episodes=16).restore_state(state, self.ruleset_hash)
+        state['version'] = CLUSTER_STATE_VERSION + 1
+        with self.assertRaisesRegex(ValueError, 'version'):
+            self.create_job().restore_state(state, self.ruleset_hash)
+
+if __name__ == '__main__':
+    unittest.main()